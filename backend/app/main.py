@@ -1,12 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import functools
+import json
 import logging
+import os
+import secrets
+import threading
+import time
 
-from app.services.search_engine import SemanticSearchEngine
+from app.services.cache import LRUCache, normalize_query
+from app.services.inference_pool import InferenceClient, InferenceUnavailable
 from app.services.metrics import MetricsCollector
 from app.services.rag_service import RAGService
+from app.utils.config import load_config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,6 +38,22 @@ app.add_middleware(
 search_engine = None
 metrics_collector = MetricsCollector()
 rag_service = None
+result_cache = LRUCache(0)  # Configuré au démarrage (section `cache` de config.yaml)
+# Pool dédié au travail CPU du moteur : la boucle asyncio reste libre (/health, /metrics)
+engine_executor = None  # Créé au démarrage (api.engine_workers)
+index_updater = None  # Créé à la première mise à jour (endpoints /admin)
+DISCONNECT_POLL_INTERVAL = 0.1  # secondes entre deux vérifications de déconnexion du client
+
+class DocIdRange(BaseModel):
+    start: Optional[int] = None  # Bornes incluses, None = ouverte
+    end: Optional[int] = None
+
+class SearchFilters(BaseModel):
+    sources: Optional[List[str]] = None  # Sources autorisées (OU)
+    exclude_sources: Optional[List[str]] = None
+    focus_areas: Optional[List[str]] = None  # Domaines autorisés (OU)
+    exclude_focus_areas: Optional[List[str]] = None
+    doc_id_ranges: Optional[List[DocIdRange]] = None  # Plages de doc_id (OU)
 
 class QueryRequest(BaseModel):
     query: str
@@ -35,12 +61,17 @@ class QueryRequest(BaseModel):
     use_reranking: bool = True
     hybrid: bool = False
     use_rag: bool = False  # Nouveau paramètre pour activer RAG
+    nprobe: Optional[int] = Field(None, ge=1)  # Surcharge nprobe (index IVF)
+    ef_search: Optional[int] = Field(None, ge=1)  # Surcharge efSearch (index HNSW)
+    rerank_budget_ms: Optional[float] = Field(None, gt=0)  # Budget de latence du reranking
+    filters: Optional[SearchFilters] = None  # Filtres sur les métadonnées (combinés en ET)
 
 class SearchResult(BaseModel):
     doc_id: str
     text: str
     score: float
     rank: int
+    passage: Optional[str] = None  # Meilleur passage du document (index de passages)
 
 class QueryResponse(BaseModel):
     query: str
@@ -49,15 +80,142 @@ class QueryResponse(BaseModel):
     total_docs: int
     rag_response: Optional[str] = None  # Réponse générée par RAG
     rag_summary: Optional[str] = None  # Résumé des documents
+    cached: bool = False  # Réponse servie depuis le cache de résultats
+    pairs_scored: int = 0  # Paires (requête, document) évaluées par le cross-encoder
+    reranked: bool = False  # False si le cross-encoder n'était pas encore chargé
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=1000)
+    top_k: int = 10
+    use_reranking: bool = True
+    hybrid: bool = False
+    nprobe: Optional[int] = Field(None, ge=1)
+    ef_search: Optional[int] = Field(None, ge=1)
+    rerank_budget_ms: Optional[float] = Field(None, gt=0)
+    filters: Optional[SearchFilters] = None
+
+class AdminDocument(BaseModel):
+    doc_id: str = Field(..., min_length=1)
+    text: str = Field(..., min_length=1)
+    source: Optional[str] = None
+    focus_area: Optional[str] = None
+
+class UpsertDocumentsRequest(BaseModel):
+    documents: List[AdminDocument] = Field(..., min_length=1, max_length=10000)
+
+class DeleteDocumentsRequest(BaseModel):
+    doc_ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+class BatchQueryResult(BaseModel):
+    query: str
+    results: List[SearchResult]
+    total_docs: int
+    pairs_scored: int = 0
+    reranked: bool = False
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    latency: float
+    timings: Dict[str, float]  # Durée de chaque étape (encode, search, fetch, rerank)
+
+def to_search_results(results: List[dict]) -> List[SearchResult]:
+    return [
+        SearchResult(
+            doc_id=r["doc_id"],
+            text=r["text"],
+            score=r["score"],
+            rank=i+1,
+            passage=r.get("passage")
+        )
+        for i, r in enumerate(results)
+    ]
+
+def engine_filters(filters: Optional[SearchFilters]) -> Optional[dict]:
+    """Filtres au format du moteur (voir app.services.filters.filter_key)"""
+    if filters is None:
+        return None
+    return {
+        "include": {"source": filters.sources, "focus_area": filters.focus_areas},
+        "exclude": {"source": filters.exclude_sources, "focus_area": filters.exclude_focus_areas},
+        "doc_id_ranges": [(r.start, r.end) for r in filters.doc_id_ranges or []]
+    }
+
+def result_cache_key(request: QueryRequest, index_version: Optional[str]) -> tuple:
+    # La version de l'index fait partie de la clé : une reconstruction invalide le cache
+    return (
+        index_version,
+        normalize_query(request.query),
+        request.top_k,
+        request.use_reranking,
+        request.hybrid,
+        request.use_rag,
+        request.nprobe,
+        request.ef_search,
+        request.rerank_budget_ms,
+        request.filters.model_dump_json() if request.filters else None
+    )
+
+def engine_ready() -> bool:
+    return search_engine is not None and search_engine.ready_for_search()
+
+async def current_index_version() -> Optional[str]:
+    """Version de l'index servie ; avec le pool d'inférence, ping des workers
+    hors de la boucle asyncio"""
+    if isinstance(search_engine, InferenceClient):
+        return await asyncio.to_thread(lambda: search_engine.index_version)
+    return search_engine.index_version
+
+async def run_in_engine(fn, *args, **kwargs):
+    """Exécute un appel bloquant du moteur dans le pool dédié"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(engine_executor, functools.partial(fn, *args, **kwargs))
+
+async def until_disconnected(http_request: Request, awaitable, cancel_event: Optional[threading.Event] = None):
+    """Attend le résultat ; si le client se déconnecte avant, annule le travail (499)"""
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            # Une tâche encore en file n'est jamais exécutée, une recherche en cours
+            # s'arrête à la prochaine étape (cancel_event)
+            task.cancel()
+            if cancel_event is not None:
+                cancel_event.set()
+            raise HTTPException(status_code=499, detail="Client disconnected")
 
 @app.on_event("startup")
 async def startup_event():
-    global search_engine, rag_service
-    logger.info("Loading search engine...")
+    global search_engine, rag_service, result_cache, engine_executor
     try:
-        search_engine = SemanticSearchEngine()
-        search_engine.load()
-        logger.info("Search engine loaded successfully")
+        config = load_config()
+        if config.get('inference', {}).get('enabled', False):
+            # Modèles et index dans le pool d'inférence (scripts/run_inference_pool.py)
+            search_engine = InferenceClient.from_config(config)
+            logger.info(f"Using inference pool ({len(search_engine.channels)} workers)")
+        else:
+            # Chargement en arrière-plan : /health suit la progression, la recherche
+            # dense est servie dès que l'encodeur, l'index et les documents sont prêts
+            logger.info("Loading search engine...")
+            # Import au démarrage seulement : FAISS / torch restent hors du chemin d'import
+            from app.services.search_engine import SemanticSearchEngine
+            
+            search_engine = SemanticSearchEngine()
+            search_engine.start_loading()
+            if search_engine.snapshot_config.get('watch', True):
+                # Nouveaux snapshots (build_index.py, update_index.py) chargés sans redémarrage
+                search_engine.watch_snapshots()
+        
+        cache_config = search_engine.config.get('cache', {})
+        result_cache = LRUCache(
+            cache_config.get('result_size', 1024),
+            ttl=cache_config.get('result_ttl_seconds', 300)
+        )
+        engine_executor = ThreadPoolExecutor(
+            max_workers=search_engine.config.get('api', {}).get('engine_workers', 4),
+            thread_name_prefix="engine"
+        )
     except Exception as e:
         logger.error(f"Failed to load search engine: {e}")
     
@@ -71,6 +229,16 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to initialize RAG service: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if engine_executor is not None:
+        engine_executor.shutdown(wait=False, cancel_futures=True)
+    if search_engine is not None and not isinstance(search_engine, InferenceClient):
+        search_engine.stop_watching()
+    if index_updater is not None:
+        # Mises à jour pas encore publiées (snapshots.publish_delay_s)
+        await asyncio.to_thread(index_updater.flush)
+
 @app.get("/")
 async def root():
     return {
@@ -80,86 +248,239 @@ async def root():
     }
 
 @app.post("/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
-    if search_engine is None:
+async def query_documents(request: QueryRequest, http_request: Request):
+    if not engine_ready():
         raise HTTPException(status_code=503, detail="Search engine not ready")
     
+    # Réponse déjà sérialisée en cache : ni recherche ni validation pydantic
+    start_time = time.time()
+    cache_key = result_cache_key(request, await current_index_version())
+    cached_response = result_cache.get(cache_key)
+    if cached_response is not None:
+        metrics_collector.add_query(request.query, time.time() - start_time)
+        # Partagée par les variantes de casse / d'espaces : chacun retrouve sa requête
+        content = b'{"query":' + json.dumps(request.query).encode() + b',' + cached_response[1:]
+        return Response(content=content, media_type="application/json")
+    
     try:
-        results, latency = search_engine.search(
-            query=request.query,
-            top_k=request.top_k,
-            use_reranking=request.use_reranking,
-            hybrid=request.hybrid
+        search_stats = {}
+        cancel_event = threading.Event()
+        results, latency = await until_disconnected(
+            http_request,
+            run_in_engine(
+                search_engine.search,
+                query=request.query,
+                top_k=request.top_k,
+                use_reranking=request.use_reranking,
+                hybrid=request.hybrid,
+                nprobe=request.nprobe,
+                ef_search=request.ef_search,
+                rerank_budget_ms=request.rerank_budget_ms,
+                stats=search_stats,
+                cancel_event=cancel_event,
+                filters=engine_filters(request.filters)
+            ),
+            cancel_event
         )
         
         metrics_collector.add_query(request.query, latency)
         
-        search_results = [
-            SearchResult(
-                doc_id=r["doc_id"],
-                text=r["text"],
-                score=r["score"],
-                rank=i+1
-            )
-            for i, r in enumerate(results)
-        ]
+        search_results = to_search_results(results)
         
         # Générer une réponse RAG si demandé
         rag_response_text = None
         rag_summary_text = None
+        cacheable = True
         
         if request.use_rag and rag_service and rag_service.is_available():
             logger.info("Generating RAG response...")
-            rag_result = rag_service.generate_response(
+            # Réponse et résumé court générés en parallèle, sans bloquer la boucle
+            generations = [rag_service.generate_response_async(
                 query=request.query,
                 retrieved_docs=results,
                 max_docs=3
-            )
-            rag_response_text = rag_result.get("response")
-            
-            # Générer aussi un résumé court
+            )]
             if len(results) > 0:
-                rag_summary_text = rag_service.generate_summary(results, top_n=3)
+                generations.append(rag_service.generate_summary_async(results, top_n=3))
+            outputs = await until_disconnected(http_request, asyncio.gather(*generations))
+            
+            rag_result = outputs[0]
+            rag_response_text = rag_result.get("response")
+            # Ne pas mettre en cache les réponses de repli en cas d'erreur Gemini
+            cacheable = rag_result.get("error") is None
+            if len(outputs) > 1:
+                rag_summary_text = outputs[1]
         
-        return QueryResponse(
+        response = QueryResponse(
             query=request.query,
             results=search_results,
             latency=latency,
             total_docs=len(results),
             rag_response=rag_response_text,
-            rag_summary=rag_summary_text
+            rag_summary=rag_summary_text,
+            pairs_scored=search_stats.get("pairs_scored", 0),
+            reranked=search_stats.get("reranked", False)
         )
+        # Résultats dégradés (sans reranking, cross-encoder en chargement) : pas de cache
+        if request.use_reranking and not response.reranked:
+            cacheable = False
+        # Clé de la version qui a servi la recherche : avec le pool d'inférence, un
+        # worker pas encore rechargé ne met pas l'ancien index en cache sous la nouvelle
+        cache_key = result_cache_key(request, search_stats.get("index_version"))
+        if cacheable:
+            result_cache.put(
+                cache_key,
+                response.model_copy(update={"cached": True}).model_dump_json(exclude={"query"}).encode()
+            )
+        return response
+    except HTTPException:
+        raise
+    except InferenceUnavailable as e:
+        # Tous les workers du pool d'inférence sont hors service
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_documents_batch(request: BatchQueryRequest, http_request: Request):
+    if not engine_ready():
+        raise HTTPException(status_code=503, detail="Search engine not ready")
+    
+    try:
+        search_stats = {}
+        cancel_event = threading.Event()
+        batch_results, timings = await until_disconnected(
+            http_request,
+            run_in_engine(
+                search_engine.search_batch,
+                queries=request.queries,
+                top_k=request.top_k,
+                use_reranking=request.use_reranking,
+                hybrid=request.hybrid,
+                nprobe=request.nprobe,
+                ef_search=request.ef_search,
+                rerank_budget_ms=request.rerank_budget_ms,
+                stats=search_stats,
+                cancel_event=cancel_event,
+                filters=engine_filters(request.filters)
+            ),
+            cancel_event
+        )
+        
+        # Latence amortie par requête pour les statistiques globales
+        per_query_latency = timings["total"] / len(request.queries)
+        for query in request.queries:
+            metrics_collector.add_query(query, per_query_latency)
+        
+        return BatchQueryResponse(
+            results=[
+                BatchQueryResult(
+                    query=query,
+                    results=to_search_results(results),
+                    total_docs=len(results),
+                    pairs_scored=pairs_scored,
+                    reranked=reranked
+                )
+                for query, results, pairs_scored, reranked in zip(
+                    request.queries, batch_results, search_stats["pairs_scored"], search_stats["reranked"]
+                )
+            ],
+            latency=timings["total"],
+            timings=timings
+        )
+    except HTTPException:
+        raise
+    except InferenceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch search error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/docs/{doc_id}")
 async def get_document(doc_id: str):
-    if search_engine is None:
+    if not engine_ready():
         raise HTTPException(status_code=503, detail="Search engine not ready")
     
-    doc = search_engine.get_document(doc_id)
+    try:
+        doc = await run_in_engine(search_engine.get_document, doc_id)
+    except InferenceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
     return doc
 
+@app.get("/docs/{doc_id}/similar")
+async def get_similar_documents(doc_id: str, top_k: int = 10):
+    if not engine_ready():
+        raise HTTPException(status_code=503, detail="Search engine not ready")
+    
+    try:
+        results = await run_in_engine(search_engine.similar_documents, doc_id, top_k=top_k)
+    except InferenceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if results is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return {"doc_id": doc_id, "results": results}
+
+def engine_stats() -> Dict:
+    stats = {
+        "cache": search_engine.cache_stats(),
+        "batching": search_engine.batching_stats()
+    }
+    if isinstance(search_engine, InferenceClient):
+        stats["inference_workers"] = search_engine.pool_stats()
+    elif search_engine.shard_stats() is not None:
+        # Latence par shard : un shard lent ralentit chaque requête
+        stats["shards"] = search_engine.shard_stats()
+    return stats
+
 @app.get("/metrics")
 async def get_metrics():
-    return metrics_collector.get_summary()
+    summary = metrics_collector.get_summary()
+    if search_engine is not None:
+        # Hors du pool du moteur (saturé sous charge) et de la boucle (appels IPC)
+        summary.update(await asyncio.to_thread(engine_stats))
+        summary["cache"]["result"] = result_cache.stats()
+    return summary
 
 @app.get("/health")
 async def health_check():
-    return {
+    health = {
         "status": "healthy",
-        "search_engine_loaded": search_engine is not None,
+        "search_engine_loaded": engine_ready(),
         "rag_service_available": rag_service is not None and rag_service.is_available()
     }
+    if isinstance(search_engine, InferenceClient):
+        workers = await asyncio.to_thread(search_engine.pool_stats)
+        health["inference_workers_alive"] = sum(w["alive"] for w in workers)
+        health["inference_workers"] = len(workers)
+        health["threads"] = {w["worker"]: w.get("threads") for w in workers}
+    elif search_engine is not None:
+        health["components"] = search_engine.readiness()
+        health["startup"] = search_engine.startup_stats()
+        health["threads"] = search_engine.thread_stats()
+    return health
+
+@app.get("/index/version")
+async def get_index_version():
+    """Version du snapshot d'index servi (et celle pointée par models/CURRENT)"""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not ready")
+    if isinstance(search_engine, InferenceClient):
+        return {"version": await current_index_version()}
+    return search_engine.snapshot_info()
 
 @app.post("/rag/answer")
-async def rag_answer(request: QueryRequest):
+async def rag_answer(request: QueryRequest, http_request: Request):
     """Endpoint dédié pour obtenir uniquement la réponse RAG"""
-    if search_engine is None:
+    if not engine_ready():
         raise HTTPException(status_code=503, detail="Search engine not ready")
     
     if rag_service is None or not rag_service.is_available():
@@ -167,18 +488,32 @@ async def rag_answer(request: QueryRequest):
     
     try:
         # Rechercher les documents pertinents
-        results, latency = search_engine.search(
-            query=request.query,
-            top_k=request.top_k,
-            use_reranking=request.use_reranking,
-            hybrid=request.hybrid
+        cancel_event = threading.Event()
+        results, latency = await until_disconnected(
+            http_request,
+            run_in_engine(
+                search_engine.search,
+                query=request.query,
+                top_k=request.top_k,
+                use_reranking=request.use_reranking,
+                hybrid=request.hybrid,
+                nprobe=request.nprobe,
+                ef_search=request.ef_search,
+                rerank_budget_ms=request.rerank_budget_ms,
+                cancel_event=cancel_event,
+                filters=engine_filters(request.filters)
+            ),
+            cancel_event
         )
         
         # Générer la réponse RAG
-        rag_result = rag_service.generate_response(
-            query=request.query,
-            retrieved_docs=results,
-            max_docs=5
+        rag_result = await until_disconnected(
+            http_request,
+            rag_service.generate_response_async(
+                query=request.query,
+                retrieved_docs=results,
+                max_docs=5
+            )
         )
         
         return {
@@ -190,10 +525,61 @@ async def rag_answer(request: QueryRequest):
             "error": rag_result.get("error")
         }
         
+    except HTTPException:
+        raise
+    except InferenceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"RAG answer error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Endpoints /admin : jeton X-Admin-Token, désactivés si ADMIN_TOKEN n'est pas défini"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled (ADMIN_TOKEN not set)")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def get_index_updater():
+    global index_updater
+    if not engine_ready():
+        raise HTTPException(status_code=503, detail="Search engine not ready")
+    if isinstance(search_engine, InferenceClient):
+        raise HTTPException(status_code=501, detail="Updates are not supported with the inference pool")
+    if index_updater is None or index_updater.engine is not search_engine:
+        # Import tardif : le module de mise à jour importe FAISS
+        from app.services.index_updates import IndexUpdater
+        
+        index_updater = IndexUpdater(search_engine)
+    return index_updater
+
+async def run_update(fn, *args):
+    # Hors du pool du moteur : les recherches continuent pendant la mise à jour
+    try:
+        return await asyncio.to_thread(fn, *args)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/documents", dependencies=[Depends(require_admin)])
+async def upsert_documents(request: UpsertDocumentsRequest):
+    """Ajoute des documents (ou remplace ceux dont le doc_id existe) sans reconstruire l'index"""
+    updater = get_index_updater()
+    return await run_update(updater.upsert, [d.model_dump() for d in request.documents])
+
+@app.post("/admin/documents/delete", dependencies=[Depends(require_admin)])
+async def delete_documents(request: DeleteDocumentsRequest):
+    updater = get_index_updater()
+    return await run_update(updater.delete, request.doc_ids)
+
+@app.post("/admin/compact", dependencies=[Depends(require_admin)])
+async def compact_index():
+    """Supprime physiquement les documents supprimés (sans ré-encoder)"""
+    updater = get_index_updater()
+    return await run_update(updater.compact)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls of a batched model function.
+
+    Callers ``submit`` a list of inputs and block until their slice of the
+    output is ready. A worker thread takes the oldest pending request,
+    waits up to ``max_wait_ms`` for more requests (up to ``max_batch_size``
+    inputs in total), runs ``fn`` once on the concatenation and hands each
+    caller its own rows. ``fn`` must return one output row per input, as a
+    numpy array or a list.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List], Sequence],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher"
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._carry = None  # request that did not fit in the previous batch
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+
+    def submit(self, items: Sequence):
+        """Run ``fn(items)`` as part of a shared batch; returns its outputs"""
+        if not items:
+            return self.fn(list(items))
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(items), future))
+        return future.result()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def close(self):
+        """Stop the worker once the pending requests are served"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _next_request(self, timeout: Optional[float]):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        if timeout is not None and timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _run(self):
+        while True:
+            request = self._next_request(None)
+            if request is None:
+                return
+            batch, size = [request], len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while size < self.max_batch_size:
+                try:
+                    request = self._next_request(deadline - time.monotonic())
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                if size + len(request[0]) > self.max_batch_size:
+                    self._carry = request
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch: List[tuple]):
+        items = [item for request_items, _ in batch for item in request_items]
+        try:
+            outputs = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(items)
+        self.requests += len(batch)
+        start = 0
+        for request_items, future in batch:
+            future.set_result(outputs[start:start + len(request_items)])
+            start += len(request_items)
+
+    def stats(self) -> Dict:
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
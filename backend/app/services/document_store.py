@@ -0,0 +1,314 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from app.services.filters import MetadataIndex
+from app.utils.arrays import append_rows
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class StringColumn:
+    """Variable-length strings packed as one UTF-8 buffer plus row offsets.
+
+    Both arrays are plain ``.npy`` files, so the column can be memory-mapped
+    and shared by every worker through the page cache.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, buffers: Optional[tuple] = None):
+        self.data = data
+        self.offsets = offsets
+        self._buffers = buffers  # (data, offsets) buffers of ``append``
+
+    @classmethod
+    def from_values(cls, values: Sequence) -> "StringColumn":
+        encoded = [str(v).encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def append(self, values: Sequence) -> "StringColumn":
+        """Column with ``values`` added as rows, in the spare capacity of its
+        buffers (see ``append_rows``): O(added) on average"""
+        added = StringColumn.from_values(values)
+        data_buffer, offsets_buffer = self._buffers or (None, None)
+        data, data_buffer = append_rows(self.data, added.data, data_buffer)
+        offsets, offsets_buffer = append_rows(self.offsets, added.offsets[1:] + self.offsets[-1], offsets_buffer)
+        return StringColumn(data, offsets, (data_buffer, offsets_buffer))
+
+    def take(self, rows: Sequence[int]) -> "StringColumn":
+        return StringColumn.from_values([self[int(row)] for row in rows])
+
+    def save(self, directory: Path, name: str):
+        np.save(directory / f"{name}.data.npy", self.data)
+        np.save(directory / f"{name}.offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, mmap_mode: Optional[str] = None) -> "StringColumn":
+        return cls(
+            np.load(directory / f"{name}.data.npy", mmap_mode=mmap_mode),
+            np.load(directory / f"{name}.offsets.npy", mmap_mode=mmap_mode)
+        )
+
+
+class CategoricalColumn:
+    """Low-cardinality strings (source, focus_area) as int32 codes + vocabulary"""
+
+    def __init__(self, codes: np.ndarray, values: List[str], buffer: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.values = values
+        self._buffer = buffer  # codes buffer of ``append``
+
+    @classmethod
+    def from_values(cls, values: Sequence) -> "CategoricalColumn":
+        categories, codes = np.unique(np.array([str(v) for v in values], dtype=object), return_inverse=True)
+        return cls(codes.astype(np.int32).reshape(-1), [str(c) for c in categories])
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> str:
+        return self.values[self.codes[row]]
+
+    def append(self, values: Sequence) -> "CategoricalColumn":
+        vocabulary = list(self.values)
+        code_of = {value: code for code, value in enumerate(vocabulary)}
+        codes = []
+        for value in values:
+            value = str(value)
+            if value not in code_of:
+                code_of[value] = len(vocabulary)
+                vocabulary.append(value)
+            codes.append(code_of[value])
+        codes, buffer = append_rows(np.asarray(self.codes, dtype=np.int32), codes, self._buffer)
+        return CategoricalColumn(codes, vocabulary, buffer)
+
+    def take(self, rows: Sequence[int]) -> "CategoricalColumn":
+        return CategoricalColumn(np.asarray(self.codes)[rows], self.values)
+
+    def save(self, directory: Path, name: str):
+        np.save(directory / f"{name}.codes.npy", self.codes)
+        with open(directory / f"{name}.values.json", 'w', encoding='utf-8') as f:
+            json.dump(self.values, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, mmap_mode: Optional[str] = None) -> "CategoricalColumn":
+        with open(directory / f"{name}.values.json", encoding='utf-8') as f:
+            values = json.load(f)
+        return cls(np.load(directory / f"{name}.codes.npy", mmap_mode=mmap_mode), values)
+
+
+def _append(column, values: List, categorical: bool = False):
+    if not isinstance(column, (StringColumn, CategoricalColumn)):
+        # Plain values (documents loaded from docs.csv): packed once, then appended to
+        column = (CategoricalColumn if categorical else StringColumn).from_values(column)
+    return column.append(values)
+
+
+def _take(column, rows: np.ndarray):
+    if isinstance(column, (StringColumn, CategoricalColumn, np.ndarray)):
+        return column.take(rows)
+    return [column[int(row)] for row in rows]
+
+
+class DocumentStore:
+    """Columnar, position-aligned view of docs.csv.
+
+    Row ``i`` of every column corresponds to vector ``i`` of the FAISS index,
+    so turning search hits into results is a direct array access. A
+    ``doc_id -> row`` hash index is built on first lookup by id, the
+    per-value rows used by filters (``metadata_index``) on first use.
+
+    ``append`` / ``delete_rows`` return a new store in O(changed rows):
+    columns grow into spare capacity, and the doc_id map, tombstones and
+    metadata index are carried forward, updated in place. The previous
+    store must not be used afterwards (``IndexUpdater`` swaps them while no
+    search runs). Deleted rows are tombstoned (``deleted``) until ``take``
+    compacts them.
+    """
+
+    METADATA_COLUMNS = ('source', 'focus_area')
+    MANIFEST_FILE = "manifest.json"
+    DELETED_FILE = "deleted.npy"
+
+    def __init__(self, doc_ids: Sequence[str], columns: Dict[str, Sequence], deleted: Optional[np.ndarray] = None):
+        self.doc_ids = doc_ids
+        self.columns = columns
+        self.texts = columns['text']
+        self.metadata_columns = [c for c in self.METADATA_COLUMNS if c in columns]
+        self.deleted = deleted  # tombstone per row, None when no row is deleted
+        self._deleted_buffer = None
+        self._row_by_id = None
+        self._metadata_index = None
+
+    @classmethod
+    def from_dataframe(cls, df: "pd.DataFrame") -> "DocumentStore":
+        """Build the store from a documents DataFrame (one row per indexed vector)"""
+        doc_ids = df['doc_id'].astype(str).tolist()
+        columns = {
+            name: df[name].to_numpy(dtype=object)
+            for name in df.columns
+            if name != 'doc_id'
+        }
+        return cls(doc_ids, columns)
+
+    def save(self, directory: Path):
+        """Write the store in its mmap-friendly layout (one set of .npy files per column)"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        kinds = {}
+        StringColumn.from_values(self.doc_ids).save(directory, 'doc_id')
+        for name, values in self.columns.items():
+            column_class = CategoricalColumn if name in self.METADATA_COLUMNS else StringColumn
+            column_class.from_values(values).save(directory, name)
+            kinds[name] = 'categorical' if column_class is CategoricalColumn else 'string'
+
+        if self.deleted is not None:
+            np.save(directory / self.DELETED_FILE, self.deleted)
+        elif (directory / self.DELETED_FILE).exists():
+            (directory / self.DELETED_FILE).unlink()
+
+        with open(directory / self.MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'num_rows': len(self), 'num_deleted': len(self) - self.num_live, 'columns': kinds}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: Optional[str] = 'r') -> "DocumentStore":
+        """Open a store written by ``save``; with ``mmap_mode='r'`` nothing is copied into RAM"""
+        directory = Path(directory)
+        with open(directory / cls.MANIFEST_FILE, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        columns = {}
+        for name, kind in manifest['columns'].items():
+            column_class = CategoricalColumn if kind == 'categorical' else StringColumn
+            columns[name] = column_class.load(directory, name, mmap_mode=mmap_mode)
+        deleted_path = directory / cls.DELETED_FILE
+        deleted = np.load(deleted_path) if deleted_path.exists() else None
+        return cls(StringColumn.load(directory, 'doc_id', mmap_mode=mmap_mode), columns, deleted)
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        return (Path(directory) / cls.MANIFEST_FILE).exists()
+
+    @property
+    def row_by_id(self) -> Dict[str, int]:
+        # Built lazily: the search path only needs row positions. A doc_id
+        # appearing more than once names its first live row
+        if self._row_by_id is None:
+            self._row_by_id = {self.doc_ids[row]: row for row in self.live_rows()[::-1].tolist()}
+        return self._row_by_id
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex(self)
+        return self._metadata_index
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def num_live(self) -> int:
+        return len(self) - (int(self.deleted.sum()) if self.deleted is not None else 0)
+
+    def live_rows(self) -> np.ndarray:
+        if self.deleted is None:
+            return np.arange(len(self))
+        return np.flatnonzero(~self.deleted)
+
+    def append(self, records: Sequence[Dict]) -> "DocumentStore":
+        """New store with ``records`` (dicts with doc_id, text, ...) appended as rows"""
+        doc_ids = _append(self.doc_ids, [str(r['doc_id']) for r in records])
+        columns = {
+            name: _append(values, [r.get(name) or '' for r in records], name in self.METADATA_COLUMNS)
+            for name, values in self.columns.items()
+        }
+        store = DocumentStore(doc_ids, columns)
+        if self.deleted is not None:
+            store.deleted, store._deleted_buffer = append_rows(
+                self.deleted, np.zeros(len(records), dtype=bool), self._deleted_buffer
+            )
+        if self._row_by_id is not None:
+            # Updated, not rebuilt: that would go through every row in Python
+            store._row_by_id = self._row_by_id
+            store._row_by_id.update((str(r['doc_id']), len(self) + i) for i, r in enumerate(records))
+        if self._metadata_index is not None:
+            store._metadata_index = self._metadata_index.extend(store)
+        return store
+
+    def delete_rows(self, rows: Sequence[int]) -> "DocumentStore":
+        """New store sharing the columns, with ``rows`` tombstoned"""
+        rows = np.asarray(rows, dtype=np.int64)
+        store = DocumentStore(self.doc_ids, self.columns, self.deleted)
+        store._deleted_buffer = self._deleted_buffer
+        if store.deleted is None:
+            store.deleted = np.zeros(len(self), dtype=bool)
+        store.deleted[rows] = True
+        if self._row_by_id is not None:
+            store._row_by_id = self._row_by_id
+            for row in rows.tolist():
+                # A replaced document's id already names its new row
+                if store._row_by_id.get(self.doc_ids[row]) == row:
+                    del store._row_by_id[self.doc_ids[row]]
+        if self._metadata_index is not None:
+            store._metadata_index = self._metadata_index.extend(store)
+        return store
+
+    def take(self, rows: np.ndarray) -> "DocumentStore":
+        """New store made of ``rows`` only, renumbered from 0 (drops their tombstones)"""
+        return DocumentStore(
+            _take(self.doc_ids, rows),
+            {name: _take(values, rows) for name, values in self.columns.items()}
+        )
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.row_by_id
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        """Row position of a document, or None if unknown"""
+        return self.row_by_id.get(doc_id)
+
+    def is_valid_row(self, row: int) -> bool:
+        """FAISS pads missing hits with -1 when k > ntotal"""
+        return 0 <= row < len(self.doc_ids)
+
+    def result(self, row: int, score: float, rank: int) -> Dict:
+        """Build a search result dict for a row"""
+        result = {
+            'doc_id': self.doc_ids[row],
+            'text': str(self.texts[row]),
+            'score': float(score),
+            'rank': rank
+        }
+        for name in self.metadata_columns:
+            result[name] = str(self.columns[name][row])
+        return result
+
+    def results(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """Build result dicts for FAISS hits, skipping padding ids"""
+        results = []
+        for row, score in zip(rows, scores):
+            row = int(row)
+            if self.is_valid_row(row):
+                results.append(self.result(row, score, len(results) + 1))
+        return results
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """Full record for a document id"""
+        row = self.row_by_id.get(doc_id)
+        if row is None:
+            return None
+        record = {'doc_id': doc_id}
+        for name, values in self.columns.items():
+            record[name] = values[row]
+        return record
@@ -0,0 +1,182 @@
+from typing import TYPE_CHECKING, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.services.cache import LRUCache
+from app.utils.arrays import append_rows
+
+if TYPE_CHECKING:
+    from app.services.document_store import DocumentStore
+
+
+def filter_key(filters: Optional[Dict]) -> Optional[tuple]:
+    """Canonical, hashable form of a filter spec (None if it filters nothing).
+
+    A spec is ``{'include': {column: [values]}, 'exclude': {column: [values]},
+    'doc_id_ranges': [(start, end), ...]}``, every part optional. Values of
+    one column are OR-ed, columns and parts are AND-ed; ranges are OR-ed,
+    inclusive and open-ended on a None bound.
+    """
+    if not filters:
+        return None
+
+    def columns(part):
+        return tuple(sorted(
+            (column, tuple(sorted({str(v) for v in values})))
+            for column, values in (filters.get(part) or {}).items()
+            if values
+        ))
+
+    ranges = tuple(
+        (None if start is None else int(start), None if end is None else int(end))
+        for start, end in filters.get('doc_id_ranges') or ()
+    )
+    key = (columns('include'), columns('exclude'), ranges)
+    return key if any(key) else None
+
+
+class FilterSelection:
+    """Rows allowed by a filter: boolean mask, sorted rows and the packed
+    bitmap handed to FAISS as an ``IDSelectorBitmap``"""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.rows = np.flatnonzero(mask)
+        self.bitmap = np.packbits(mask, bitorder='little')
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class MetadataIndex:
+    """Per-value row arrays of the metadata columns, for filtered search.
+
+    Built once per document store, then carried forward by ``extend``: for
+    every ``source`` / ``focus_area`` value, the sorted rows holding it, so
+    resolving a filter is a few array writes instead of a scan of the
+    column. Numeric doc ids are sorted (with their rows) on the first range
+    filter. Resolved filters are cached. Deleted rows of the store are
+    excluded from every selection, so with tombstones even an unfiltered
+    search gets one.
+    """
+
+    def __init__(
+        self,
+        doc_store: "DocumentStore",
+        cache_size: int = 256,
+        rows_by_value: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+    ):
+        self.num_rows = len(doc_store)
+        self.doc_ids = doc_store.doc_ids
+        self.deleted = doc_store.deleted
+        if rows_by_value is None:
+            rows_by_value = {
+                name: self._rows_by_value(doc_store.columns[name])
+                for name in doc_store.metadata_columns
+            }
+        self.rows_by_value = rows_by_value
+        self._buffers = {}  # (column, value) -> buffer its rows were appended to
+        self._sorted_ids = None
+        self._id_rows = None
+        self.cache = LRUCache(cache_size)
+
+    @staticmethod
+    def _rows_by_value(column) -> Dict[str, np.ndarray]:
+        codes = getattr(column, 'codes', None)
+        if codes is None:  # plain values (documents loaded from docs.csv)
+            values, codes = np.unique(np.array([str(v) for v in column], dtype=object), return_inverse=True)
+        else:
+            values = column.values
+        codes = np.asarray(codes).reshape(-1)
+        # Rows grouped by value, in row order within a value
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        return {
+            str(value): order[bounds[i]:bounds[i + 1]].astype(np.int64)
+            for i, value in enumerate(values)
+        }
+
+    def extend(self, doc_store: "DocumentStore") -> "MetadataIndex":
+        """Index of ``doc_store``, this index's store with rows appended or tombstoned.
+
+        Only the appended rows are read: they are appended to the row arrays
+        of their values (see ``append_rows``) and merged into the sorted
+        numeric ids, the other arrays are shared. Only the latest index may
+        be extended.
+        """
+        new_rows = np.arange(self.num_rows, len(doc_store))
+        rows_by_value = {name: dict(rows) for name, rows in self.rows_by_value.items()}
+        buffers = dict(self._buffers)
+        for name, rows in rows_by_value.items():
+            column = doc_store.columns[name]
+            added = {}
+            for row in new_rows.tolist():
+                added.setdefault(str(column[row]), []).append(row)
+            for value, value_rows in added.items():
+                rows[value], buffers[name, value] = append_rows(
+                    rows.get(value, np.zeros(0, dtype=np.int64)), value_rows, buffers.get((name, value))
+                )
+
+        index = MetadataIndex(doc_store, self.cache.max_size, rows_by_value)
+        index._buffers = buffers
+        if self._sorted_ids is not None and len(new_rows):
+            try:
+                ids = np.array([int(doc_store.doc_ids[row]) for row in new_rows.tolist()], dtype=np.int64)
+            except ValueError:
+                return index  # fails on the next range filter
+            order = np.argsort(ids, kind='stable')
+            positions = np.searchsorted(self._sorted_ids, ids[order], side='right')
+            index._sorted_ids = np.insert(self._sorted_ids, positions, ids[order])
+            index._id_rows = np.insert(self._id_rows, positions, new_rows[order])
+        elif self._sorted_ids is not None:
+            index._sorted_ids, index._id_rows = self._sorted_ids, self._id_rows
+        return index
+
+    def select(self, filters: Optional[Dict]) -> Optional[FilterSelection]:
+        """Rows matching ``filters`` (see ``filter_key``), None if every row matches"""
+        key = filter_key(filters)
+        if key is None and self.deleted is None:
+            return None
+        selection = self.cache.get(key)
+        if selection is None:
+            selection = FilterSelection(self._mask(*(key or ((), (), ()))))
+            self.cache.put(key, selection)
+        return selection
+
+    def _mask(self, include: tuple, exclude: tuple, ranges: tuple) -> np.ndarray:
+        mask = np.ones(self.num_rows, dtype=bool)
+        for column, values in include:
+            allowed = np.zeros(self.num_rows, dtype=bool)
+            allowed[self._rows(column, values)] = True
+            mask &= allowed
+        for column, values in exclude:
+            mask[self._rows(column, values)] = False
+
+        if ranges:
+            sorted_ids, id_rows = self._numeric_ids()
+            allowed = np.zeros(self.num_rows, dtype=bool)
+            for start, end in ranges:
+                low = 0 if start is None else np.searchsorted(sorted_ids, start, side='left')
+                high = len(sorted_ids) if end is None else np.searchsorted(sorted_ids, end, side='right')
+                allowed[id_rows[low:high]] = True
+            mask &= allowed
+        if self.deleted is not None:
+            mask &= ~self.deleted
+        return mask
+
+    def _rows(self, column: str, values: Sequence[str]) -> np.ndarray:
+        if column not in self.rows_by_value:
+            raise ValueError(f"Cannot filter on '{column}' (filterable: {sorted(self.rows_by_value)})")
+        rows = self.rows_by_value[column]
+        return np.concatenate([rows.get(v, np.zeros(0, dtype=np.int64)) for v in values])
+
+    def _numeric_ids(self):
+        # Built lazily: only range filters need the ids as numbers
+        if self._sorted_ids is None:
+            try:
+                ids = np.array([int(self.doc_ids[row]) for row in range(self.num_rows)], dtype=np.int64)
+            except ValueError:
+                raise ValueError("doc_id ranges require numeric doc ids")
+            order = np.argsort(ids, kind='stable')
+            self._id_rows, self._sorted_ids = order, ids[order]
+        return self._sorted_ids, self._id_rows
@@ -0,0 +1,411 @@
+import logging
+import math
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_INDEX_TYPES = (
+    'IndexFlatIP', 'IndexIVFFlat', 'IndexIVFPQ', 'IndexHNSWFlat',
+    'IndexPQ', 'IndexScalarQuantizer', 'IndexBinaryFlat', 'IndexIVFPartitioned'
+)
+
+# Lossy float indexes whose first-stage scores are re-scored exactly
+COMPRESSED_INDEX_CLASSES = (
+    faiss.IndexPQ, faiss.IndexScalarQuantizer, faiss.IndexIVFPQ, faiss.IndexIVFScalarQuantizer
+)
+
+# Written next to index.faiss by every build; caches are keyed on it
+INDEX_VERSION_FILE = "index_version"
+
+
+def new_index_version() -> str:
+    """Unique, sortable version tag for a freshly built index"""
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    return f"{timestamp}-{uuid.uuid4().hex[:8]}"
+
+
+def write_index_version(models_dir: Path, version: Optional[str] = None) -> str:
+    version = version or new_index_version()
+    (Path(models_dir) / INDEX_VERSION_FILE).write_text(version, encoding='utf-8')
+    return version
+
+
+def read_index_version(models_dir: Path) -> str:
+    """Version of the index in models_dir (falls back to the index file mtime)"""
+    version_path = Path(models_dir) / INDEX_VERSION_FILE
+    if version_path.exists():
+        return version_path.read_text(encoding='utf-8').strip()
+    index_path = Path(models_dir) / "index.faiss"
+    if index_path.exists():
+        stat = index_path.stat()
+        return f"mtime-{stat.st_mtime_ns}-{stat.st_size}"
+    return "none"
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Rule of thumb: ~4*sqrt(N) lists, with at least 39 training points per list"""
+    nlist = int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // 39))
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits of each dimension, packed 8 per byte (for IndexBinaryFlat)"""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def is_binary_index(index) -> bool:
+    return isinstance(index, faiss.IndexBinary)
+
+
+def is_compressed_index(index) -> bool:
+    """True when the index scores are approximate and need exact re-scoring"""
+    return is_binary_index(index) or isinstance(index, COMPRESSED_INDEX_CLASSES)
+
+
+def partition_centroids(embeddings: np.ndarray, assignment: np.ndarray, num_partitions: int) -> np.ndarray:
+    """Normalized mean vector of each partition (its routing key)"""
+    centroids = np.zeros((num_partitions, embeddings.shape[1]), dtype='float32')
+    np.add.at(centroids, assignment, embeddings)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def partition_assignment(embeddings: np.ndarray, labels: Sequence, min_size: int = 20) -> np.ndarray:
+    """Partition of each vector: one per label value (e.g. focus_area).
+
+    Values with fewer than ``min_size`` vectors would make partitions too
+    small to route to: their vectors join the closest larger partition.
+    """
+    values, codes = np.unique(np.array([str(label) for label in labels], dtype=object), return_inverse=True)
+    codes = codes.reshape(-1)
+    large = np.flatnonzero(np.bincount(codes, minlength=len(values)) >= min_size)
+    if len(large) == 0:
+        return np.zeros(len(codes), dtype=np.int64)
+
+    partition_of_value = np.full(len(values), -1, dtype=np.int64)
+    partition_of_value[large] = np.arange(len(large))
+    assignment = partition_of_value[codes]
+    small = assignment < 0
+    if small.any():
+        centroids = partition_centroids(embeddings[~small], assignment[~small], len(large))
+        assignment[small] = np.argmax(embeddings[small] @ centroids.T, axis=1)
+    return assignment
+
+
+def build_partitioned_index(embeddings: np.ndarray, assignment: np.ndarray) -> faiss.IndexIVFFlat:
+    """IVF index whose inverted lists are the given partitions.
+
+    The coarse quantizer holds the partition centroids, so ``nprobe`` is the
+    number of partitions a query is routed to, and the IVF scan merges
+    their top-k. Ids are the row positions, as in every other index type.
+    """
+    num_partitions = int(assignment.max()) + 1
+    dimension = embeddings.shape[1]
+    quantizer = faiss.IndexFlatIP(dimension)
+    quantizer.add(partition_centroids(embeddings, assignment, num_partitions))
+    index = faiss.IndexIVFFlat(quantizer, dimension, num_partitions, faiss.METRIC_INNER_PRODUCT)
+    index.is_trained = True  # centroids are given, not learned
+    add_to_partitions(index, embeddings, assignment)
+    return index
+
+
+def add_to_partitions(index, embeddings: np.ndarray, assignment: np.ndarray):
+    """Append vectors (ids from ``ntotal`` on) to the given inverted lists,
+    instead of those of their closest centroid"""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    assignment = np.ascontiguousarray(assignment, dtype='int64')
+    faiss.extract_index_ivf(index).add_core(len(embeddings), faiss.swig_ptr(embeddings), None, faiss.swig_ptr(assignment))
+
+
+def label_partitions(index, labels: Sequence) -> Dict[str, int]:
+    """Partition of each label value that has its own, as assigned by
+    ``partition_assignment`` (``labels``: label of each row of the index).
+
+    Values whose vectors were spread over the closest partitions (fewer
+    than ``partition_min_size``) are left out.
+    """
+    return {p['name']: p['partition'] for p in partition_summary(index, labels) if p['name'] is not None}
+
+
+def assign_partitions(index, embeddings: np.ndarray, labels: Sequence, partition_of_label: Dict[str, int]) -> np.ndarray:
+    """Partitions of new vectors: their label's (``label_partitions``), else the closest one"""
+    assignment = np.array([partition_of_label.get(str(label), -1) for label in labels], dtype=np.int64)
+    unassigned = assignment < 0
+    if unassigned.any():
+        _, closest = faiss.extract_index_ivf(index).quantizer.search(
+            np.ascontiguousarray(embeddings[unassigned], dtype='float32'), 1
+        )
+        assignment[unassigned] = closest[:, 0]
+    return assignment
+
+
+def partition_summary(index, labels: Sequence) -> List[Dict]:
+    """Size and dominant label of each inverted list of a partitioned index"""
+    ivf = faiss.extract_index_ivf(index)
+    summary = []
+    for partition in range(ivf.nlist):
+        size = ivf.invlists.list_size(partition)
+        rows = faiss.rev_swig_ptr(ivf.invlists.get_ids(partition), size) if size else []
+        names, counts = np.unique(np.array([str(labels[row]) for row in rows], dtype=object), return_counts=True)
+        summary.append({
+            'partition': partition,
+            'name': str(names[np.argmax(counts)]) if size else None,
+            'size': int(size),
+            'num_labels': len(names)
+        })
+    return summary
+
+
+def build_index(embeddings: np.ndarray, faiss_config: Dict, partition_labels: Optional[Sequence] = None):
+    """Train (if needed) and fill the index declared by the `faiss` config section.
+
+    ``IndexIVFPartitioned`` also needs ``partition_labels``, the value of
+    ``faiss.partition_column`` for each vector.
+    """
+    index_type = faiss_config.get('index_type', 'IndexFlatIP')
+    num_vectors, dimension = embeddings.shape
+
+    if index_type == 'IndexIVFPartitioned':
+        if partition_labels is None:
+            raise ValueError(f"{index_type} needs the {faiss_config.get('partition_column', 'focus_area')} of each document")
+        assignment = partition_assignment(embeddings, partition_labels, faiss_config.get('partition_min_size', 20))
+        index = build_partitioned_index(embeddings, assignment)
+        apply_default_search_parameters(index, faiss_config)
+        return index
+
+    if index_type == 'IndexBinaryFlat':
+        # 1 bit per dimension: 384-d float32 (1536 bytes) -> 48 bytes
+        index = faiss.IndexBinaryFlat(dimension)
+        index.add(binarize(embeddings))
+        return index
+
+    if index_type == 'IndexFlatIP':
+        # Inner product = cosine similarity with normalized vectors
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type in ('IndexIVFFlat', 'IndexIVFPQ'):
+        nlist = faiss_config.get('nlist') or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == 'IndexIVFFlat':
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer,
+                dimension,
+                nlist,
+                faiss_config.get('pq_m', 48),
+                faiss_config.get('pq_nbits', 8),
+                faiss.METRIC_INNER_PRODUCT
+            )
+        logger.info(f"Training {index_type} with nlist={nlist}...")
+        index.train(embeddings)
+    elif index_type == 'IndexPQ':
+        index = faiss.IndexPQ(
+            dimension,
+            faiss_config.get('pq_m', 48),
+            faiss_config.get('pq_nbits', 8),
+            faiss.METRIC_INNER_PRODUCT
+        )
+        logger.info(f"Training {index_type}...")
+        index.train(embeddings)
+    elif index_type == 'IndexScalarQuantizer':
+        sq_type = getattr(faiss.ScalarQuantizer, faiss_config.get('sq_type', 'QT_4bit'))
+        index = faiss.IndexScalarQuantizer(dimension, sq_type, faiss.METRIC_INNER_PRODUCT)
+        logger.info(f"Training {index_type}...")
+        index.train(embeddings)
+    elif index_type == 'IndexHNSWFlat':
+        index = faiss.IndexHNSWFlat(dimension, faiss_config.get('hnsw_m', 32), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = faiss_config.get('ef_construction', 200)
+    else:
+        raise ValueError(
+            f"Unsupported index type: {index_type}. Expected one of {SUPPORTED_INDEX_TYPES}"
+        )
+
+    index.add(embeddings)
+    apply_default_search_parameters(index, faiss_config)
+    return index
+
+
+def write_index(index, path: str):
+    if is_binary_index(index):
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def read_index(path: str, mmap: bool = False):
+    """Read a float or binary index (binary index files start with 'IB').
+
+    With ``mmap=True`` the vectors/codes stay in the page cache, shared by
+    every process that maps the same file, instead of being copied into RAM.
+    """
+    with open(path, 'rb') as f:
+        fourcc = f.read(4)
+    reader = faiss.read_index_binary if fourcc.startswith(b'IB') else faiss.read_index
+
+    if mmap:
+        # IO_FLAG_MMAP_IFC extends mmap to flat code storage (IndexFlat, PQ, SQ)
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return reader(path, flags)
+        except RuntimeError as e:
+            logger.warning(f"Memory-mapped read not supported for {path} ({e}), reading into RAM")
+    return reader(path)
+
+
+def apply_default_search_parameters(index, faiss_config: Dict):
+    """Set the query-time defaults (nprobe / efSearch) from the config"""
+    if is_binary_index(index):
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = faiss_config.get('nprobe', 10)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = faiss_config.get('ef_search', 64)
+
+
+def id_selector(bitmap: np.ndarray) -> faiss.IDSelectorBitmap:
+    """FAISS selector over a little-endian packed row bitmap.
+
+    The selector points into ``bitmap``, which must outlive the search.
+    """
+    return faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+
+def search_parameters(
+    index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    selector: Optional[faiss.IDSelector] = None
+) -> Optional[faiss.SearchParameters]:
+    """Per-request search parameters.
+
+    Passed to ``index.search(params=...)`` instead of mutating the shared
+    index, so concurrent requests with different overrides do not race.
+    With ``selector`` only the selected ids are scanned (filtered search).
+    """
+    if is_binary_index(index):
+        return None
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (nprobe or selector is not None):
+        params = faiss.SearchParametersIVF()
+        # Parameter objects do not inherit the index defaults
+        params.nprobe = nprobe or ivf.nprobe
+    elif isinstance(index, faiss.IndexHNSW) and (ef_search or selector is not None):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or index.hnsw.efSearch
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def search_index(
+    index,
+    query_embeddings: np.ndarray,
+    k: int,
+    params: Optional[faiss.SearchParameters] = None,
+    vectors: Optional[np.ndarray] = None,
+    rescore_candidates: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """First-stage search, optionally followed by exact re-scoring.
+
+    With ``vectors`` (the float32 embeddings, row-aligned with the index) and
+    ``rescore_candidates > 0``, the index returns that many candidates per
+    query and they are re-ranked by their exact inner product, so a lossy
+    index only has to get the right documents into the candidate pool.
+    """
+    rescore = vectors is not None and rescore_candidates > 0
+    num_candidates = max(k, rescore_candidates) if rescore else k
+
+    if is_binary_index(index):
+        # Hamming distances: only the ids are meaningful for ranking
+        distances, indices = index.search(binarize(query_embeddings), num_candidates)
+        if not rescore:
+            distances = 1.0 - distances.astype('float32') / index.d
+    else:
+        distances, indices = index.search(query_embeddings, num_candidates, params=params)
+
+    if not rescore:
+        return distances, indices
+    return exact_rescore(vectors, query_embeddings, indices, k)
+
+
+def exact_search(
+    vectors: np.ndarray,
+    query_embeddings: np.ndarray,
+    rows: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k inner products over a subset of rows (-1 = padding)"""
+    num_queries = len(query_embeddings)
+    scores = np.full((num_queries, k), -np.inf, dtype='float32')
+    indices = np.full((num_queries, k), -1, dtype=np.int64)
+    top = min(k, len(rows))
+    if top == 0:
+        return scores, indices
+
+    all_scores = query_embeddings @ np.asarray(vectors[rows], dtype='float32').T
+    order = np.argpartition(-all_scores, top - 1, axis=1)[:, :top]
+    order = np.take_along_axis(order, np.argsort(-np.take_along_axis(all_scores, order, axis=1), axis=1), axis=1)
+    scores[:, :top] = np.take_along_axis(all_scores, order, axis=1)
+    indices[:, :top] = np.asarray(rows)[order]
+    return scores, indices
+
+
+def exact_rescore(
+    vectors: np.ndarray,
+    query_embeddings: np.ndarray,
+    candidates: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact inner products for candidate ids (-1 = padding), top-k per query"""
+    valid = candidates >= 0
+    num_queries, num_candidates = candidates.shape
+
+    candidate_vectors = np.asarray(vectors[np.where(valid, candidates, 0).ravel()], dtype='float32')
+    candidate_vectors = candidate_vectors.reshape(num_queries, num_candidates, -1)
+    scores = np.einsum('qcd,qd->qc', candidate_vectors, query_embeddings)
+    scores[~valid] = -np.inf
+
+    order = np.argsort(-scores, axis=1)[:, :k]
+    scores = np.take_along_axis(scores, order, axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    indices[~np.isfinite(scores)] = -1
+    return scores.astype('float32'), indices
+
+
+def evaluate_recall(
+    index,
+    embeddings: np.ndarray,
+    faiss_config: Dict,
+    k: int = 10,
+    sample_size: int = 200
+) -> float:
+    """Recall@k of the index (with re-scoring) against exact flat search.
+
+    A sample of the document embeddings is used as queries.
+    """
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(embeddings), size=min(sample_size, len(embeddings)), replace=False)
+    queries = np.ascontiguousarray(embeddings[sample])
+
+    flat = faiss.IndexFlatIP(embeddings.shape[1])
+    flat.add(embeddings)
+    _, expected = flat.search(queries, k)
+
+    rescore_candidates = faiss_config.get('rescore_candidates', 200) if is_compressed_index(index) else 0
+    _, found = search_index(
+        index, queries, k, vectors=embeddings, rescore_candidates=rescore_candidates
+    )
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected.tolist(), found.tolist()))
+    return hits / expected.size
@@ -0,0 +1,430 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from app.services.document_store import DocumentStore
+from app.services.index_factory import (
+    add_to_partitions,
+    assign_partitions,
+    binarize,
+    build_index,
+    is_binary_index,
+    label_partitions,
+    new_index_version,
+    write_index
+)
+from app.services.passages import split_passages
+from app.services.sharding import SHARDS_DIR, ShardedIndex
+from app.services.snapshots import (
+    ANY_VERSION,
+    WriterLock,
+    current_version,
+    publish_snapshot,
+    read_manifest,
+    snapshot_dir
+)
+from app.services.sparse_index import BM25Index
+from app.services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def _replace_file(path: Path, write: Callable[[Path], None]):
+    """Write ``path`` through a temporary file renamed over it (atomic on POSIX)"""
+    tmp = path.with_name(f"{path.stem}.tmp{path.suffix}")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _copy_index(index):
+    # Owned copy: clone_index keeps memory-mapped storage read-only
+    if is_binary_index(index):
+        return faiss.deserialize_index_binary(faiss.serialize_index_binary(index))
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+class IndexUpdater:
+    """Adds, replaces and deletes documents of a loaded engine without a rebuild.
+
+    Rows are ids everywhere (FAISS, vectors, document store, BM25, passages),
+    so components only ever grow: new documents are encoded and added to
+    the live index (copied once, a loaded index may be memory-mapped) and
+    to BM25's delta segment, a replaced or deleted document is tombstoned
+    in the document store and filtered out of every search through its
+    metadata index. ``compact`` drops the tombstoned rows, reusing the
+    stored vectors.
+
+    Changes are applied under the engine's write lock, once in-flight
+    searches are done, in O(changed documents): the document store and its
+    lookups are carried forward, not rebuilt. With ``persist``, they are
+    published as a new index snapshot (which other processes watching
+    models/ hot-reload) and written to docs.csv ``publish_delay`` seconds
+    after the last one. Publishing writes (and checksums) every component,
+    O(corpus): a burst of updates pays it once (``flush`` publishes right
+    away).
+    Writers of all processes take turns through the models directory's
+    ``WriterLock``, held from a first change to its publication: one whose
+    engine is behind the current snapshot reloads it before changing
+    anything, and publishes only if no other snapshot was published
+    meanwhile. A failed publication releases the lock; its changes stay
+    pending (retried by the next change or ``flush``) unless another
+    writer publishes first, which drops them.
+    """
+
+    def __init__(self, engine, persist: bool = True, publish_delay: Optional[float] = None):
+        self.engine = engine
+        self.persist = persist
+        if publish_delay is None:
+            publish_delay = engine.snapshot_config.get('publish_delay_s', 2.0)
+        self.publish_delay = publish_delay
+        self._lock = threading.Lock()
+        self._writer_lock = None  # held while changes wait to be published
+        self._base_version = ANY_VERSION  # CURRENT the pending changes are built on
+        self._pending = False
+        self._timer = None
+        self._index = None  # the engine's index once this updater owns it (added to in place)
+        self._partitions = None  # (index, partition of each label) for IndexIVFPartitioned
+
+    def upsert(self, records: Sequence[Dict]) -> Dict:
+        """Add documents, replacing those whose doc_id already exists"""
+        start = time.time()
+        # Last version wins when a doc_id appears twice
+        records = list({str(r['doc_id']): dict(r, doc_id=str(r['doc_id'])) for r in records}.values())
+        if not records:
+            return self._summary(start, added=0, updated=0)
+
+        with self._writing():
+            engine = self.engine
+            self._check_not_sharded()
+            doc_store = engine.doc_store
+            replaced = [doc_store.row_by_id[r['doc_id']] for r in records if r['doc_id'] in doc_store]
+
+            doc_texts = [str(r.get('text') or '') for r in records]
+            texts, doc_of_vector = doc_texts, np.arange(len(records))
+            passages = engine.passages
+            if passages is not None:
+                passage_texts, doc_rows = split_passages(
+                    texts,
+                    passages.config.get('passage_words', 128),
+                    passages.config.get('overlap_words', 32)
+                )
+                passages = passages.append(passage_texts, doc_rows + len(doc_store))
+                texts, doc_of_vector = passage_texts, doc_rows
+            embeddings = self._encode(texts)
+
+            self._own_index()
+            assignment = None
+            if engine.faiss_config.get('index_type') == 'IndexIVFPartitioned':
+                # Into the partition of their label, where queries routed to it look
+                column = engine.faiss_config.get('partition_column', 'focus_area')
+                labels = [str(records[int(doc)].get(column) or '') for doc in doc_of_vector]
+                assignment = assign_partitions(self._index, embeddings, labels, self._label_partitions())
+            self._publish(
+                records=records,
+                deleted_rows=replaced,
+                added=embeddings,
+                assignment=assignment,
+                passages=passages,
+                sparse_index=engine.sparse_index.extend(doc_texts) if engine.sparse_index is not None else None,
+                changed=[r['doc_id'] for r in records]
+            )
+        return self._summary(start, added=len(records) - len(replaced), updated=len(replaced))
+
+    def delete(self, doc_ids: Iterable[str]) -> Dict:
+        """Tombstone documents; unknown ids are reported, not an error"""
+        start = time.time()
+        doc_ids = list(dict.fromkeys(str(doc_id) for doc_id in doc_ids))
+        with self._writing():
+            doc_store = self.engine.doc_store
+            found = [doc_id for doc_id in doc_ids if doc_id in doc_store]
+            if found:
+                self._publish(deleted_rows=[doc_store.row_by_id[d] for d in found], changed=found)
+        return self._summary(start, deleted=len(found), not_found=[d for d in doc_ids if d not in found])
+
+    def compact(self) -> Dict:
+        """Rebuild every component without the tombstoned rows (no re-encoding)"""
+        start = time.time()
+        with self._writing():
+            engine = self.engine
+            doc_store = engine.doc_store
+            if doc_store.deleted is None:
+                return self._summary(start, removed=0)
+            if engine.vectors is None:
+                raise RuntimeError("Compaction needs the document vectors (embeddings.npy)")
+            self._check_not_sharded()
+
+            live = doc_store.live_rows()
+            new_store = doc_store.take(live)
+            vector_rows, doc_of_vector = live, np.arange(len(live))
+            passages = engine.passages
+            if passages is not None:
+                passages, vector_rows = passages.take(live)
+                doc_of_vector = passages.doc_rows
+            embeddings = engine.vectors.get(vector_rows)
+
+            partition_labels = None
+            if engine.faiss_config.get('index_type') == 'IndexIVFPartitioned':
+                labels = new_store.columns[engine.faiss_config.get('partition_column', 'focus_area')]
+                partition_labels = [str(labels[int(row)]) for row in doc_of_vector]
+            index = build_index(embeddings, engine.faiss_config, partition_labels)
+            self._index = index
+
+            self._publish(
+                new_store,
+                index=index,
+                vectors=VectorStore.from_index(index) or VectorStore(embeddings),
+                passages=passages,
+                sparse_index=self._sparse_index(new_store)
+            )
+        return self._summary(start, removed=len(doc_store) - len(live))
+
+    def flush(self):
+        """Publish the pending changes now instead of after ``publish_delay``"""
+        with self._lock:
+            self._cancel_timer()
+            if self._pending:
+                self._acquire()
+            if self._pending:
+                self._publish_snapshot()
+
+    @contextmanager
+    def _writing(self):
+        """One change at a time; with ``persist``, under the writer lock until published"""
+        with self._lock:
+            if not self.persist:
+                yield
+                return
+            self._acquire()
+            try:
+                yield
+            finally:
+                if self._pending:
+                    self._schedule_publish()
+                else:
+                    self._release()
+                    self._base_version = ANY_VERSION
+
+    def _acquire(self):
+        """Take the writer lock unless held; on the current snapshot, with the pending
+        changes of a failed publication kept if it still is the one they were built on"""
+        if self._writer_lock is not None:
+            return
+        lock = WriterLock(self.engine.models_dir)
+        lock.acquire()
+        try:
+            if self._pending and current_version(self.engine.models_dir) != self._base_version:
+                logger.error(
+                    f"Unpublished index version {self.engine.index_version} dropped: "
+                    f"another writer published {current_version(self.engine.models_dir)} meanwhile"
+                )
+                self._pending = self.engine.publish_pending = False
+            if not self._pending:
+                self._base_version = self._catch_up()
+        except BaseException:
+            lock.release()
+            raise
+        self._writer_lock = lock
+
+    def _catch_up(self) -> Optional[str]:
+        """Load the current snapshot if another writer published it; returns its version"""
+        engine = self.engine
+        current = current_version(engine.models_dir)
+        if current is not None and current != engine.index_version:
+            engine.reload_snapshot()
+            if engine.index_version != current:
+                raise RuntimeError(
+                    f"Index snapshot {current} published by another writer could not be loaded: "
+                    f"{engine.snapshot_error}"
+                )
+        return current
+
+    def _schedule_publish(self):
+        self._cancel_timer()
+        if self.publish_delay <= 0:
+            self._publish_snapshot()
+            return
+        self._timer = threading.Timer(self.publish_delay, self._publish_when_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _publish_when_idle(self):
+        with self._lock:
+            if threading.current_thread() is not self._timer:
+                return  # rescheduled by a later change
+            self._timer = None
+            try:
+                self._publish_snapshot()
+            except Exception as e:
+                # Still pending: retried after the next change, or by flush
+                logger.error(f"Failed to publish index snapshot {self.engine.index_version}: {e}")
+
+    def _publish_snapshot(self):
+        try:
+            self.save()
+        finally:
+            # Also on failure: writers of other processes do not wait for the retry
+            self._release()
+        self._pending = False
+        self.engine.publish_pending = False
+        self._base_version = ANY_VERSION
+
+    def _release(self):
+        if self._writer_lock is not None:
+            self._writer_lock.release()
+            self._writer_lock = None
+
+    def _own_index(self):
+        # Copied once per loaded index, then added to in place
+        if self._index is not self.engine.index:
+            self._index = _copy_index(self.engine.index)
+
+    def _label_partitions(self) -> Dict[str, int]:
+        """Partition of each label value in the owned partitioned index (computed once per index)"""
+        if self._partitions is None or self._partitions[0] is not self._index:
+            engine = self.engine
+            column = engine.doc_store.columns[engine.faiss_config.get('partition_column', 'focus_area')]
+            doc_rows = engine.passages.doc_rows if engine.passages is not None else range(len(engine.doc_store))
+            labels = [str(column[int(row)]) for row in doc_rows]
+            self._partitions = (self._index, label_partitions(self._index, labels))
+        return self._partitions[1]
+
+    def _check_not_sharded(self):
+        # Shards may live in other processes; deletes (tombstones only) still work
+        if isinstance(self.engine.index, ShardedIndex):
+            raise RuntimeError("Adding documents to or compacting a sharded index needs a rebuild (build_index.py)")
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        if self.engine.encoder is None:
+            raise RuntimeError("Encoder not loaded")
+        batch_size = self.engine.config.get('model', {}).get('batch_size', 32)
+        # Same model as the indexed corpus, not the ONNX query encoder
+        encoder = self.engine.document_encoder()
+        embeddings = encoder.encode(list(texts), batch_size=batch_size, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype='float32')
+
+    def _sparse_index(self, doc_store: DocumentStore) -> Optional[BM25Index]:
+        # Full rebuild on compaction: merges the delta segment, refreshes the statistics
+        if self.engine.sparse_index is None:
+            return None
+        return BM25Index.build(doc_store.texts[row] for row in range(len(doc_store)))
+
+    def _publish(
+        self,
+        doc_store: Optional[DocumentStore] = None,
+        records: Sequence[Dict] = (),
+        deleted_rows: Sequence[int] = (),
+        index=None,
+        vectors: Optional[VectorStore] = None,
+        added: Optional[np.ndarray] = None,
+        assignment: Optional[np.ndarray] = None,
+        passages=None,
+        sparse_index: Optional[BM25Index] = None,
+        changed: Sequence[str] = ()
+    ):
+        """Swap the new components in; ``added`` vectors go to the owned index in
+        place (to the inverted lists of ``assignment`` if given). Without a new
+        ``doc_store``, ``records`` are appended to the engine's and
+        ``deleted_rows`` tombstoned, carrying its lookups forward in place"""
+        engine = self.engine
+        # Built before the first search sees the store (carried forward from the engine's)
+        (engine.doc_store if doc_store is None else doc_store).metadata_index
+        # No hot reload of this process between its change and the snapshot publishing it
+        with engine.snapshot_lock:
+            version = new_index_version()
+            with engine.components_lock.write():
+                if added is not None:
+                    # No search runs under the write lock: the index can grow in place
+                    index = self._index
+                    if assignment is not None:
+                        add_to_partitions(index, added, assignment)
+                    else:
+                        index.add(binarize(added) if is_binary_index(index) else added)
+                    vectors = VectorStore.from_index(index)
+                    if vectors is None and engine.vectors is not None:
+                        vectors = engine.vectors.append(added)
+                if index is not None:
+                    engine.index, engine.vectors = index, vectors
+                if doc_store is None:
+                    # No search uses the previous store anymore
+                    doc_store = engine.doc_store
+                    if len(records):
+                        doc_store = doc_store.append(records)
+                    if len(deleted_rows):
+                        doc_store = doc_store.delete_rows(deleted_rows)
+                if passages is not None:
+                    engine.passages = passages
+                if sparse_index is not None:
+                    engine.sparse_index = sparse_index
+                engine.doc_store = doc_store
+                engine.index_version = version
+                engine.publish_pending = self._pending = self.persist
+
+            # Cached rerank scores of replaced documents score the old text
+            changed = set(changed)
+            if changed:
+                engine.rerank_cache.discard_where(lambda key: key[1] in changed)
+            logger.info(f"Index updated to version {version} ({doc_store.num_live} live documents)")
+
+    def save(self):
+        """Publish the engine's components as the snapshot of its index_version,
+        and its live documents as docs.csv"""
+        engine = self.engine
+
+        def write(directory: Path) -> Dict:
+            if isinstance(engine.index, ShardedIndex):
+                engine.index.save(directory / SHARDS_DIR)
+            else:
+                write_index(engine.index, str(directory / "index.faiss"))
+            if engine.vectors is not None:
+                np.save(directory / "embeddings.npy", engine.vectors.matrix)
+            engine.doc_store.save(directory / "docstore")
+            if engine.sparse_index is not None:
+                engine.sparse_index.save(directory / "bm25")
+            if engine.passages is not None:
+                engine.passages.save(directory / "passages")
+            return {'num_documents': engine.doc_store.num_live, 'num_vectors': int(engine.index.ntotal)}
+
+        version = publish_snapshot(
+            engine.models_dir,
+            write,
+            version=engine.index_version,
+            keep=engine.snapshot_config.get('keep', 3),
+            expected_current=self._base_version
+        )
+        engine.index_dir = snapshot_dir(engine.models_dir, version)
+        engine.snapshot_manifest = read_manifest(engine.index_dir)
+
+        import pandas as pd
+
+        doc_store = engine.doc_store
+        live = doc_store.live_rows().tolist()
+        frame = pd.DataFrame({
+            'doc_id': [doc_store.doc_ids[row] for row in live],
+            **{name: [values[row] for row in live] for name, values in doc_store.columns.items()}
+        })
+        data_dir = Path(engine.data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        _replace_file(data_dir / "docs.csv", lambda path: frame.to_csv(path, index=False))
+
+    def _summary(self, start: float, **counts) -> Dict:
+        doc_store = self.engine.doc_store
+        return {
+            **counts,
+            'num_documents': doc_store.num_live,
+            'num_deleted': len(doc_store) - doc_store.num_live,
+            'index_version': self.engine.index_version,
+            'published': not self._pending,
+            'seconds': time.time() - start
+        }
@@ -0,0 +1,432 @@
+import logging
+import os
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.utils.config import load_config
+from app.utils.threads import apply_thread_env, physical_cores, thread_report
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTHKEY = b"semantic-search-inference"
+# Engine methods the API processes may call on a worker
+METHODS = ('search', 'search_batch', 'similar_documents', 'get_document', 'cache_stats', 'batching_stats')
+
+
+class InferenceError(RuntimeError):
+    """A worker failed to execute the call"""
+
+
+class InferenceUnavailable(RuntimeError):
+    """No inference worker could be reached"""
+
+
+class _WorkerUnreachable(Exception):
+    """The request could not be sent to a worker: safe to send to another"""
+
+
+def socket_paths(socket_dir: Path, num_workers: int) -> List[Path]:
+    return [Path(socket_dir) / f"worker-{i}.sock" for i in range(num_workers)]
+
+
+def authkey_from_env() -> bytes:
+    key = os.getenv("INFERENCE_AUTHKEY")
+    return key.encode() if key else DEFAULT_AUTHKEY
+
+
+class InferenceWorker:
+    """Serves one engine over a Unix socket, one thread per connection.
+
+    Requests are ``(method, args, kwargs)`` tuples and replies
+    ``('ok', result, stats)`` or ``('error', type, message)``, pickled by
+    ``multiprocessing.connection``. A ``stats`` out-dict passed by the
+    caller is sent back with the reply.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.inflight = 0
+        self.served = 0
+        self.errors = 0
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def status(self) -> Dict:
+        return {
+            'pid': os.getpid(),
+            'inflight': self.inflight,
+            'served': self.served,
+            'errors': self.errors,
+            'uptime': time.time() - self.started_at,
+            'index_version': self.engine.index_version,
+            'threads': thread_report()
+        }
+
+    def dispatch(self, method: str, args: tuple, kwargs: dict):
+        if method == 'ping':
+            return self.status(), None
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        with self._lock:
+            self.inflight += 1
+        try:
+            result = getattr(self.engine, method)(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+                self.served += 1
+        return result, kwargs.get('stats')
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    result, stats = self.dispatch(method, args, kwargs)
+                    reply = ('ok', result, stats)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Inference worker error in {method}: {e}")
+                    reply = ('error', type(e).__name__, str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve(self, socket_path: Path, authkey: bytes = DEFAULT_AUTHKEY):
+        socket_path = Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.exists():
+            socket_path.unlink()
+        with Listener(str(socket_path), family='AF_UNIX', authkey=authkey) as listener:
+            logger.info(f"Inference worker {os.getpid()} listening on {socket_path}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    logger.warning("Rejected inference connection with a wrong authkey")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+def run_worker(socket_path: str, config_path: Optional[str] = None, authkey: bytes = DEFAULT_AUTHKEY):
+    """Process entry point: load the models and index, then serve them"""
+    # Before numpy / torch / FAISS are imported, so OpenMP and BLAS pick it up
+    apply_thread_env(load_config(config_path).get('runtime', {}))
+    from app.services.search_engine import SemanticSearchEngine
+
+    logging.basicConfig(level=logging.INFO)
+    engine = SemanticSearchEngine(config_path)
+    engine.load()
+    if engine.snapshot_config.get('watch', True):
+        engine.watch_snapshots()
+    InferenceWorker(engine).serve(socket_path, authkey)
+
+
+class InferencePool:
+    """Supervisor of the inference worker processes.
+
+    Starts ``num_workers`` processes, pings each one every
+    ``health_interval`` seconds and restarts a worker whose process exited,
+    that stopped answering pings after being ready, or that was not ready
+    within ``startup_timeout`` (models still loading count as healthy).
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        socket_dir: Path,
+        config_path: Optional[str] = None,
+        authkey: bytes = DEFAULT_AUTHKEY,
+        health_interval: float = 5.0,
+        startup_timeout: float = 600.0,
+        max_failed_pings: int = 3,
+        target: Callable = run_worker
+    ):
+        self.paths = socket_paths(socket_dir, num_workers)
+        self.config_path = config_path
+        self.authkey = authkey
+        self.health_interval = health_interval
+        self.startup_timeout = startup_timeout
+        self.max_failed_pings = max_failed_pings
+        self.target = target
+        self.context = get_context('spawn')  # fresh interpreters: no forked torch / FAISS threads
+        self.processes = [None] * num_workers
+        self.started_at = [0.0] * num_workers
+        self.ready = [False] * num_workers
+        self.failed_pings = [0] * num_workers
+        self.restarts = [0] * num_workers
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        for i in range(len(self.paths)):
+            self._spawn(i)
+        self._monitor = threading.Thread(target=self._watch, name="inference-pool-monitor", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self, i: int):
+        process = self.context.Process(
+            target=self.target,
+            args=(str(self.paths[i]), self.config_path, self.authkey),
+            name=f"inference-worker-{i}",
+            daemon=True
+        )
+        process.start()
+        self.processes[i] = process
+        self.started_at[i] = time.time()
+        self.ready[i] = False
+        self.failed_pings[i] = 0
+        logger.info(f"Started inference worker {i} (pid {process.pid})")
+
+    def _restart(self, i: int, reason: str):
+        logger.warning(f"Restarting inference worker {i}: {reason}")
+        process = self.processes[i]
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=10)
+        self.restarts[i] += 1
+        self._spawn(i)
+
+    def ping(self, i: int, timeout: float = 2.0) -> Optional[Dict]:
+        try:
+            return call_worker(self.paths[i], self.authkey, 'ping', timeout=timeout)
+        except (OSError, EOFError, InferenceError):
+            return None
+
+    def check(self):
+        """One round of health checks"""
+        for i, process in enumerate(self.processes):
+            if not process.is_alive():
+                self._restart(i, f"exited with code {process.exitcode}")
+                continue
+            if self.ping(i) is not None:
+                self.ready[i] = True
+                self.failed_pings[i] = 0
+            elif self.ready[i]:
+                self.failed_pings[i] += 1
+                if self.failed_pings[i] >= self.max_failed_pings:
+                    self._restart(i, f"{self.failed_pings[i]} failed health checks")
+            elif time.time() - self.started_at[i] > self.startup_timeout:
+                self._restart(i, "not ready after startup timeout")
+
+    def _watch(self):
+        while not self._stop.wait(self.health_interval):
+            self.check()
+
+    def stop(self):
+        self._stop.set()
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=10)
+
+    def stats(self) -> List[Dict]:
+        return [
+            {
+                'worker': i,
+                'pid': process.pid if process is not None else None,
+                'alive': process is not None and process.is_alive(),
+                'ready': self.ready[i],
+                'restarts': self.restarts[i]
+            }
+            for i, process in enumerate(self.processes)
+        ]
+
+
+def call_worker(socket_path: Path, authkey: bytes, method: str, *args, timeout: Optional[float] = None, **kwargs):
+    """One-off call on a fresh connection"""
+    with Client(str(socket_path), family='AF_UNIX', authkey=authkey) as conn:
+        return _round_trip(conn, method, args, kwargs, timeout)[0]
+
+
+def _round_trip(conn, method: str, args: tuple, kwargs: dict, timeout: Optional[float]):
+    conn.send((method, args, kwargs))
+    return _receive(conn, method, timeout)
+
+
+def _receive(conn, method: str, timeout: Optional[float]):
+    if timeout is not None and not conn.poll(timeout):
+        raise TimeoutError(f"Inference worker did not answer {method} within {timeout}s")
+    reply = conn.recv()
+    if reply[0] == 'error':
+        raise InferenceError(f"{reply[1]}: {reply[2]}")
+    return reply[1], reply[2]
+
+
+class _WorkerChannel:
+    """Reusable connections to one worker, and the calls in flight on it"""
+
+    RETRY_AFTER = 1.0  # seconds a failed worker is skipped
+
+    def __init__(self, socket_path: Path, authkey: bytes):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.inflight = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.down_until
+
+    def call(self, method: str, args: tuple, kwargs: dict, timeout: Optional[float]):
+        """Reply of the worker; ``_WorkerUnreachable`` if the request was not
+        sent, any other error once the worker may be running it"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.inflight += 1
+        try:
+            try:
+                if conn is None:
+                    conn = Client(str(self.socket_path), family='AF_UNIX', authkey=self.authkey)
+                conn.send((method, args, kwargs))
+            except (OSError, EOFError) as e:
+                self._mark_down(conn)
+                raise _WorkerUnreachable(str(e)) from e
+            try:
+                reply = _receive(conn, method, timeout)
+            except TimeoutError:
+                # Slow, not down; its late reply would be read by the next call
+                conn.close()
+                raise
+            except (OSError, EOFError):
+                self._mark_down(conn)
+                raise
+            except InferenceError:
+                with self._lock:
+                    self._idle.append(conn)
+                raise
+        finally:
+            with self._lock:
+                self.inflight -= 1
+        with self._lock:
+            self._idle.append(conn)
+        return reply
+
+    def _mark_down(self, conn):
+        # The reply (if any) is lost with the connection: never reuse it
+        if conn is not None:
+            conn.close()
+        self.failures += 1
+        self.down_until = time.time() + self.RETRY_AFTER
+
+
+class InferenceClient:
+    """Engine-compatible proxy used by the API processes.
+
+    Forwards ``search``, ``search_batch``, ... to the least loaded worker
+    (fewest calls in flight from this process) and retries on another
+    worker when one is unreachable. A call is only retried if it never
+    reached a worker: a slow search raises ``TimeoutError`` instead of
+    being sent to the whole pool. ``cancel_event`` cannot cross the process boundary and is
+    ignored: a started remote search runs to completion.
+    """
+
+    STATUS_TTL = 1.0  # seconds the workers' index version is cached
+
+    def __init__(
+        self,
+        socket_dir: Path,
+        num_workers: int,
+        config: Optional[Dict] = None,
+        authkey: bytes = DEFAULT_AUTHKEY,
+        timeout: Optional[float] = 60.0
+    ):
+        self.config = config if config is not None else load_config()
+        self.channels = [_WorkerChannel(path, authkey) for path in socket_paths(socket_dir, num_workers)]
+        self.timeout = timeout
+        self._index_version = None
+        self._index_version_at = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "InferenceClient":
+        inference_config = config.get('inference', {})
+        return cls(
+            inference_config.get('socket_dir', "/tmp/semantic-search-inference"),
+            inference_config.get('workers') or physical_cores(),
+            config=config,
+            authkey=authkey_from_env(),
+            timeout=inference_config.get('request_timeout_s', 60.0)
+        )
+
+    def _call(self, method: str, *args, **kwargs):
+        kwargs.pop('cancel_event', None)
+        stats = kwargs.get('stats')
+        channels = sorted(self.channels, key=lambda c: (not c.available, c.inflight))
+        for channel in channels:
+            try:
+                result, remote_stats = channel.call(method, args, kwargs, self.timeout)
+            except _WorkerUnreachable as e:
+                logger.warning(f"Inference worker {channel.socket_path.name} unavailable: {e}")
+                continue
+            if stats is not None and remote_stats:
+                stats.update(remote_stats)
+            return result
+        raise InferenceUnavailable("No inference worker available")
+
+    def search(self, *args, **kwargs):
+        return self._call('search', *args, **kwargs)
+
+    def search_batch(self, *args, **kwargs):
+        return self._call('search_batch', *args, **kwargs)
+
+    def similar_documents(self, *args, **kwargs):
+        return self._call('similar_documents', *args, **kwargs)
+
+    def get_document(self, *args, **kwargs):
+        return self._call('get_document', *args, **kwargs)
+
+    def ready_for_search(self) -> bool:
+        # Workers only listen once their engine is fully loaded
+        return True
+
+    def cache_stats(self) -> Dict:
+        return self._call('cache_stats')
+
+    def batching_stats(self) -> Dict:
+        return self._call('batching_stats')
+
+    def thread_stats(self) -> Dict:
+        """Thread pools of each worker process"""
+        return {w['worker']: w.get('threads') for w in self.pool_stats()}
+
+    @property
+    def index_version(self) -> Optional[str]:
+        # Result-cache lookups (one worker's, refreshed at most every STATUS_TTL); results
+        # are cached under the 'index_version' of the worker that served them
+        if time.time() - self._index_version_at > self.STATUS_TTL:
+            try:
+                self._index_version = self._call('ping')['index_version']
+            except (InferenceUnavailable, OSError, EOFError):
+                self._index_version = None
+            self._index_version_at = time.time()
+        return self._index_version
+
+    def pool_stats(self) -> List[Dict]:
+        """Per-worker health and queue depth (worker side and from this process)"""
+        stats = []
+        for channel in self.channels:
+            entry = {
+                'worker': channel.socket_path.name,
+                'client_inflight': channel.inflight,
+                'failures': channel.failures
+            }
+            try:
+                entry.update(call_worker(channel.socket_path, channel.authkey, 'ping', timeout=2.0))
+                entry['alive'] = True
+            except (OSError, EOFError, InferenceError):
+                entry['alive'] = False
+            stats.append(entry)
+        return stats
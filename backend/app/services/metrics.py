@@ -1,6 +1,5 @@
 import time
 from typing import List, Dict
-import numpy as np
 
 class MetricsCollector:
     def __init__(self):
@@ -16,6 +15,8 @@ class MetricsCollector:
     
     def get_summary(self) -> Dict:
         """Get summary statistics"""
+        import numpy as np  # lazy: keeps numpy out of the app.main import path
+        
         if not self.latencies:
             return {
                 'total_queries': 0,
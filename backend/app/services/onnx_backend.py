@@ -0,0 +1,259 @@
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "onnx_config.json"
+
+
+def create_session(model_path: Path, num_threads: Optional[int] = None):
+    """CPU inference session with graph optimizations enabled"""
+    try:
+        import onnxruntime as ort
+    except ImportError:  # Optional dependency, only needed for the ONNX backends
+        raise ImportError("onnxruntime is required for the ONNX backends (pip install onnxruntime)")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+
+def model_path(model_dir: Path, quantized: bool = True) -> Path:
+    return Path(model_dir) / (QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+
+
+class OnnxModel:
+    """Exported graph + its tokenizer, loaded from an ``export_*`` directory"""
+
+    def __init__(self, model_dir: Path, quantized: bool = True, num_threads: Optional[int] = None):
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        with open(model_dir / CONFIG_FILE, encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.session = create_session(model_path(model_dir, quantized), num_threads)
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.max_length = self.config['max_length']
+        self.quantized = quantized
+
+    def _run(self, *texts) -> tuple:
+        """(first graph output, attention mask) for a batch of texts or text pairs"""
+        features = self.tokenizer(
+            *texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors='np'
+        )
+        feeds = {name: features[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feeds)[0], features['attention_mask']
+
+
+class OnnxCrossEncoder(OnnxModel):
+    """Drop-in replacement for ``CrossEncoder.predict`` running an exported
+    (optionally int8-quantized) graph through onnxruntime on CPU"""
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            logits, _ = self._run([p[0] for p in batch], [p[1] for p in batch])
+            scores.append(logits[:, 0] if logits.shape[1] == 1 else logits)
+
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        scores = np.concatenate(scores).astype(np.float32)
+        if self.config.get('activation') == 'sigmoid':
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores
+
+
+class OnnxQueryEncoder(OnnxModel):
+    """Lean replacement for ``SentenceTransformer.encode``: tokenizer + ONNX
+    transformer, with pooling and normalization done in numpy"""
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            hidden, mask = self._run(list(texts[start:start + batch_size]))
+            if self.config.get('pooling') == 'cls':
+                pooled = hidden[:, 0]
+            else:
+                mask = mask[:, :, None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            embeddings.append(pooled)
+
+        if not embeddings:
+            return np.zeros((0, self.config.get('dimension', 0)), dtype=np.float32)
+        embeddings = np.concatenate(embeddings).astype(np.float32)
+        if normalize_embeddings or self.config.get('normalize'):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def _activation_name(cross_encoder) -> str:
+    # Attribute name changed across sentence-transformers releases
+    for attribute in ('activation_fn', 'activation_fct', 'default_activation_function'):
+        activation = getattr(cross_encoder, attribute, None)
+        if activation is not None:
+            return 'sigmoid' if type(activation).__name__ == 'Sigmoid' else 'identity'
+    return 'identity'
+
+
+def _onnx_export(model, inputs: dict, path: Path, output_name: str, output_axes: Optional[dict] = None):
+    import torch
+
+    # Traced inputs are positional: follow the order of forward()'s parameters
+    parameters = list(inspect.signature(model.forward).parameters)
+    names = sorted(inputs, key=parameters.index)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+    dynamic_axes[output_name] = output_axes or {0: 'batch'}
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # TorchScript exporter: stable dynamic axes for BERT graphs
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(inputs[name] for name in names),
+            str(path),
+            input_names=names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            **kwargs
+        )
+
+
+def quantize(model_dir: Path):
+    """Dynamic int8 quantization of the exported graph (weights int8, activations at runtime)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        str(model_path(model_dir, quantized=False)),
+        str(model_path(model_dir, quantized=True)),
+        weight_type=QuantType.QInt8
+    )
+
+
+def export_cross_encoder(model_name: str, output_dir: Path, quantized: bool = True) -> Path:
+    """Export a sentence-transformers CrossEncoder to ONNX (+ int8 copy)"""
+    from sentence_transformers import CrossEncoder
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cross_encoder = CrossEncoder(model_name)
+    model = cross_encoder.model.eval()
+    tokenizer = cross_encoder.tokenizer
+
+    sample = tokenizer(["what is glaucoma"], ["Glaucoma damages the optic nerve."], return_tensors='pt')
+    _onnx_export(model, dict(sample), output_dir / MODEL_FILE, 'logits')
+    tokenizer.save_pretrained(str(output_dir))
+
+    with open(output_dir / CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'activation': _activation_name(cross_encoder),
+            'max_length': getattr(cross_encoder, 'max_seq_length', None) or cross_encoder.max_length
+            or tokenizer.model_max_length
+        }, f, indent=2)
+
+    if quantized:
+        quantize(output_dir)
+    logger.info(f"Cross-encoder exported to {output_dir}")
+    return output_dir
+
+
+def _pooling_mode(pooling) -> Optional[str]:
+    # One string attribute in sentence-transformers >= 6, a method before
+    if hasattr(pooling, 'get_pooling_mode_str'):
+        return pooling.get_pooling_mode_str()
+    mode = getattr(pooling, 'pooling_mode', None)
+    if isinstance(mode, (list, tuple)):
+        return mode[0] if len(mode) == 1 else None
+    return mode
+
+
+def export_query_encoder(model_name: str, output_dir: Path, quantized: bool = True) -> Path:
+    """Export the transformer of a SentenceTransformer to ONNX (+ int8 copy).
+
+    Only the token embeddings are exported; pooling and normalization are
+    recorded in the config and applied by ``OnnxQueryEncoder`` in numpy.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    encoder = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = encoder[0], encoder[1]
+    pooling_mode = _pooling_mode(pooling) if isinstance(pooling, models.Pooling) else None
+    if pooling_mode not in ('mean', 'cls'):
+        raise ValueError(f"{model_name}: only mean or CLS pooling can be exported")
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["what are the symptoms of diabetes"], return_tensors='pt')
+    _onnx_export(
+        TokenEmbeddings(transformer.auto_model).eval(), dict(sample), output_dir / MODEL_FILE,
+        'last_hidden_state', {0: 'batch', 1: 'sequence'}
+    )
+    tokenizer.save_pretrained(str(output_dir))
+
+    with open(output_dir / CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'pooling': pooling_mode,
+            'normalize': any(isinstance(m, models.Normalize) for m in encoder),
+            'dimension': encoder.get_sentence_embedding_dimension(),
+            'max_length': encoder.max_seq_length
+        }, f, indent=2)
+
+    if quantized:
+        quantize(output_dir)
+    logger.info(f"Query encoder exported to {output_dir}")
+    return output_dir
+
+
+def min_cosine(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Lowest cosine similarity between matching rows of two embedding matrices"""
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    return float(np.min(np.sum(reference * candidate, axis=1)))
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray, top_k: int = 10) -> dict:
+    """Agreement between two score vectors for the same pairs"""
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    top_k = min(top_k, len(reference))
+    reference_top = set(np.argsort(-reference)[:top_k].tolist())
+    candidate_top = set(np.argsort(-candidate)[:top_k].tolist())
+    return {
+        'max_abs_diff': float(np.max(np.abs(reference - candidate))) if len(reference) else 0.0,
+        'pearson': float(np.corrcoef(reference, candidate)[0, 1]) if len(reference) > 1 else 1.0,
+        f'top{top_k}_overlap': len(reference_top & candidate_top) / top_k if top_k else 1.0
+    }
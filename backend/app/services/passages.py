@@ -0,0 +1,191 @@
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.cache import LRUCache
+from app.services.document_store import StringColumn
+from app.services.filters import FilterSelection
+from app.utils.arrays import append_rows
+
+
+def split_passages(
+    texts: Sequence[str],
+    passage_words: int = 128,
+    overlap_words: int = 32
+) -> Tuple[List[str], np.ndarray]:
+    """Overlapping word windows of every text, and the row of their text.
+
+    Windows of ``passage_words`` words start every ``passage_words -
+    overlap_words`` words; a text shorter than one window is one passage.
+    Passages of a document are consecutive, in document row order.
+    """
+    step = max(1, passage_words - overlap_words)
+    passages, doc_rows = [], []
+    for row, text in enumerate(texts):
+        words = str(text).split()
+        starts = range(0, max(1, len(words) - overlap_words), step) if len(words) > passage_words else [0]
+        for start in starts:
+            passages.append(' '.join(words[start:start + passage_words]))
+            doc_rows.append(row)
+    return passages, np.array(doc_rows, dtype=np.int64)
+
+
+class PassageStore:
+    """Passages indexed in place of whole documents.
+
+    Row ``i`` of the store is vector ``i`` of the FAISS index; ``doc_rows[i]``
+    is the document store row it was cut from. Passages of a document are
+    contiguous, so ``doc_offsets`` (CSR style) gives the passages of each
+    document without a lookup table.
+    """
+
+    DOC_ROWS_FILE = "doc_rows.npy"
+    CONFIG_FILE = "passages.json"
+
+    def __init__(
+        self,
+        doc_rows: np.ndarray,
+        texts: StringColumn,
+        config: Optional[dict] = None,
+        doc_offsets: Optional[np.ndarray] = None,
+        buffers: Optional[tuple] = None
+    ):
+        self.doc_rows = doc_rows
+        self.texts = texts
+        self.config = config or {}
+        if doc_offsets is None:
+            num_docs = int(doc_rows[-1]) + 1 if len(doc_rows) else 0
+            doc_offsets = np.searchsorted(doc_rows, np.arange(num_docs + 1))
+        self.doc_offsets = doc_offsets
+        self._buffers = buffers  # (doc_rows, doc_offsets) buffers of ``append``
+        self._selections = LRUCache(256)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], passage_words: int = 128, overlap_words: int = 32) -> "PassageStore":
+        passages, doc_rows = split_passages(texts, passage_words, overlap_words)
+        config = {'passage_words': passage_words, 'overlap_words': overlap_words}
+        return cls(doc_rows, StringColumn.from_values(passages), config)
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / self.DOC_ROWS_FILE, self.doc_rows)
+        self.texts.save(directory, 'text')
+        with open(directory / self.CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'num_passages': len(self), **self.config}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: Optional[str] = None) -> "PassageStore":
+        directory = Path(directory)
+        with open(directory / cls.CONFIG_FILE, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(
+            np.load(directory / cls.DOC_ROWS_FILE, mmap_mode=mmap_mode),
+            StringColumn.load(directory, 'text', mmap_mode=mmap_mode),
+            config
+        )
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        return (Path(directory) / cls.CONFIG_FILE).exists()
+
+    def __len__(self) -> int:
+        return len(self.doc_rows)
+
+    def append(self, passages: Sequence[str], doc_rows: np.ndarray) -> "PassageStore":
+        """New store with passages of new documents (appended rows) added, in
+        the spare capacity of its arrays (see ``append_rows``)"""
+        texts = self.texts.append(passages) if self.texts is not None else StringColumn.from_values(passages)
+        rows_buffer, offsets_buffer = self._buffers or (None, None)
+        num_docs = len(self.doc_offsets) - 1
+        last_doc = int(doc_rows[-1]) if len(doc_rows) else num_docs - 1
+        # Offsets of the new documents, after the passages of the previous ones
+        offsets = len(self) + np.searchsorted(doc_rows, np.arange(num_docs + 1, last_doc + 2))
+        offsets, offsets_buffer = append_rows(np.asarray(self.doc_offsets, dtype=np.int64), offsets, offsets_buffer)
+        rows, rows_buffer = append_rows(np.asarray(self.doc_rows, dtype=np.int64), doc_rows, rows_buffer)
+        return PassageStore(rows, texts, self.config, offsets, (rows_buffer, offsets_buffer))
+
+    def take(self, doc_rows: np.ndarray) -> Tuple["PassageStore", np.ndarray]:
+        """Passages of the given documents, renumbered like ``DocumentStore.take``.
+
+        Also returns the kept passage rows (to select their vectors).
+        """
+        rows = np.concatenate([self.passages_of(int(row)) for row in doc_rows]) \
+            if len(doc_rows) else np.zeros(0, dtype=np.int64)
+        new_doc_rows = np.repeat(np.arange(len(doc_rows)), self.doc_offsets[doc_rows + 1] - self.doc_offsets[doc_rows])
+        return PassageStore(new_doc_rows.astype(np.int64), self.texts.take(rows), self.config), rows
+
+    def passages_of(self, doc_row: int) -> np.ndarray:
+        return np.arange(self.doc_offsets[doc_row], self.doc_offsets[doc_row + 1])
+
+    def select(self, doc_selection: FilterSelection) -> FilterSelection:
+        """Passage-level version of a document selection (cached per selection)"""
+        selection = self._selections.get(doc_selection)
+        if selection is None:
+            selection = FilterSelection(doc_selection.mask[self.doc_rows])
+            self._selections.put(doc_selection, selection)
+        return selection
+
+    def aggregate(
+        self,
+        scores: np.ndarray,
+        rows: np.ndarray,
+        k: int,
+        method: str = 'max'
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Passage hits -> top-k documents (``max`` or ``sum`` of their passage scores).
+
+        Returns document scores, document rows and the best passage of each
+        document, padded with -1 like FAISS results.
+        """
+        num_queries = len(rows)
+        doc_scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        doc_rows = np.full((num_queries, k), -1, dtype=np.int64)
+        best_passages = np.full((num_queries, k), -1, dtype=np.int64)
+        for i in range(num_queries):
+            valid = rows[i] >= 0
+            passage_rows, passage_scores = rows[i][valid], scores[i][valid]
+            if not len(passage_rows):
+                continue
+            # Hits are sorted by score: the first hit of a document is its best passage
+            docs, first, inverse = np.unique(
+                self.doc_rows[passage_rows], return_index=True, return_inverse=True
+            )
+            if method == 'sum':
+                totals = np.bincount(inverse.reshape(-1), weights=passage_scores, minlength=len(docs))
+            else:
+                totals = passage_scores[first]
+            top = np.argsort(-totals, kind='stable')[:k]
+            doc_scores[i, :len(top)] = totals[top]
+            doc_rows[i, :len(top)] = docs[top]
+            best_passages[i, :len(top)] = passage_rows[first[top]]
+        return doc_scores, doc_rows, best_passages
+
+    def best_passages(
+        self,
+        vectors: np.ndarray,
+        doc_rows: np.ndarray,
+        query_embedding: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact best passage of each document: (its score, its passage row)"""
+        if not len(doc_rows):
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        passages = [self.passages_of(int(row)) for row in doc_rows]
+        all_scores = np.asarray(vectors[np.concatenate(passages)], dtype='float32') @ query_embedding
+
+        best_scores, best_rows = [], []
+        start = 0
+        for rows in passages:
+            scores = all_scores[start:start + len(rows)]
+            best = int(np.argmax(scores))
+            best_scores.append(scores[best])
+            best_rows.append(rows[best])
+            start += len(rows)
+        return np.array(best_scores, dtype=np.float32), np.array(best_rows, dtype=np.int64)
+
+    def document_vector(self, vectors: np.ndarray, doc_row: int) -> np.ndarray:
+        """Normalized mean of a document's passage vectors (1 x d)"""
+        vector = np.asarray(vectors[self.passages_of(doc_row)], dtype='float32').mean(axis=0, keepdims=True)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
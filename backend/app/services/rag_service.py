@@ -1,7 +1,6 @@
 import os
 import logging
 from typing import List, Dict, Optional
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -20,6 +19,9 @@ class RAGService:
             self.model = None
         else:
             try:
+                # Import lent (~1 s) : uniquement si Gemini est configuré
+                import google.generativeai as genai
+                
                 genai.configure(api_key=self.api_key)
                 # Utiliser gemini-2.5-flash (rapide, gratuit, performant)
                 self.model = genai.GenerativeModel('gemini-2.5-flash')
@@ -56,53 +58,83 @@ class RAGService:
                 "sources_used": []
             }
         
+        context_docs = retrieved_docs[:max_docs]
         try:
-            # Préparer le contexte avec les meilleurs documents
-            context_docs = retrieved_docs[:max_docs]
-            context = self._build_context(context_docs)
-            
-            # Créer le prompt
-            prompt = self._create_prompt(query, context)
-            
-            # Générer la réponse avec configuration optimisée pour la vitesse
-            logger.info(f"Generating RAG response for query: {query}")
-            
-            # Configuration de génération pour réponses complètes
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "top_k": 40,
-                "max_output_tokens": 2048,  # Augmenté pour réponses complètes
-                "stop_sequences": None,
-            }
-            
+            prompt, generation_config = self._response_request(query, context_docs)
             response = self.model.generate_content(
                 prompt,
                 generation_config=generation_config,
                 request_options={'timeout': 90}  # Timeout augmenté à 90 secondes
             )
+            return self._response_result(response.text, context_docs)
             
-            return {
-                "response": response.text,
-                "sources_used": [
-                    {
-                        "doc_id": doc.get("doc_id"),
-                        "score": doc.get("score"),
-                        "excerpt": doc.get("text", "")[:200] + "..."
-                    }
-                    for doc in context_docs
-                ],
-                "num_sources": len(context_docs),
-                "error": None
-            }
+        except Exception as e:
+            return self._response_error(e, context_docs)
+    
+    async def generate_response_async(
+        self,
+        query: str,
+        retrieved_docs: List[Dict],
+        max_docs: int = 3
+    ) -> Dict[str, any]:
+        """Version non bloquante de generate_response (n'occupe pas la boucle asyncio)"""
+        if not self.is_available():
+            return self.generate_response(query, retrieved_docs, max_docs)
+        
+        context_docs = retrieved_docs[:max_docs]
+        try:
+            prompt, generation_config = self._response_request(query, context_docs)
+            response = await self.model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                request_options={'timeout': 90}
+            )
+            return self._response_result(response.text, context_docs)
             
         except Exception as e:
-            logger.error(f"Error generating RAG response: {e}")
-            return {
-                "response": f"Désolé, une erreur s'est produite lors de la génération de la réponse. Voici les documents pertinents que j'ai trouvés.",
-                "error": str(e),
-                "sources_used": [{"doc_id": doc.get("doc_id")} for doc in context_docs]
-            }
+            return self._response_error(e, context_docs)
+    
+    def _response_request(self, query: str, context_docs: List[Dict]):
+        """Prompt et configuration de génération d'une réponse RAG"""
+        context = self._build_context(context_docs)
+        
+        # Créer le prompt
+        prompt = self._create_prompt(query, context)
+        
+        logger.info(f"Generating RAG response for query: {query}")
+        
+        # Configuration de génération pour réponses complètes
+        generation_config = {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "top_k": 40,
+            "max_output_tokens": 2048,  # Augmenté pour réponses complètes
+            "stop_sequences": None,
+        }
+        return prompt, generation_config
+    
+    def _response_result(self, text: str, context_docs: List[Dict]) -> Dict[str, any]:
+        return {
+            "response": text,
+            "sources_used": [
+                {
+                    "doc_id": doc.get("doc_id"),
+                    "score": doc.get("score"),
+                    "excerpt": doc.get("text", "")[:200] + "..."
+                }
+                for doc in context_docs
+            ],
+            "num_sources": len(context_docs),
+            "error": None
+        }
+    
+    def _response_error(self, e: Exception, context_docs: List[Dict]) -> Dict[str, any]:
+        logger.error(f"Error generating RAG response: {e}")
+        return {
+            "response": f"Désolé, une erreur s'est produite lors de la génération de la réponse. Voici les documents pertinents que j'ai trouvés.",
+            "error": str(e),
+            "sources_used": [{"doc_id": doc.get("doc_id")} for doc in context_docs]
+        }
     
     def _build_context(self, docs: List[Dict]) -> str:
         """Construit le contexte à partir des documents récupérés"""
@@ -146,19 +178,7 @@ RÉPONSE COMPLÈTE EN FRANÇAIS:"""
             return "Service de résumé non disponible."
         
         try:
-            context = self._build_context(docs[:top_n])
-            
-            prompt = f"""Résume en 2 phrases (français) ces documents médicaux:
-
-{context}
-
-Résumé:"""
-            
-            generation_config = {
-                "temperature": 0.5,
-                "max_output_tokens": 150,
-            }
-            
+            prompt, generation_config = self._summary_request(docs, top_n)
             response = self.model.generate_content(
                 prompt, 
                 generation_config=generation_config,
@@ -170,6 +190,40 @@ Résumé:"""
             logger.error(f"Error generating summary: {e}")
             return "Impossible de générer un résumé pour le moment."
     
+    async def generate_summary_async(self, docs: List[Dict], top_n: int = 5) -> str:
+        """Version non bloquante de generate_summary"""
+        if not self.is_available():
+            return "Service de résumé non disponible."
+        
+        try:
+            prompt, generation_config = self._summary_request(docs, top_n)
+            response = await self.model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                request_options={'timeout': 30}
+            )
+            return response.text
+            
+        except Exception as e:
+            logger.error(f"Error generating summary: {e}")
+            return "Impossible de générer un résumé pour le moment."
+    
+    def _summary_request(self, docs: List[Dict], top_n: int):
+        """Prompt et configuration de génération d'un résumé"""
+        context = self._build_context(docs[:top_n])
+        
+        prompt = f"""Résume en 2 phrases (français) ces documents médicaux:
+
+{context}
+
+Résumé:"""
+        
+        generation_config = {
+            "temperature": 0.5,
+            "max_output_tokens": 150,
+        }
+        return prompt, generation_config
+    
     def translate_and_simplify(self, text: str) -> str:
         """Traduit et simplifie un texte médical technique en français accessible"""
         if not self.is_available():
@@ -0,0 +1,75 @@
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class RerankCalibrator:
+    """Upper bound on the cross-encoder score given the first-stage score.
+
+    Collects (first-stage, cross-encoder) score pairs seen while reranking
+    and fits ``ce ~ slope * score + intercept``. The bound adds the chosen
+    quantile of the residuals, so a candidate whose bound is below the
+    current k-th best rerank score is unlikely to enter the top-k. Until
+    ``min_samples`` pairs have been seen the bound is unknown (None).
+    """
+
+    def __init__(
+        self,
+        min_samples: int = 500,
+        quantile: float = 0.99,
+        max_samples: int = 20000,
+        refit_every: int = 256
+    ):
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.max_samples = max_samples
+        self.refit_every = refit_every
+        self._scores = np.zeros(max_samples, dtype=np.float32)
+        self._rerank_scores = np.zeros(max_samples, dtype=np.float32)
+        self._count = 0
+        self._since_fit = 0
+        self._params = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._params is not None
+
+    @property
+    def num_samples(self) -> int:
+        return min(self._count, self.max_samples)
+
+    def observe(self, scores, rerank_scores):
+        """Record pairs (ring buffer) and refit periodically"""
+        with self._lock:
+            for score, rerank_score in zip(scores, rerank_scores):
+                slot = self._count % self.max_samples
+                self._scores[slot] = score
+                self._rerank_scores[slot] = rerank_score
+                self._count += 1
+            self._since_fit += len(scores)
+            if self.num_samples >= self.min_samples and (
+                self._params is None or self._since_fit >= self.refit_every
+            ):
+                self._fit()
+
+    def _fit(self):
+        n = self.num_samples
+        x, y = self._scores[:n], self._rerank_scores[:n]
+        if np.ptp(x) > 0:
+            slope, intercept = np.polyfit(x, y, 1)
+        else:
+            slope, intercept = 0.0, float(y.mean())
+        margin = float(np.quantile(y - (slope * x + intercept), self.quantile))
+        self._params = (float(slope), float(intercept), margin)
+        self._since_fit = 0
+
+    def bound(self, first_score: float, last_score: float) -> Optional[float]:
+        """Highest plausible rerank score for candidates whose first-stage
+        scores lie between ``last_score`` and ``first_score``"""
+        if self._params is None:
+            return None
+        slope, intercept, margin = self._params
+        # Linear bound: the maximum over an interval is at one of its ends
+        return max(slope * first_score, slope * last_score) + intercept + margin
@@ -1,131 +1,966 @@
 import numpy as np
-import faiss
-import pickle
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-from sentence_transformers import SentenceTransformer, CrossEncoder
-import pandas as pd
+from typing import List, Dict, Tuple, Optional, Sequence
 import logging
 
+from app.services.cache import LRUCache, normalize_query
+from app.services.batching import MicroBatcher
+from app.services.document_store import DocumentStore
+from app.services.filters import FilterSelection
+from app.services.onnx_backend import OnnxCrossEncoder, OnnxQueryEncoder
+from app.services.passages import PassageStore
+from app.services.reranking import RerankCalibrator
+from app.services.sharding import SHARDS_DIR, ShardedIndex
+from app.services.snapshots import active_dir, current_version, read_manifest, snapshot_dir, verify_snapshot
+from app.services.sparse_index import BM25Index, reciprocal_rank_fusion, top_k_rows, weighted_fusion
+from app.services.vector_store import VectorStore
+from app.services.index_factory import (
+    apply_default_search_parameters,
+    exact_rescore,
+    exact_search,
+    id_selector,
+    is_binary_index,
+    is_compressed_index,
+    read_index,
+    read_index_version,
+    search_index,
+    search_parameters
+)
+from app.utils.config import load_config
+from app.utils.locks import ReadWriteLock
+from app.utils.threads import configure_threads, thread_budget, thread_report
+
 logger = logging.getLogger(__name__)
 
+class SearchCancelled(Exception):
+    """Raised when a search is cancelled through its ``cancel_event``"""
+
+def _check_cancelled(cancel_event: Optional[threading.Event]):
+    if cancel_event is not None and cancel_event.is_set():
+        raise SearchCancelled()
+
 class SemanticSearchEngine:
     def __init__(self, config_path: Optional[str] = None):
-        self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        self.config = load_config(config_path)
+        self.faiss_config = self.config.get('faiss', {})
+        self.search_config = self.config.get('search', {})
+        self.use_mmap = self.config.get('storage', {}).get('mmap', False)
+        self.runtime_config = self.config.get('runtime', {})
+        self.startup_config = self.config.get('startup', {})
+        self.chunking_config = self.config.get('chunking', {})
+        self.snapshot_config = self.config.get('snapshots', {})
+        self.sharding_config = self.config.get('sharding', {})
+        model_config = self.config.get('model', {})
+        self.model_name = model_config.get('encoder', "sentence-transformers/all-MiniLM-L6-v2")
+        self.cross_encoder_name = model_config.get('cross_encoder', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        # Identifies the scores of the loaded reranker (backend included) in the pair-score cache
+        self.reranker_id = self.cross_encoder_name
         self.encoder = None
+        self._document_encoder = None  # see document_encoder
         self.cross_encoder = None
         self.index = None
-        self.doc_ids = None
-        self.documents = None
-        self.embeddings = None
+        self.doc_store = None
+        self.vectors = None
+        self.sparse_index = None
+        self.passages = None  # set when the index holds passages instead of documents
+        self.index_version = None
+        # Searches read the components above under the read side, updates swap them under the write side
+        self.components_lock = ReadWriteLock()
+        
+        # Served snapshot (see app.services.snapshots) and hot reload state
+        self.index_dir = None
+        self.snapshot_manifest = None
+        self.snapshot_loaded_at = None
+        self.snapshot_error = None
+        self._failed_snapshot = None
+        self.snapshot_lock = threading.Lock()  # held while the served snapshot changes
+        # Set by an IndexUpdater whose changes are not published yet: no reload meanwhile
+        self.publish_pending = False
+        self._watch_stop = threading.Event()
+        self._watch_thread = None
+        
+        # Cold-start bookkeeping (see start_loading / startup_stats)
+        self.load_started_at = None
+        self.ready_after = {}
+        self.stage_seconds = {}
+        self.load_errors = {}
+        self.first_query_after = None
+        
+        cache_config = self.config.get('cache', {})
+        self.query_cache = LRUCache(cache_config.get('query_embedding_size', 4096))
+        self.rerank_cache = LRUCache(cache_config.get('rerank_score_size', 100000))
+        
+        # One calibrator per first-stage score scale (dense cosine vs hybrid fusion)
+        self.rerank_calibrators = {
+            hybrid: RerankCalibrator(
+                min_samples=self.search_config.get('rerank_calibration_samples', 500),
+                quantile=self.search_config.get('rerank_bound_quantile', 0.99)
+            )
+            for hybrid in (False, True)
+        }
+        
+        # Coalesce the model calls of concurrent requests into shared batches
+        batching_config = self.config.get('batching', {})
+        self.encode_batcher = None
+        self.rerank_batcher = None
+        if batching_config.get('enabled', False):
+            max_wait_ms = batching_config.get('max_wait_ms', 5)
+            self.encode_batcher = MicroBatcher(
+                lambda texts: self.encoder.encode(texts, normalize_embeddings=True),
+                max_batch_size=batching_config.get('max_encode_batch_size', 64),
+                max_wait_ms=max_wait_ms,
+                name="encode-batcher"
+            )
+            self.rerank_batcher = MicroBatcher(
+                lambda pairs: self.cross_encoder.predict(pairs),
+                max_batch_size=batching_config.get('max_rerank_batch_size', 128),
+                max_wait_ms=max_wait_ms,
+                name="rerank-batcher"
+            )
         
         # Get project root (go up from backend/app/services to project root)
         project_root = Path(__file__).parent.parent.parent.parent
         self.models_dir = project_root / "models"
         self.data_dir = project_root / "data" / "processed"
         
-    def load(self):
-        """Load all necessary models and data"""
-        logger.info("Loading sentence transformer...")
-        self.encoder = SentenceTransformer(self.model_name)
+    def load(self, stages: Optional[Sequence[str]] = None):
+        """Load all necessary models and data (blocks until everything is loaded)"""
+        for future in self.start_loading(stages):
+            future.result()
+    
+    def start_loading(self, stages: Optional[Sequence[str]] = None) -> List[Future]:
+        """Start loading the components and return one future per stage.
         
-        logger.info("Loading cross-encoder for reranking...")
-        self.cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+        Encoder, cross-encoder, FAISS index and documents load in parallel
+        (startup.parallel_loading) and the models are warmed up with a dummy
+        encode / rerank before being published. ``readiness()`` tells which
+        components can be used: dense search only needs the encoder, the
+        index and the documents. ``stages`` limits loading to some of the
+        components (e.g. offline tools that do not rerank).
+        """
+        configure_threads(self.runtime_config)
+        self.load_started_at = time.time()
+        # Resolved once: the index and documents stages must read the same snapshot
+        self.index_dir = active_dir(self.models_dir)
+        all_stages = {
+            'encoder': self._load_encoder_stage,
+            'index': self._load_index_stage,
+            'documents': self._load_documents_stage,
+            'cross_encoder': self._load_cross_encoder_stage
+        }
+        stages = {name: stage for name, stage in all_stages.items() if stages is None or name in stages}
         
-        logger.info("Loading FAISS index...")
-        index_path = self.models_dir / "index.faiss"
-        if index_path.exists():
-            self.index = faiss.read_index(str(index_path))
-        else:
-            logger.warning("FAISS index not found. Please run indexing first.")
+        if not self.startup_config.get('parallel_loading', True):
+            futures = []
+            for name, stage in stages.items():
+                future = Future()
+                try:
+                    future.set_result(self._run_stage(name, stage))
+                except Exception as e:
+                    future.set_exception(e)
+                futures.append(future)
+            return futures
         
+        executor = ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="load")
+        futures = [executor.submit(self._run_stage, name, stage) for name, stage in stages.items()]
+        executor.shutdown(wait=False)
+        return futures
+    
+    def _run_stage(self, name: str, stage):
+        stage_start = time.time()
+        try:
+            stage()
+        except Exception as e:
+            self.load_errors[name] = str(e)
+            logger.error(f"Failed to load {name}: {e}")
+            raise
+        self.stage_seconds[name] = time.time() - stage_start
+        self.ready_after[name] = time.time() - self.load_started_at
+        logger.info(f"{name} ready after {self.ready_after[name]:.2f}s")
+    
+    def _load_encoder_stage(self):
+        logger.info("Loading sentence transformer...")
+        encoder = self._load_encoder()
+        if self.startup_config.get('warmup', True):
+            # First call pays for lazy initialization (kernels, allocator, graph optimization)
+            encoder.encode(["warmup query"], normalize_embeddings=True)
+        self.encoder = encoder
+    
+    def _load_cross_encoder_stage(self):
+        logger.info("Loading cross-encoder for reranking...")
+        cross_encoder = self._load_cross_encoder()
+        if self.startup_config.get('warmup', True):
+            cross_encoder.predict([["warmup query", "warmup document"]])
+        self.cross_encoder = cross_encoder
+    
+    def _load_index_stage(self):
+        logger.info(f"Loading FAISS index from {self.index_dir}...")
+        loaded = self._read_index(self.index_dir)
+        if loaded is None:
+            logger.warning("FAISS index not found. Please run indexing first.")
+            return
+        index, vectors, self.index_version = loaded
+        logger.info(f"Index version: {self.index_version}")
+        self.snapshot_manifest = read_manifest(self.index_dir)
+        self.snapshot_loaded_at = time.time()
+        # Vectors first: the index is published last, once everything it needs is there
+        self.vectors = vectors
+        self.index = index
+    
+    def _load_documents_stage(self):
         logger.info("Loading documents...")
+        loaded = self._read_documents(self.index_dir)
+        if loaded is None:
+            logger.warning("Documents file not found.")
+            return
+        self.sparse_index, self.passages, self.doc_store = loaded
+    
+    def _read_index(self, directory: Path) -> Optional[Tuple[object, Optional[VectorStore], str]]:
+        """(index, vectors, version) stored in ``directory``, None if it has no index"""
+        index_path = directory / "index.faiss"
+        if ShardedIndex.exists(directory / SHARDS_DIR):
+            # Built with sharding.num_shards > 1: searched scatter-gather
+            index = ShardedIndex.load(
+                directory / SHARDS_DIR,
+                self.faiss_config,
+                executor=self.sharding_config.get('executor', 'threads'),
+                mmap=self.use_mmap,
+                threads_per_shard=self.sharding_config.get('threads_per_shard')
+            )
+            logger.info(f"Sharded index: {len(index.shards)} shards ({index.executor})")
+        elif index_path.exists():
+            index = read_index(str(index_path), mmap=self.use_mmap)
+            apply_default_search_parameters(index, self.faiss_config)
+        else:
+            return None
+        return index, self._load_vectors(index, directory), read_index_version(directory)
+    
+    def _read_documents(self, directory: Path) -> Optional[Tuple[Optional[BM25Index], Optional[PassageStore], DocumentStore]]:
+        """(BM25 index, passages, document store) matching the index in ``directory``"""
         docs_path = self.data_dir / "docs.csv"
-        if docs_path.exists():
-            # Force doc_id to be string
-            self.documents = pd.read_csv(docs_path)
-            self.documents['doc_id'] = self.documents['doc_id'].astype(str)
-            self.doc_ids = self.documents['doc_id'].tolist()
-            logger.info(f"Loaded {len(self.documents)} documents")
+        docstore_dir = directory / "docstore"
+        if DocumentStore.exists(docstore_dir):
+            # Columnar copy written by build_index.py, row-aligned with the index
+            doc_store = DocumentStore.load(docstore_dir, mmap_mode='r' if self.use_mmap else None)
+        elif docs_path.exists():
+            import pandas as pd
+            
+            doc_store = DocumentStore.from_dataframe(pd.read_csv(docs_path))
         else:
-            logger.warning("Documents file not found.")
+            return None
+        logger.info(f"Loaded {len(doc_store)} documents")
+        # Per-value rows of source / focus_area, built before the first filtered query
+        logger.info(f"Filterable columns: {sorted(doc_store.metadata_index.rows_by_value)}")
+        sparse_index = self._load_sparse_index(doc_store, directory)
+        passages = None
+        passages_dir = directory / "passages"
+        if PassageStore.exists(passages_dir):
+            # Written by build_index.py with chunking.enabled: index rows are passages
+            passages = PassageStore.load(passages_dir, mmap_mode='r' if self.use_mmap else None)
+            logger.info(f"Passage index: {len(passages)} passages")
+        return sparse_index, passages, doc_store
+    
+    def reload_snapshot(self) -> bool:
+        """Load the snapshot named by models/CURRENT if it is not the one served, and swap it in.
         
-        logger.info("Loading embeddings...")
-        embeddings_path = self.models_dir / "embeddings.npy"
-        if embeddings_path.exists():
-            self.embeddings = np.load(str(embeddings_path))
+        The new components are loaded (and their checksums verified) while
+        searches continue on the current ones; the swap itself waits for the
+        in-flight searches to finish. Returns True if a new snapshot was
+        swapped in. A snapshot that fails to load is not retried until
+        CURRENT changes again. Nothing is reloaded while changes of this
+        process's IndexUpdater wait to be published (``publish_pending``).
+        """
+        # Not before the initial load: it may be reading the same components
+        if not all(stage in self.ready_after or stage in self.load_errors for stage in ('index', 'documents')):
+            return False
+        version = current_version(self.models_dir)
+        if version is None or version in (self.index_version, self._failed_snapshot) or self.publish_pending:
+            return False
+        
+        with self.snapshot_lock:
+            # Re-read: an update of this process may have published meanwhile
+            version = current_version(self.models_dir)
+            if version is None or version in (self.index_version, self._failed_snapshot) or self.publish_pending:
+                return False
+            directory = snapshot_dir(self.models_dir, version)
+            try:
+                if self.snapshot_config.get('verify_checksums', True):
+                    verify_snapshot(directory)
+                loaded_index = self._read_index(directory)
+                loaded_documents = self._read_documents(directory)
+                if loaded_index is None or loaded_documents is None:
+                    raise ValueError("incomplete snapshot")
+                index, vectors, _ = loaded_index
+                sparse_index, passages, doc_store = loaded_documents
+            except Exception as e:
+                self._failed_snapshot = version
+                self.snapshot_error = f"{version}: {e}"
+                logger.error(f"Failed to load index snapshot {version}: {e}")
+                return False
+            
+            previous_index = self.index
+            with self.components_lock.write():
+                self.index, self.vectors = index, vectors
+                self.sparse_index, self.passages, self.doc_store = sparse_index, passages, doc_store
+                self.index_version = version
+                self.index_dir = directory
+            if isinstance(previous_index, ShardedIndex):
+                previous_index.close()  # no search uses it any more: stop its shard workers
+            self.snapshot_manifest = read_manifest(directory)
+            self.snapshot_loaded_at = time.time()
+            self.snapshot_error = None
+            # Scores cached for a doc_id may be for a text the new snapshot changed
+            self.rerank_cache.clear()
+        logger.info(f"Swapped in index snapshot {version} ({doc_store.num_live} documents)")
+        return True
+    
+    def watch_snapshots(self, interval: Optional[float] = None) -> threading.Thread:
+        """Poll models/CURRENT in a background thread and hot-reload new snapshots"""
+        interval = interval or self.snapshot_config.get('poll_interval_s', 5)
+        
+        def watch():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload_snapshot()
+                except Exception as e:  # keep watching: the next snapshot may load
+                    logger.error(f"Snapshot watcher error: {e}")
         
-        logger.info("Search engine loaded successfully")
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=watch, name="snapshot-watcher", daemon=True)
+        self._watch_thread.start()
+        return self._watch_thread
+    
+    def stop_watching(self):
+        self._watch_stop.set()
+    
+    def snapshot_info(self) -> Dict:
+        """Served index version, and the one CURRENT points to (differs while a reload is pending)"""
+        manifest = self.snapshot_manifest or {}
+        return {
+            'version': self.index_version,
+            'current': current_version(self.models_dir),
+            'directory': str(self.index_dir) if self.index_dir is not None else None,
+            'created_at': manifest.get('created_at'),
+            'num_documents': manifest.get('num_documents'),
+            'loaded_at': self.snapshot_loaded_at,
+            'error': self.snapshot_error
+        }
+    
+    def readiness(self) -> Dict[str, bool]:
+        """Which components are loaded (and warmed up), and what they allow"""
+        components = {
+            'encoder': self.encoder is not None,
+            'index': self.index is not None,
+            'documents': self.doc_store is not None,
+            'cross_encoder': self.cross_encoder is not None
+        }
+        components['dense_search'] = components['encoder'] and components['index'] and components['documents']
+        components['reranking'] = components['dense_search'] and components['cross_encoder']
+        return components
+    
+    def ready_for_search(self) -> bool:
+        return self.readiness()['dense_search']
+    
+    def startup_stats(self) -> Dict:
+        """Cold-start timings (seconds since ``start_loading``)"""
+        return {
+            'ready_after_seconds': dict(self.ready_after),
+            'stage_seconds': dict(self.stage_seconds),
+            'first_query_after_seconds': self.first_query_after,
+            'errors': dict(self.load_errors)
+        }
+    
+    def _load_encoder(self):
+        """SentenceTransformer, or its exported ONNX transformer (model.encoder_backend: onnx)"""
+        model_config = self.config.get('model', {})
+        if model_config.get('encoder_backend', 'torch') == 'onnx':
+            quantized = model_config.get('encoder_onnx_quantized', False)
+            try:
+                encoder = OnnxQueryEncoder(
+                    self.models_dir / "onnx" / "encoder",
+                    quantized=quantized,
+                    num_threads=thread_budget(self.runtime_config, 'onnx')
+                )
+                logger.info(f"Using ONNX query encoder ({'int8' if quantized else 'fp32'})")
+                return encoder
+            except (ImportError, OSError) as e:
+                logger.warning(f"ONNX query encoder unavailable ({e}). Run scripts/export_onnx.py. Using PyTorch.")
+        # Imported on first use: sentence-transformers pulls in torch and transformers (seconds)
+        from sentence_transformers import SentenceTransformer
+        
+        return SentenceTransformer(self.model_name)
+    
+    def document_encoder(self):
+        """Encoder of new documents: the SentenceTransformer build_index.py indexed
+        the corpus with. The ONNX query encoder (maybe int8) gives slightly
+        different vectors, so it only encodes queries; loaded on first use then."""
+        if not isinstance(self.encoder, OnnxQueryEncoder):
+            return self.encoder
+        if self._document_encoder is None:
+            from sentence_transformers import SentenceTransformer
+            
+            self._document_encoder = SentenceTransformer(self.model_name)
+        return self._document_encoder
+    
+    def _load_cross_encoder(self):
+        """PyTorch CrossEncoder, or its exported ONNX graph (model.reranker_backend: onnx)"""
+        model_config = self.config.get('model', {})
+        if model_config.get('reranker_backend', 'torch') == 'onnx':
+            quantized = model_config.get('onnx_quantized', True)
+            try:
+                cross_encoder = OnnxCrossEncoder(
+                    self.models_dir / "onnx" / "cross_encoder",
+                    quantized=quantized,
+                    num_threads=thread_budget(self.runtime_config, 'onnx')
+                )
+                self.reranker_id = f"{self.cross_encoder_name}:onnx{'-int8' if quantized else ''}"
+                logger.info(f"Using ONNX reranker ({'int8' if quantized else 'fp32'})")
+                return cross_encoder
+            except (ImportError, OSError) as e:
+                logger.warning(f"ONNX reranker unavailable ({e}). Run scripts/export_onnx.py. Using PyTorch.")
+        from sentence_transformers import CrossEncoder
+        
+        return CrossEncoder(self.cross_encoder_name)
+    
+    def _load_vectors(self, index, directory: Path) -> Optional[VectorStore]:
+        """Single copy of the document vectors for re-scoring and similarity lookups"""
+        if index is not None:
+            vectors = VectorStore.from_index(index)
+            if vectors is not None:
+                logger.info("Using the index storage as vector store (embeddings.npy not loaded)")
+                return vectors
+        
+        logger.info("Loading embeddings...")
+        embeddings_path = directory / "embeddings.npy"
+        if not embeddings_path.exists():
+            return None
+        # A compressed index only needs the float vectors of its re-scoring
+        # candidates: memory-map them instead of holding a full copy in RAM
+        compressed = index is not None and self._is_compressed(index)
+        return VectorStore.from_file(embeddings_path, mmap=self.use_mmap or compressed)
+    
+    def _load_sparse_index(self, doc_store: Optional[DocumentStore], directory: Path) -> Optional[BM25Index]:
+        """BM25 index for hybrid search (built from the document store if missing)"""
+        bm25_dir = directory / "bm25"
+        if BM25Index.exists(bm25_dir):
+            logger.info("Loading BM25 index...")
+            return BM25Index.load(bm25_dir, mmap_mode='r' if self.use_mmap else None)
+        if doc_store is None:
+            return None
+        logger.info("BM25 index not found, building it from the documents...")
+        return BM25Index.build(doc_store.texts[row] for row in range(len(doc_store)))
     
     def encode_query(self, query: str) -> np.ndarray:
         """Encode a query into an embedding"""
-        embedding = self.encoder.encode([query], normalize_embeddings=True)
-        return embedding.astype('float32')
+        return self.encode_queries([query])
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode several queries in a single encoder call.
+        
+        Embeddings are cached by normalized query; only cache misses (each
+        distinct one once) go through the encoder.
+        """
+        keys = [normalize_query(q) for q in queries]
+        cached = {}
+        for key in keys:
+            if key not in cached:
+                cached[key] = self.query_cache.get(key)
+        
+        missing = [key for key, embedding in cached.items() if embedding is None]
+        if missing:
+            if self.encode_batcher is not None:
+                embeddings = self.encode_batcher.submit(missing)
+            else:
+                embeddings = self.encoder.encode(missing, normalize_embeddings=True)
+            for key, embedding in zip(missing, np.asarray(embeddings, dtype='float32')):
+                cached[key] = embedding
+                self.query_cache.put(key, embedding)
+        
+        return np.stack([cached[key] for key in keys])
+    
+    def _score_pairs(self, pairs: List[Tuple[str, Dict]]):
+        """Set 'rerank_score' on each (query, result) pair.
+        
+        Scores are cached by (normalized query, doc_id, model); only the
+        uncached pairs are sent to the cross-encoder, in a single call.
+        """
+        missing = []
+        for query, r in pairs:
+            # Passage index: the document's best passage is scored, not its full text
+            key = (normalize_query(query), r['doc_id'], self.reranker_id, r.get('passage'))
+            score = self.rerank_cache.get(key)
+            if score is None:
+                missing.append((query, r, key))
+            else:
+                r['rerank_score'] = score
+        
+        if not missing:
+            return
+        texts = [[query, r.get('passage', r['text'])] for query, r, _ in missing]
+        if self.rerank_batcher is not None:
+            scores = self.rerank_batcher.submit(texts)
+        else:
+            scores = self.cross_encoder.predict(texts)
+        for (_, r, key), score in zip(missing, scores):
+            r['rerank_score'] = float(score)
+            self.rerank_cache.put(key, float(score))
+    
+    def thread_stats(self) -> Dict:
+        """Thread pools of torch, FAISS and BLAS in this process"""
+        return thread_report()
+    
+    def batching_stats(self) -> Dict:
+        """Batch sizes achieved by the micro-batchers (empty when disabled)"""
+        stats = {}
+        if self.encode_batcher is not None:
+            stats['encode'] = self.encode_batcher.stats()
+        if self.rerank_batcher is not None:
+            stats['rerank'] = self.rerank_batcher.stats()
+        return stats
+    
+    def shard_stats(self) -> Optional[List[Dict]]:
+        """Per-shard latency of a sharded index (None otherwise)"""
+        index = self.index
+        return index.stats() if isinstance(index, ShardedIndex) else None
+    
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters of the engine caches"""
+        rerank_stats = self.rerank_cache.stats()
+        rerank_stats['pairs_saved'] = rerank_stats['hits']
+        return {
+            'query_embedding': self.query_cache.stats(),
+            'rerank_score': rerank_stats
+        }
     
     def search(
         self, 
         query: str, 
         top_k: int = 10, 
         use_reranking: bool = True,
-        hybrid: bool = False
+        hybrid: bool = False,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_budget_ms: Optional[float] = None,
+        stats: Optional[Dict] = None,
+        cancel_event: Optional[threading.Event] = None,
+        filters: Optional[Dict] = None
     ) -> Tuple[List[Dict], float]:
         """Search for documents matching the query"""
+        batch_stats = {} if stats is not None else None
+        batch_results, timings = self.search_batch(
+            [query],
+            top_k=top_k,
+            use_reranking=use_reranking,
+            hybrid=hybrid,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            rerank_budget_ms=rerank_budget_ms,
+            stats=batch_stats,
+            cancel_event=cancel_event,
+            filters=filters
+        )
+        if stats is not None:
+            stats.update({key: values[0] for key, values in batch_stats.items()})
+            stats['timings'] = timings
+        return batch_results[0], timings['total']
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        use_reranking: bool = True,
+        hybrid: bool = False,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_budget_ms: Optional[float] = None,
+        stats: Optional[Dict] = None,
+        cancel_event: Optional[threading.Event] = None,
+        filters: Optional[Dict] = None
+    ) -> Tuple[List[List[Dict]], Dict[str, float]]:
+        """Search for several queries at once.
+        
+        All queries are encoded in one call, searched with one matrix
+        ``index.search`` and reranked together, one cross-encoder call per
+        reranking round (see ``_rerank``).
+        ``nprobe`` / ``ef_search`` override the configured IVF / HNSW
+        query-time defaults for this call only.
+        Returns the results of each query and the per-stage timings (seconds).
+        If ``stats`` is given it is filled with per-query lists
+        ('pairs_scored', 'early_exit', 'reranked', and 'index_version' of the
+        components that answered). Reranking is skipped
+        (reranked False) while the cross-encoder is still loading.
+        Setting ``cancel_event`` (e.g. client gone) stops the search between
+        stages and reranking rounds with ``SearchCancelled``.
+        ``filters`` restricts every stage to the matching documents (see
+        ``filters.filter_key`` for the format and ``_dense_search``).
+        With a passage index, hits are aggregated per document and each
+        result carries its best 'passage', which is what gets reranked.
+        """
+        timings = {}
         start_time = time.time()
+        # Dense-only while the cross-encoder is still loading
+        reranked = use_reranking and self.cross_encoder is not None
         
-        # Encode query
-        query_embedding = self.encode_query(query)
+        # Encode queries
+        stage_start = time.time()
+        query_embeddings = self.encode_queries(queries)
+        timings['encode'] = time.time() - stage_start
+        _check_cancelled(cancel_event)
         
-        # Search in FAISS
-        k = top_k * 3 if use_reranking else top_k
-        distances, indices = self.index.search(query_embedding, k)
-        
-        # Get results
-        results = []
-        for i, (idx, score) in enumerate(zip(indices[0], distances[0])):
-            if idx < len(self.doc_ids):
-                doc_id = self.doc_ids[idx]
-                doc_row = self.documents[self.documents['doc_id'] == doc_id].iloc[0]
-                result = {
-                    'doc_id': str(doc_id),  # Ensure doc_id is always string
-                    'text': str(doc_row['text']),
-                    'score': float(score),
-                    'rank': i + 1
-                }
-                # Add optional metadata if available
-                if 'source' in doc_row:
-                    result['source'] = str(doc_row['source'])
-                if 'focus_area' in doc_row:
-                    result['focus_area'] = str(doc_row['focus_area'])
-                    
-                results.append(result)
+        # Candidates: index, vectors and documents must come from the same
+        # version while the index is being updated (see index_updates)
+        k = self._rerank_depths(top_k)[1] if reranked else top_k
+        with self.components_lock.read():
+            index_version = self.index_version
+            batch_results = self._retrieve(
+                queries, query_embeddings, k, timings,
+                hybrid=hybrid, nprobe=nprobe, ef_search=ef_search, filters=filters, cancel_event=cancel_event
+            )
         
         # Reranking with CrossEncoder
-        if use_reranking and len(results) > 0:
-            pairs = [[query, r['text']] for r in results]
-            rerank_scores = self.cross_encoder.predict(pairs)
+        if reranked:
+            stage_start = time.time()
+            batch_results, rerank_stats = self._rerank(
+                queries, batch_results, top_k, hybrid=hybrid, budget_ms=rerank_budget_ms,
+                cancel_event=cancel_event
+            )
+            timings['rerank'] = time.time() - stage_start
+        else:
+            batch_results = [results[:top_k] for results in batch_results]
+            rerank_stats = {'pairs_scored': [0] * len(queries), 'early_exit': [False] * len(queries)}
+        rerank_stats['reranked'] = [reranked] * len(queries)
+        rerank_stats['index_version'] = [index_version] * len(queries)
+        if stats is not None:
+            stats.update(rerank_stats)
+        
+        timings['total'] = time.time() - start_time
+        if self.first_query_after is None and self.load_started_at is not None:
+            self.first_query_after = time.time() - self.load_started_at
+            logger.info(f"Cold start: first query served {self.first_query_after:.2f}s after loading started")
+        
+        return batch_results, timings
+    
+    def _retrieve(
+        self,
+        queries: List[str],
+        query_embeddings: np.ndarray,
+        k: int,
+        timings: Dict[str, float],
+        hybrid: bool = False,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[List[Dict]]:
+        """First stage (dense, passages, hybrid) and fetch: top-k results per query"""
+        # Rows allowed by the metadata filters and tombstones (cached per distinct filter)
+        stage_start = time.time()
+        selection = self.doc_store.metadata_index.select(filters)
+        if selection is not None:
+            timings['filter'] = time.time() - stage_start
+        
+        # Search in FAISS
+        stage_start = time.time()
+        best_passages = None
+        if self.passages is None:
+            distances, indices = self._dense_search(
+                query_embeddings, k, nprobe=nprobe, ef_search=ef_search, selection=selection, timings=timings
+            )
+        else:
+            distances, indices, best_passages = self._passage_search(
+                query_embeddings, k, nprobe=nprobe, ef_search=ef_search, selection=selection, timings=timings
+            )
+        timings['search'] = time.time() - stage_start
+        
+        # Lexical (BM25) candidates fused with the dense ones
+        if hybrid and self.sparse_index is not None:
+            stage_start = time.time()
+            distances, indices, best_passages = self._hybrid_search(
+                queries, query_embeddings, distances, indices, k, selection=selection
+            )
+            timings['sparse'] = time.time() - stage_start
+        
+        _check_cancelled(cancel_event)
+        
+        # Get results (O(k): hits are row positions in the document store)
+        stage_start = time.time()
+        batch_results = [
+            self.doc_store.results(ids, scores)
+            for ids, scores in zip(indices, distances)
+        ]
+        if best_passages is not None:
+            for results, passage_rows in zip(batch_results, best_passages):
+                for r, passage_row in zip(results, passage_rows[passage_rows >= 0]):
+                    r['passage'] = self.passages.texts[int(passage_row)]
+        timings['fetch'] = time.time() - stage_start
+        return batch_results
+    
+    def _dense_search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        selection: Optional[FilterSelection] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """First-stage search, restricted to the rows of ``selection``.
+        
+        Filtering happens inside the FAISS scan (``IDSelectorBitmap``), so a
+        filter never shrinks the top-k. Narrow filters (up to
+        ``search.filter_exact_max_rows`` rows) skip the ANN index for an
+        exact scan of the allowed vectors, which is cheaper and complete;
+        so do binary indexes (no selector support) and queries the ANN
+        search could not fill (allowed rows outside the visited HNSW graph
+        or IVF lists).
+        """
+        vectors = self.vectors.matrix if self.vectors is not None else None
+        if selection is None:
+            return self._index_search(query_embeddings, k, nprobe, ef_search, timings=timings)
+        
+        exact_max_rows = self.search_config.get('filter_exact_max_rows', 4096)
+        if vectors is not None and (len(selection) <= exact_max_rows or is_binary_index(self.index)):
+            return exact_search(vectors, query_embeddings, selection.rows, k)
+        if is_binary_index(self.index):
+            raise ValueError("Filtered search on a binary index requires embeddings.npy")
+        
+        distances, indices = self._index_search(query_embeddings, k, nprobe, ef_search, selection, timings)
+        short = np.flatnonzero((indices >= 0).sum(axis=1) < min(k, len(selection)))
+        if len(short) and vectors is not None:
+            distances[short], indices[short] = exact_search(vectors, query_embeddings[short], selection.rows, k)
+        return distances, indices
+    
+    def _index_search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        selection: Optional[FilterSelection] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ANN search of the index (of every shard, merged, for a sharded
+        index), with exact re-scoring of compressed indexes"""
+        vectors = self.vectors.matrix if self.vectors is not None else None
+        rescore_candidates = self._rescore_candidates()
+        if isinstance(self.index, ShardedIndex):
+            num_candidates = max(k, rescore_candidates)
+            distances, indices = self.index.search(
+                query_embeddings, num_candidates, nprobe, ef_search, selection=selection, timings=timings
+            )
+            if not rescore_candidates:
+                return distances, indices
+            # Candidates of all shards re-scored together: one exact ranking
+            return exact_rescore(vectors, query_embeddings, indices, k)
+        
+        selector = id_selector(selection.bitmap) if selection is not None else None
+        return search_index(
+            self.index,
+            query_embeddings,
+            k,
+            params=search_parameters(self.index, nprobe=nprobe, ef_search=ef_search, selector=selector),
+            vectors=vectors,
+            rescore_candidates=rescore_candidates
+        )
+    
+    def _passage_search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        selection: Optional[FilterSelection] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Dense search over passages, aggregated into the top-k documents
+        (chunking.aggregation: max or sum of their passage scores).
+        
+        Returns document scores, document rows and best passage rows.
+        """
+        if selection is not None:
+            selection = self.passages.select(selection)
+        # Several passages of a document can be hits: retrieve more than k
+        num_passages = k * self.chunking_config.get('passage_candidates_factor', 3)
+        scores, rows = self._dense_search(
+            query_embeddings, num_passages, nprobe=nprobe, ef_search=ef_search, selection=selection, timings=timings
+        )
+        return self.passages.aggregate(scores, rows, k, self.chunking_config.get('aggregation', 'max'))
+    
+    def _hybrid_search(
+        self,
+        queries: List[str],
+        query_embeddings: np.ndarray,
+        dense_scores: np.ndarray,
+        dense_rows: np.ndarray,
+        k: int,
+        selection: Optional[FilterSelection] = None
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Fuse dense hits with BM25 hits (search.hybrid_fusion: weighted or rrf).
+        
+        Both scores are computed for the union of the candidates: BM25 from
+        its full score array, dense exactly from the vector store (with a
+        passage index: the score of the document's best passage). BM25
+        candidates are limited to the rows of ``selection``.
+        Returns fused scores, rows and best passage rows (None without
+        passage index).
+        """
+        fusion = self.search_config.get('hybrid_fusion', 'weighted')
+        alpha = self.search_config.get('hybrid_alpha', 0.5)
+        
+        fused_scores = np.zeros((len(queries), k), dtype=np.float32)
+        fused_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        fused_passages = np.full((len(queries), k), -1, dtype=np.int64) if self.passages is not None else None
+        for i, query in enumerate(queries):
+            sparse_all = self.sparse_index.scores(query)
+            if selection is not None:
+                sparse_all = np.where(selection.mask, sparse_all, 0.0)
+            valid = dense_rows[i] >= 0
+            candidates = np.union1d(dense_rows[i][valid], top_k_rows(sparse_all, k))
             
-            for i, score in enumerate(rerank_scores):
-                results[i]['rerank_score'] = float(score)
+            passage_rows = None
+            if self.vectors is not None and self.passages is not None:
+                dense, passage_rows = self.passages.best_passages(self.vectors.matrix, candidates, query_embeddings[i])
+            elif self.vectors is not None:
+                dense = self.vectors.get(candidates) @ query_embeddings[i]
+            else:
+                dense_by_row = dict(zip(dense_rows[i][valid].tolist(), dense_scores[i][valid].tolist()))
+                floor = dense_scores[i][valid].min() if valid.any() else 0.0
+                dense = np.array([dense_by_row.get(row, floor) for row in candidates.tolist()])
+            sparse = sparse_all[candidates]
             
-            results = sorted(results, key=lambda x: x['rerank_score'], reverse=True)[:top_k]
+            if fusion == 'rrf':
+                scores = reciprocal_rank_fusion(dense, sparse, self.search_config.get('rrf_k', 60))
+            else:
+                scores = weighted_fusion(dense, sparse, alpha)
             
+            top = np.argsort(-scores, kind='stable')[:k]
+            fused_scores[i, :len(top)] = scores[top]
+            fused_rows[i, :len(top)] = candidates[top]
+            if fused_passages is not None:
+                # Without vectors: the first passage of each document
+                if passage_rows is None:
+                    passage_rows = self.passages.doc_offsets[candidates]
+                fused_passages[i, :len(top)] = passage_rows[top]
+        
+        return fused_scores, fused_rows, fused_passages
+    
+    def _rescore_candidates(self) -> int:
+        """First-stage pool size to re-score exactly (0 = use index scores as is)"""
+        if self.vectors is None or not self._is_compressed(self.index):
+            return 0
+        return self.faiss_config.get('rescore_candidates', 200)
+    
+    @staticmethod
+    def _is_compressed(index) -> bool:
+        return index.compressed if isinstance(index, ShardedIndex) else is_compressed_index(index)
+    
+    def _rerank_depths(self, top_k: int) -> Tuple[int, int]:
+        """(default, maximum) number of candidates to rerank"""
+        default_depth = max(top_k, self.search_config.get('reranking_top_k', 30))
+        max_depth = max(default_depth, self.search_config.get('reranking_max_depth', 60))
+        return default_depth, max_depth
+    
+    def _rerank(
+        self,
+        queries: List[str],
+        batch_results: List[List[Dict]],
+        top_k: int,
+        hybrid: bool = False,
+        budget_ms: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Tuple[List[List[Dict]], Dict[str, List]]:
+        """Adaptive-depth reranking of every query of the batch.
+        
+        Candidates are scored in first-stage order, ``rerank_batch_size`` per
+        query and round, with one cross-encoder call per round for the whole
+        batch. A query stops when:
+        - the calibrated bound says no remaining candidate can beat its
+          current k-th rerank score (early exit), up to ``reranking_max_depth``
+          for ambiguous queries;
+        - the bound is not calibrated yet and ``reranking_top_k`` candidates
+          have been scored (the fixed-depth behaviour);
+        - the latency budget (``rerank_budget_ms``) is spent.
+        Unscored candidates rank after the scored ones, in first-stage order.
+        """
+        default_depth, max_depth = self._rerank_depths(top_k)
+        batch_size = self.search_config.get('rerank_batch_size', 8)
+        if budget_ms is None:
+            budget_ms = self.search_config.get('rerank_budget_ms')
+        deadline = time.time() + budget_ms / 1000 if budget_ms else None
+        calibrator = self.rerank_calibrators[hybrid]
+        
+        candidates = [results[:max_depth] for results in batch_results]
+        scored = [0] * len(queries)
+        early_exit = [False] * len(queries)
+        active = [i for i, results in enumerate(candidates) if results]
+        
+        while active:
+            _check_cancelled(cancel_event)
+            pairs = [
+                (queries[i], r)
+                for i in active
+                for r in candidates[i][scored[i]:scored[i] + batch_size]
+            ]
+            self._score_pairs(pairs)
+            calibrator.observe([r['score'] for _, r in pairs], [r['rerank_score'] for _, r in pairs])
+            
+            still_active = []
+            for i in active:
+                results = candidates[i]
+                scored[i] = min(scored[i] + batch_size, len(results))
+                if scored[i] >= len(results) or (deadline and time.time() >= deadline):
+                    continue
+                
+                bound = calibrator.bound(results[scored[i]]['score'], results[-1]['score'])
+                if scored[i] >= top_k and bound is not None:
+                    kth_score = sorted((r['rerank_score'] for r in results[:scored[i]]), reverse=True)[top_k - 1]
+                    if bound < kth_score:
+                        early_exit[i] = True
+                        continue
+                elif bound is None and scored[i] >= default_depth:
+                    continue
+                still_active.append(i)
+            active = still_active
+        
+        reranked = []
+        for results, n in zip(candidates, scored):
+            results = sorted(results[:n], key=lambda x: x['rerank_score'], reverse=True) + results[n:]
+            results = results[:top_k]
             for i, r in enumerate(results):
                 r['rank'] = i + 1
-        else:
-            results = results[:top_k]
+            reranked.append(results)
         
-        latency = time.time() - start_time
-        
-        return results, latency
+        return reranked, {'pairs_scored': scored, 'early_exit': early_exit}
     
     def get_document(self, doc_id: str) -> Optional[Dict]:
         """Retrieve a specific document by ID"""
-        doc_row = self.documents[self.documents['doc_id'] == doc_id]
-        if len(doc_row) == 0:
-            return None
-        
-        return doc_row.iloc[0].to_dict()
+        with self.components_lock.read():
+            return self.doc_store.get(doc_id)
+    
+    def similar_documents(self, doc_id: str, top_k: int = 10) -> Optional[List[Dict]]:
+        """Documents closest to a given document, using its stored vector as query"""
+        with self.components_lock.read():
+            row = self.doc_store.row_of(doc_id)
+            if row is None:
+                return None
+            
+            selection = self.doc_store.metadata_index.select(None)  # tombstones only
+            if self.passages is None:
+                query_embedding = self.vectors.get([row])
+                distances, indices = self._dense_search(query_embedding, top_k + 1, selection=selection)
+            else:
+                query_embedding = self.passages.document_vector(self.vectors.matrix, row)
+                distances, indices, _ = self._passage_search(query_embedding, top_k + 1, selection=selection)
+            results = [
+                r for r in self.doc_store.results(indices[0], distances[0])
+                if r['doc_id'] != doc_id
+            ][:top_k]
+        for i, r in enumerate(results):
+            r['rank'] = i + 1
+        return results
     
     def compute_metrics(self, queries: List[str], qrels: Dict, k: int = 10) -> Dict:
         """Compute evaluation metrics (Recall@K, MRR@K)"""
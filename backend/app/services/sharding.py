@@ -0,0 +1,318 @@
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.cache import LRUCache
+from app.services.filters import FilterSelection
+from app.services.index_factory import (
+    apply_default_search_parameters,
+    build_index,
+    id_selector,
+    is_binary_index,
+    is_compressed_index,
+    read_index,
+    search_index,
+    search_parameters,
+    write_index
+)
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIR = "shards"
+SHARDS_FILE = "shards.json"
+
+
+def shard_offsets(num_rows: int, num_shards: int) -> np.ndarray:
+    """First row of each shard (plus the end): contiguous, near-equal row ranges"""
+    num_shards = max(1, min(num_shards, num_rows))
+    return np.linspace(0, num_rows, num_shards + 1).astype(np.int64)
+
+
+def shard_file(i: int) -> str:
+    return f"shard-{i:03d}.faiss"
+
+
+def shard_search(
+    index,
+    query_embeddings: np.ndarray,
+    k: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    bitmap: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Search of one shard (shard-local ids), restricted to ``bitmap`` if given"""
+    selector = id_selector(bitmap) if bitmap is not None else None
+    params = search_parameters(index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+    return search_index(index, query_embeddings, k, params=params)
+
+
+def merge_top_k(shard_results: Sequence[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k-way heap merge of per-shard hits (global ids, each list sorted by score)"""
+    num_queries = len(shard_results[0][0])
+    distances = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    indices = np.full((num_queries, k), -1, dtype=np.int64)
+    for q in range(num_queries):
+        hits = [
+            [(float(score), int(row)) for score, row in zip(shard_distances[q], shard_indices[q]) if row >= 0]
+            for shard_distances, shard_indices in shard_results
+        ]
+        for j, (score, row) in enumerate(islice(heapq.merge(*hits, key=lambda hit: -hit[0]), k)):
+            distances[q, j], indices[q, j] = score, row
+    return distances, indices
+
+
+def _serve_shard(conn, path: str, mmap: bool, faiss_config: Dict, threads: Optional[int]):
+    """Shard worker process: load one shard, answer searches until told to stop"""
+    import faiss
+
+    index = read_index(path, mmap=mmap)
+    apply_default_search_parameters(index, faiss_config)
+    if threads:
+        faiss.omp_set_num_threads(threads)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            conn.send(shard_search(index, *request))
+        except Exception as e:
+            conn.send(e)
+    conn.close()
+
+
+class LocalShard:
+    """Shard searched by a coordinator thread (FAISS releases the GIL)"""
+
+    def __init__(self, index, path: Optional[Path] = None):
+        self.index = index
+        self.path = path
+        self.ntotal = index.ntotal
+
+    def search(self, query_embeddings, k, nprobe=None, ef_search=None, bitmap=None):
+        return shard_search(self.index, query_embeddings, k, nprobe, ef_search, bitmap)
+
+    def close(self):
+        pass
+
+
+class ProcessShard:
+    """Shard loaded and searched by its own worker process"""
+
+    def __init__(self, path: Path, ntotal: int, mmap: bool, faiss_config: Dict, threads: Optional[int] = None):
+        self.path = Path(path)
+        self.ntotal = ntotal
+        # spawn: forking a process that already runs OpenMP / BLAS threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_shard,
+            args=(child, str(path), mmap, faiss_config, threads),
+            name=f"shard-{self.path.stem}",
+            daemon=True
+        )
+        self.process.start()
+        child.close()
+        self._lock = threading.Lock()  # one request in flight per worker
+
+    def search(self, query_embeddings, k, nprobe=None, ef_search=None, bitmap=None):
+        with self._lock:
+            self.conn.send((query_embeddings, k, nprobe, ef_search, bitmap))
+            result = self.conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        try:
+            with self._lock:
+                self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+
+
+class ShardedIndex:
+    """Index split into contiguous row ranges, searched scatter-gather.
+
+    Shard ``i`` holds rows ``offsets[i]:offsets[i + 1]``, so a shard-local
+    id plus its offset is the global row (the id used by the vector and
+    document stores). A query goes to every shard in parallel, through a
+    thread (``executor='threads'``) or a worker process per shard
+    (``'processes'``, each with its own memory-mapped shard); the sorted
+    per-shard top-k lists are merged with a heap. Filters are sliced per
+    shard and shards without an allowed row are skipped. Per-shard latency
+    is recorded so a straggling shard shows up in ``stats()``.
+    """
+
+    def __init__(
+        self,
+        shards: List,
+        offsets: np.ndarray,
+        dimension: int,
+        binary: bool = False,
+        compressed: bool = False,
+        executor: str = 'threads'
+    ):
+        self.shards = shards
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.d = dimension
+        # Index kind of the shards (all built alike): drives exact re-scoring
+        self.binary = binary
+        self.compressed = compressed
+        self.ntotal = int(self.offsets[-1])
+        self.executor = executor
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+        self._selections = LRUCache(256)
+        self._stats_lock = threading.Lock()
+        self._latencies = [[] for _ in shards]
+        self._slowest = [0] * len(shards)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        faiss_config: Dict,
+        num_shards: int,
+        partition_labels: Optional[Sequence] = None
+    ) -> "ShardedIndex":
+        """One index of the configured type per contiguous slice of ``embeddings``"""
+        offsets = shard_offsets(len(embeddings), num_shards)
+        shards = []
+        for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            logger.info(f"Building shard {i} (rows {start}-{end - 1})...")
+            labels = partition_labels[start:end] if partition_labels is not None else None
+            shards.append(LocalShard(build_index(embeddings[start:end], faiss_config, labels)))
+        first = shards[0].index
+        return cls(shards, offsets, embeddings.shape[1], is_binary_index(first), is_compressed_index(first))
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for i, shard in enumerate(self.shards):
+            if isinstance(shard, LocalShard) and shard.path is None:
+                write_index(shard.index, str(directory / shard_file(i)))
+            else:
+                # Snapshots are immutable: a link to the loaded shard file is a copy
+                try:
+                    os.link(shard.path, directory / shard_file(i))
+                except OSError:
+                    shutil.copy2(shard.path, directory / shard_file(i))
+        with open(directory / SHARDS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'num_shards': len(self.shards),
+                'offsets': self.offsets.tolist(),
+                'dimension': self.d,
+                'binary': self.binary,
+                'compressed': self.compressed
+            }, f, indent=2)
+
+    @classmethod
+    def load(
+        cls,
+        directory: Path,
+        faiss_config: Dict,
+        executor: str = 'threads',
+        mmap: bool = False,
+        threads_per_shard: Optional[int] = None
+    ) -> "ShardedIndex":
+        """Open the shards of ``directory``, in this process or one worker process each"""
+        directory = Path(directory)
+        with open(directory / SHARDS_FILE, encoding='utf-8') as f:
+            layout = json.load(f)
+        offsets = np.array(layout['offsets'], dtype=np.int64)
+        shards = []
+        for i in range(layout['num_shards']):
+            path = directory / shard_file(i)
+            if executor == 'processes':
+                shards.append(ProcessShard(path, int(offsets[i + 1] - offsets[i]), mmap, faiss_config, threads_per_shard))
+            else:
+                index = read_index(str(path), mmap=mmap)
+                apply_default_search_parameters(index, faiss_config)
+                shards.append(LocalShard(index, path))
+        return cls(shards, offsets, layout['dimension'], layout['binary'], layout['compressed'], executor)
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        return (Path(directory) / SHARDS_FILE).exists()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._pool.shutdown(wait=False)
+
+    def _shard_bitmaps(self, selection: FilterSelection) -> List[Optional[np.ndarray]]:
+        # Cached per selection, like PassageStore.select; None = nothing allowed in the shard
+        bitmaps = self._selections.get(selection)
+        if bitmaps is None:
+            bitmaps = []
+            for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+                mask = selection.mask[start:end]
+                bitmaps.append(np.packbits(mask, bitorder='little') if mask.any() else None)
+            self._selections.put(selection, bitmaps)
+        return bitmaps
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        selection: Optional[FilterSelection] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Global top-k (rows, scores) of every shard's top-k"""
+        bitmaps = self._shard_bitmaps(selection) if selection is not None else [None] * len(self.shards)
+        targets = [i for i, bitmap in enumerate(bitmaps) if selection is None or bitmap is not None]
+        if not targets:
+            num_queries = len(query_embeddings)
+            return np.full((num_queries, k), -np.inf, dtype=np.float32), np.full((num_queries, k), -1, dtype=np.int64)
+
+        def run(i):
+            start = time.perf_counter()
+            distances, indices = self.shards[i].search(query_embeddings, k, nprobe, ef_search, bitmaps[i])
+            indices = np.where(indices >= 0, indices + self.offsets[i], -1)
+            return distances, indices, time.perf_counter() - start
+
+        results = list(self._pool.map(run, targets))
+        seconds = [r[2] for r in results]
+        with self._stats_lock:
+            for i, elapsed in zip(targets, seconds):
+                self._latencies[i] = (self._latencies[i] + [elapsed])[-1000:]
+            self._slowest[targets[int(np.argmax(seconds))]] += 1
+        if timings is not None:
+            for i, elapsed in zip(targets, seconds):
+                timings[f'search_shard{i}'] = elapsed
+
+        distances, indices = merge_top_k([(r[0], r[1]) for r in results], k)
+        if selection is not None:
+            # Binary shards ignore selectors: drop what the filter excludes
+            excluded = (indices >= 0) & ~selection.mask[np.maximum(indices, 0)]
+            distances[excluded], indices[excluded] = -np.inf, -1
+        return distances, indices
+
+    def stats(self) -> List[Dict]:
+        """Per-shard size and search latency (last 1000 calls); ``slowest``
+        counts the fan-outs a shard finished last"""
+        with self._stats_lock:
+            return [
+                {
+                    'shard': i,
+                    'rows': int(self.offsets[i + 1] - self.offsets[i]),
+                    'searches': len(latencies),
+                    'mean_ms': 1000 * float(np.mean(latencies)) if latencies else None,
+                    'p95_ms': 1000 * float(np.percentile(latencies, 95)) if latencies else None,
+                    'slowest': self._slowest[i]
+                }
+                for i, latencies in enumerate(self._latencies)
+            ]
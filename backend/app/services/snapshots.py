@@ -0,0 +1,216 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.services.index_factory import new_index_version, write_index_version
+
+logger = logging.getLogger(__name__)
+
+# models/snapshots/<version>/ holds one complete index (index.faiss,
+# embeddings.npy, docstore/, bm25/, passages/, manifest.json); models/CURRENT
+# names the one being served. Snapshots are never modified once published.
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+STAGING_PREFIX = ".staging-"
+LOCK_FILE = ".update.lock"
+ANY_VERSION = object()  # publish_snapshot: no check of the version being replaced
+
+
+class SnapshotConflict(RuntimeError):
+    """CURRENT no longer names the snapshot the new one was built from"""
+
+
+class WriterLock:
+    """Exclusive lock of a models directory for the processes writing to it.
+
+    ``flock`` on models/.update.lock, held by a writer from reading the
+    current snapshot to publishing the next one, so two writers (API
+    workers, update_index.py) never build on the same version.
+    build_index.py only holds it while reading docs.csv, then publishes
+    with ``expected_current``, failing if an update was published during
+    its build. Re-entrant within a process: its threads serialize on their
+    own locks, and the lock may be released by another thread than the
+    one that took it.
+    """
+
+    _held: Dict[str, List] = {}  # lock path -> [open file, depth]
+    _guard = threading.Lock()
+
+    def __init__(self, models_dir: Path):
+        self.path = Path(models_dir) / LOCK_FILE
+
+    def acquire(self):
+        key = str(self.path.resolve())
+        with self._guard:
+            if key in self._held:
+                self._held[key][1] += 1
+                return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)  # waits for the writer of another process
+        with self._guard:
+            self._held[key] = [f, 1]
+
+    def release(self):
+        key = str(self.path.resolve())
+        with self._guard:
+            entry = self._held[key]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._held[key]
+        fcntl.flock(entry[0], fcntl.LOCK_UN)
+        entry[0].close()
+
+    def __enter__(self) -> "WriterLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def current_version(models_dir: Path) -> Optional[str]:
+    """Version named by the CURRENT pointer, None before the first snapshot"""
+    path = Path(models_dir) / CURRENT_FILE
+    if not path.exists():
+        return None
+    return path.read_text(encoding='utf-8').strip() or None
+
+
+def snapshot_dir(models_dir: Path, version: str) -> Path:
+    return Path(models_dir) / SNAPSHOTS_DIR / version
+
+
+def active_dir(models_dir: Path) -> Path:
+    """Directory of the served index: the current snapshot, or models_dir
+    itself for indexes built before snapshots existed"""
+    version = current_version(models_dir)
+    return snapshot_dir(models_dir, version) if version else Path(models_dir)
+
+
+def file_checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(directory: Path, version: str, metadata: Optional[Dict] = None) -> Dict:
+    """List every file of the snapshot with its size and SHA-256"""
+    directory = Path(directory)
+    files = {
+        path.relative_to(directory).as_posix(): {'size': path.stat().st_size, 'sha256': file_checksum(path)}
+        for path in sorted(directory.rglob('*'))
+        if path.is_file() and path != directory / MANIFEST_FILE
+    }
+    manifest = {
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        **(metadata or {}),
+        'files': files
+    }
+    with open(directory / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(directory: Path) -> Optional[Dict]:
+    path = Path(directory) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify_snapshot(directory: Path) -> Dict:
+    """Check the files of a snapshot against its manifest (ValueError if any differs)"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise ValueError(f"{directory}: no {MANIFEST_FILE}")
+    for name, expected in manifest['files'].items():
+        path = Path(directory) / name
+        if not path.is_file() or path.stat().st_size != expected['size'] or file_checksum(path) != expected['sha256']:
+            raise ValueError(f"{directory}: {name} does not match the manifest")
+    return manifest
+
+
+def set_current(models_dir: Path, version: str):
+    """Point CURRENT at ``version`` (rename over the old pointer: readers see one or the other)"""
+    tmp = Path(models_dir) / f"{CURRENT_FILE}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, Path(models_dir) / CURRENT_FILE)
+
+
+def publish_snapshot(
+    models_dir: Path,
+    write: Callable[[Path], Optional[Dict]],
+    version: Optional[str] = None,
+    keep: int = 3,
+    expected_current=ANY_VERSION
+) -> str:
+    """Write a new snapshot and make it the current one.
+
+    ``write(directory)`` saves the components into a staging directory and
+    may return metadata for the manifest. The directory is renamed into
+    place once complete, and only then does CURRENT move to it, so readers
+    never see a partial index. Returns the new version.
+    Runs under the ``WriterLock`` of ``models_dir``. With
+    ``expected_current`` (the version the new snapshot was built from, None
+    for none), CURRENT is only moved if it still names that version:
+    ``SnapshotConflict`` otherwise, and nothing is written.
+    """
+    models_dir = Path(models_dir)
+    version = version or new_index_version()
+    with WriterLock(models_dir):
+        current = current_version(models_dir)
+        if expected_current is not ANY_VERSION and current != expected_current:
+            raise SnapshotConflict(
+                f"Index snapshot {current} was published since {expected_current}: "
+                f"{version} would drop its changes"
+            )
+        root = models_dir / SNAPSHOTS_DIR
+        root.mkdir(parents=True, exist_ok=True)
+        staging = root / f"{STAGING_PREFIX}{version}"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        try:
+            metadata = write(staging)
+            write_index_version(staging, version)
+            write_manifest(staging, version, metadata)
+            os.replace(staging, snapshot_dir(models_dir, version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        set_current(models_dir, version)
+    logger.info(f"Published index snapshot {version}")
+    prune_snapshots(models_dir, keep)
+    return version
+
+
+def prune_snapshots(models_dir: Path, keep: int = 3):
+    """Remove all but the ``keep`` newest snapshots (never the current one).
+
+    Processes still serving a removed snapshot keep their memory-mapped
+    files until they reload.
+    """
+    current = current_version(models_dir)
+    root = Path(models_dir) / SNAPSHOTS_DIR
+    # Versions start with their UTC timestamp: name order is age order
+    versions = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith(STAGING_PREFIX))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(root / version, ignore_errors=True)
+            logger.info(f"Removed old index snapshot {version}")
@@ -0,0 +1,260 @@
+import json
+import logging
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 40  # longer "words" are URLs / sequences, not useful lexical keys
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(str(text).lower()) if len(t) <= MAX_TOKEN_LENGTH]
+
+
+class BM25Index:
+    """Inverted index with precomputed BM25 impact scores, stored as CSR arrays.
+
+    ``vocabulary`` is a sorted fixed-width string array (term -> id by binary
+    search), postings of term ``t`` are ``doc_rows[indptr[t]:indptr[t + 1]]``
+    with their BM25 contribution in ``weights``. Scoring a query is a
+    ``np.bincount`` over the postings of its terms, and every array is a
+    plain ``.npy`` file that can be memory-mapped.
+
+    Documents added after the build (``extend``) go to a second, small
+    segment (``delta``) scored alongside the main one.
+    """
+
+    ARRAYS = ('vocabulary', 'indptr', 'doc_rows', 'weights')
+    DELTA_DIR = "delta"
+
+    def __init__(
+        self,
+        vocabulary: np.ndarray,
+        indptr: np.ndarray,
+        doc_rows: np.ndarray,
+        weights: np.ndarray,
+        num_docs: int,
+        avgdl: Optional[float] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        delta: Optional["BM25Index"] = None
+    ):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_rows = doc_rows
+        self.weights = weights
+        self.num_docs = num_docs
+        self.avgdl = avgdl  # None for indexes saved before it was stored
+        self.k1 = k1
+        self.b = b
+        self.delta = delta
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        term_ids = {}
+        postings_terms, postings_docs, postings_tf = [], [], []
+        doc_lengths = []
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings_terms.append(term_ids.setdefault(term, len(term_ids)))
+                postings_docs.append(row)
+                postings_tf.append(tf)
+
+        num_docs = len(doc_lengths)
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        terms = np.asarray(postings_terms, dtype=np.int64)
+        doc_rows = np.asarray(postings_docs, dtype=np.int32)
+        tf = np.asarray(postings_tf, dtype=np.float32)
+
+        # Renumber terms in sorted order so the vocabulary can be binary-searched
+        vocabulary = np.array(sorted(term_ids), dtype=f"<U{MAX_TOKEN_LENGTH}")
+        remap = np.empty(len(term_ids), dtype=np.int64)
+        remap[[term_ids[t] for t in vocabulary]] = np.arange(len(vocabulary))
+        terms = remap[terms]
+
+        order = np.lexsort((doc_rows, terms))
+        terms, doc_rows, tf = terms[order], doc_rows[order], tf[order]
+
+        df = np.bincount(terms, minlength=len(vocabulary)).astype(np.float32)
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(df)
+
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+        avgdl = doc_lengths.mean() if num_docs else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[doc_rows] / max(avgdl, 1e-9))
+        weights = (idf[terms] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        return cls(vocabulary, indptr, doc_rows, weights, num_docs, float(avgdl), k1, b)
+
+    def extend(self, texts: Sequence[str]) -> "BM25Index":
+        """New index with ``texts`` appended as rows ``num_docs``, ``num_docs + 1``, ...
+
+        Only the new documents are tokenized. Their postings are weighted
+        with the corpus statistics of the moment (document frequencies
+        including them, length normalization of the build) and merged into
+        the delta segment; the main segment is shared, not rewritten, and
+        keeps its weights until the next ``build`` (compaction).
+        """
+        tokens = [tokenize(text) for text in texts]
+        num_docs = self.num_docs + len(tokens)
+        terms, rows, tf = [], [], []
+        for i, doc_tokens in enumerate(tokens):
+            for term, count in Counter(doc_tokens).items():
+                terms.append(term)
+                rows.append(self.num_docs + i)
+                tf.append(count)
+        terms = np.array(terms, dtype=f"<U{MAX_TOKEN_LENGTH}")
+        rows = np.asarray(rows, dtype=np.int32)
+        tf = np.asarray(tf, dtype=np.float32)
+
+        new_terms, new_df = np.unique(terms, return_counts=True)
+        df = (new_df + self._document_frequency(new_terms)).astype(np.float32)
+        if self.delta is not None:
+            df += self.delta._document_frequency(new_terms)
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))[np.searchsorted(new_terms, terms)]
+        lengths = np.array([len(doc_tokens) for doc_tokens in tokens], dtype=np.float32)
+        avgdl = self.avgdl if self.avgdl is not None else (lengths.mean() if len(lengths) else 1.0)
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows - self.num_docs] / max(avgdl, 1e-9))
+        weights = (idf * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+        if self.delta is not None:
+            previous = self.delta
+            terms = np.concatenate([np.repeat(previous.vocabulary, np.diff(previous.indptr)), terms])
+            rows = np.concatenate([previous.doc_rows, rows])
+            weights = np.concatenate([previous.weights, weights])
+        vocabulary, term_ids = np.unique(terms, return_inverse=True)
+        term_ids = term_ids.reshape(-1)
+        order = np.lexsort((rows, term_ids))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        delta = BM25Index(
+            vocabulary.astype(f"<U{MAX_TOKEN_LENGTH}"), indptr, rows[order], weights[order], num_docs,
+            avgdl, self.k1, self.b
+        )
+        return BM25Index(
+            self.vocabulary, self.indptr, self.doc_rows, self.weights, num_docs, self.avgdl, self.k1, self.b, delta
+        )
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        with open(directory / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({'num_docs': self.num_docs, 'avgdl': self.avgdl, 'k1': self.k1, 'b': self.b}, f)
+        if self.delta is not None:
+            self.delta.save(directory / self.DELTA_DIR)
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: Optional[str] = None) -> "BM25Index":
+        directory = Path(directory)
+        with open(directory / "meta.json", encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = [np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in cls.ARRAYS]
+        delta = None
+        if cls.exists(directory / cls.DELTA_DIR):
+            delta = cls.load(directory / cls.DELTA_DIR, mmap_mode)
+        return cls(
+            *arrays,
+            num_docs=meta['num_docs'],
+            avgdl=meta.get('avgdl'),
+            k1=meta.get('k1', 1.5),
+            b=meta.get('b', 0.75),
+            delta=delta
+        )
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        return (Path(directory) / "meta.json").exists()
+
+    def term_ids(self, tokens: List[str]) -> np.ndarray:
+        """Ids of the tokens present in the vocabulary"""
+        if not tokens or len(self.vocabulary) == 0:
+            return np.empty(0, dtype=np.int64)
+        tokens = np.asarray(tokens, dtype=self.vocabulary.dtype)
+        positions = np.searchsorted(self.vocabulary, tokens)
+        positions = np.minimum(positions, len(self.vocabulary) - 1)
+        return positions[self.vocabulary[positions] == tokens]
+
+    def _document_frequency(self, terms: np.ndarray) -> np.ndarray:
+        """Documents of this segment containing each term (0 if unknown)"""
+        df = np.zeros(len(terms), dtype=np.int64)
+        if len(terms) and len(self.vocabulary):
+            positions = np.minimum(np.searchsorted(self.vocabulary, terms), len(self.vocabulary) - 1)
+            found = self.vocabulary[positions] == terms
+            df[found] = self.indptr[positions[found] + 1] - self.indptr[positions[found]]
+        return df
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query (dense array of num_docs)"""
+        tokens = tokenize(query)
+        scores = self._segment_scores(tokens, self.num_docs)
+        if self.delta is not None:
+            scores += self.delta._segment_scores(tokens, self.num_docs)
+        return scores
+
+    def _segment_scores(self, tokens: List[str], num_docs: int) -> np.ndarray:
+        term_ids = np.unique(self.term_ids(tokens))
+        if len(term_ids) == 0:
+            return np.zeros(num_docs, dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        rows = np.concatenate([self.doc_rows[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(rows, weights=weights, minlength=num_docs).astype(np.float32)
+
+    def search(self, queries: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, rows) per query, padded with -1 like FAISS"""
+        all_scores = np.zeros((len(queries), k), dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            scores = self.scores(query)
+            rows = top_k_rows(scores, k)
+            all_scores[i, :len(rows)] = scores[rows]
+            all_rows[i, :len(rows)] = rows
+        return all_scores, all_rows
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Rows of the k highest positive scores, best first"""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def weighted_fusion(
+    dense_scores: np.ndarray,
+    sparse_scores: np.ndarray,
+    alpha: float
+) -> np.ndarray:
+    """alpha * dense + (1 - alpha) * sparse, each min-max normalized over the candidates"""
+    def normalize(scores):
+        low, high = scores.min(), scores.max()
+        return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+    return alpha * normalize(dense_scores) + (1 - alpha) * normalize(sparse_scores)
+
+
+def reciprocal_rank_fusion(
+    dense_scores: np.ndarray,
+    sparse_scores: np.ndarray,
+    rrf_k: int = 60
+) -> np.ndarray:
+    """Sum of 1 / (rrf_k + rank) over the dense and sparse rankings of the candidates.
+
+    Candidates without any matching term get no sparse contribution.
+    """
+    def ranks(scores):
+        ranks = np.empty(len(scores), dtype=np.float32)
+        ranks[np.argsort(-scores, kind='stable')] = np.arange(1, len(scores) + 1)
+        return ranks
+    sparse_contribution = np.where(sparse_scores > 0, 1.0 / (rrf_k + ranks(sparse_scores)), 0.0)
+    return 1.0 / (rrf_k + ranks(dense_scores)) + sparse_contribution
@@ -0,0 +1,77 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from app.utils.arrays import append_rows
+
+logger = logging.getLogger(__name__)
+
+
+def flat_storage(index) -> Optional[faiss.IndexFlat]:
+    """The IndexFlat holding full float32 vectors in row order, if the index has one"""
+    if isinstance(index, faiss.IndexFlat):
+        return index
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        if isinstance(storage, faiss.IndexFlat):
+            return storage
+    return None
+
+
+class VectorStore:
+    """Row-aligned float32 document vectors, kept in exactly one place.
+
+    For flat and HNSW-flat indexes the matrix is a zero-copy view over the
+    index's own storage, so ``embeddings.npy`` is never loaded. Other index
+    types (IVF, compressed) keep their vectors in a different layout, and
+    the store reads (or memory-maps) ``embeddings.npy`` instead.
+    """
+
+    def __init__(self, matrix: np.ndarray, owner=None, source: str = "array", buffer: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        # Keeps the index alive while the view over its buffer is in use
+        self.owner = owner
+        self.source = source
+        # Array ``matrix`` is the first rows of, with room for appended rows
+        self._buffer = buffer
+
+    @classmethod
+    def from_index(cls, index) -> Optional["VectorStore"]:
+        """Zero-copy view over the index vectors, or None for other index types.
+
+        The view must be recreated after ``index.add``, which may reallocate.
+        """
+        storage = flat_storage(index)
+        if storage is None:
+            return None
+        matrix = faiss.rev_swig_ptr(storage.get_xb(), storage.ntotal * storage.d)
+        return cls(matrix.reshape(storage.ntotal, storage.d), owner=index, source="index")
+
+    @classmethod
+    def from_file(cls, path: Path, mmap: bool = False) -> "VectorStore":
+        matrix = np.load(str(path), mmap_mode='r' if mmap else None)
+        return cls(matrix, source="mmap" if mmap else "file")
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def append(self, embeddings: np.ndarray) -> "VectorStore":
+        """Store with ``embeddings`` added as rows (stores not backed by an index),
+        written to the spare capacity of its buffer (see ``append_rows``)"""
+        matrix, buffer = append_rows(np.asarray(self.matrix, dtype='float32'), embeddings, self._buffer)
+        return VectorStore(matrix, source="array", buffer=buffer)
+
+    def get(self, rows) -> np.ndarray:
+        """float32 copy of the given rows"""
+        return np.asarray(self.matrix[rows], dtype='float32')
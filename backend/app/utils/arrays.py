@@ -0,0 +1,23 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+GROWTH = 1.5  # capacity factor of the buffers ``append_rows`` writes into
+
+
+def append_rows(array: np.ndarray, rows, buffer: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """``array`` followed by ``rows``, and the buffer it is the first rows of.
+
+    ``array`` must be the first rows of ``buffer`` (None for any other
+    array). Rows are written to the spare capacity of the buffer, which is
+    reallocated ``GROWTH`` times larger when full: a series of small
+    appends copies ``array`` O(1) times on average, and rows of ``array``
+    are never modified. Only the latest array of a buffer may be appended to.
+    """
+    rows = np.asarray(rows, dtype=array.dtype)
+    size, added = len(array), len(rows)
+    if buffer is None or len(buffer) < size + added:
+        buffer = np.empty((max(size + added, int(size * GROWTH)),) + array.shape[1:], dtype=array.dtype)
+        buffer[:size] = array
+    buffer[size:size + added] = rows
+    return buffer[:size + added], buffer
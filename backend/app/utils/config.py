@@ -0,0 +1,22 @@
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Project root (go up from backend/app/utils to project root)
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+DEFAULT_CONFIG_PATH = PROJECT_ROOT / "config" / "config.yaml"
+
+
+def load_config(config_path: Optional[str] = None) -> Dict:
+    """Load config/config.yaml (or the given file) as a dict"""
+    path = Path(config_path) if config_path else DEFAULT_CONFIG_PATH
+    if not path.exists():
+        logger.warning(f"Config file not found: {path}. Using defaults.")
+        return {}
+
+    with open(path, encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
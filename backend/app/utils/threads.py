@@ -0,0 +1,99 @@
+import logging
+import os
+import sys
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP / BLAS runtimes when they initialise (i.e. at first import)
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def physical_cores() -> int:
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:  # Optional: logical cores as an upper bound
+        cores = None
+    return cores or os.cpu_count() or 1
+
+
+def thread_budget(runtime_config: Dict, library: str) -> Optional[int]:
+    """Threads for one library: its own setting, else ``runtime.threads``,
+    else None (library default). ``auto`` splits the physical cores evenly
+    between the ``runtime.processes_per_host`` model-serving processes."""
+    value = runtime_config.get(f'{library}_threads')
+    if value is None:
+        value = runtime_config.get('threads')
+    if value == 'auto':
+        return max(1, physical_cores() // max(1, int(runtime_config.get('processes_per_host') or 1)))
+    return int(value) if value else None
+
+
+def apply_thread_env(runtime_config: Dict):
+    """Export the BLAS / OpenMP budget as environment variables.
+
+    Only effective before numpy, torch and FAISS are imported (worker
+    process entry points); explicit environment settings are kept.
+    """
+    threads = thread_budget(runtime_config, 'blas')
+    if threads:
+        for name in THREAD_ENV_VARS:
+            os.environ.setdefault(name, str(threads))
+
+
+def configure_threads(runtime_config: Dict) -> Dict:
+    """Apply the per-library thread budgets of the ``runtime`` config section
+    to this process and return the resulting ``thread_report()``"""
+    torch_threads = thread_budget(runtime_config, 'torch')
+    interop_threads = runtime_config.get('torch_interop_threads')
+    if torch_threads or interop_threads:
+        import torch
+
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(int(interop_threads))
+            except RuntimeError as e:  # only allowed before the first parallel op
+                logger.warning(f"Cannot set torch inter-op threads: {e}")
+
+    faiss_threads = thread_budget(runtime_config, 'faiss')
+    if faiss_threads:
+        import faiss
+
+        faiss.omp_set_num_threads(faiss_threads)
+
+    blas_threads = thread_budget(runtime_config, 'blas')
+    if blas_threads:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=blas_threads, user_api='blas')
+        except ImportError:  # Optional: falls back to the environment variables
+            apply_thread_env(runtime_config)
+
+    report = thread_report()
+    logger.info(f"Thread budgets: {report}")
+    return report
+
+
+def thread_report() -> Dict:
+    """Thread pools in effect in this process, per library (libraries not
+    imported by the process are not reported)"""
+    report = {'pid': os.getpid(), 'cpu_count': os.cpu_count()}
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        report['torch'] = torch.get_num_threads()
+        report['torch_interop'] = torch.get_num_interop_threads()
+    faiss = sys.modules.get('faiss')
+    if faiss is not None:
+        report['faiss'] = faiss.omp_get_max_threads()
+    try:
+        from threadpoolctl import threadpool_info
+        report['blas'] = {
+            info['prefix']: info['num_threads']
+            for info in threadpool_info() if info['user_api'] == 'blas'
+        }
+    except ImportError:
+        report['blas'] = {name: os.getenv(name) for name in THREAD_ENV_VARS}
+    return report
@@ -0,0 +1,64 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.onnx_backend import OnnxQueryEncoder, min_cosine
+from app.utils.config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is glaucoma treated?",
+    "What causes high blood pressure?",
+    "Is asthma hereditary?",
+    "What are the side effects of metformin?",
+    "What is the outlook for people with kidney disease?",
+]
+
+
+def single_query_latencies(encoder, repeats: int) -> np.ndarray:
+    """Latency (ms) of encoding one query at a time, as encode_query does"""
+    encoder.encode([QUERIES[0]], normalize_embeddings=True)  # warmup
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        encoder.encode([QUERIES[i % len(QUERIES)]], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-query encode latency: SentenceTransformer vs ONNX")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--onnx-dir", default="models/onnx/encoder")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    model_name = load_config().get('model', {}).get('encoder', "sentence-transformers/all-MiniLM-L6-v2")
+    backends = {'torch': SentenceTransformer(model_name)}
+    for quantized in (False, True):
+        name = 'onnx-int8' if quantized else 'onnx-fp32'
+        try:
+            backends[name] = OnnxQueryEncoder(args.onnx_dir, quantized=quantized)
+        except (ImportError, OSError) as e:
+            logger.warning(f"Skipping {name}: {e}")
+
+    reference = backends['torch'].encode(QUERIES, normalize_embeddings=True)
+    print(f"\n{'backend':<12}{'p50 ms':>10}{'p95 ms':>10}{'min cosine':>12}")
+    for name, encoder in backends.items():
+        latencies = single_query_latencies(encoder, args.repeats)
+        cosine = min_cosine(reference, encoder.encode(QUERIES, normalize_embeddings=True))
+        print(f"{name:<12}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}{cosine:>12.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+
+MODULES = [
+    "app.main",
+    "app.services.search_engine",
+    "app.services.rag_service",
+    "app.services.inference_pool",
+]
+
+# Must never be imported just by importing app.main (control-plane process)
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "faiss", "pandas",
+                 "google.generativeai", "onnxruntime"]
+
+
+def import_time(module: str):
+    """(total µs, [(cumulative µs, name)]) from ``python -X importtime``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative), name.rstrip()))
+    # Top-level imports are the entries without indentation
+    total = sum(cumulative for cumulative, name in entries if not name.startswith("  "))
+    return total, entries
+
+
+def heavy_imports(module: str):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the backend modules (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Heaviest imports shown per module")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Budget for app.main (exit 1 if exceeded)")
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        runs = [import_time(module) for _ in range(args.repeats)]
+        median_ms = statistics.median(total for total, _ in runs) / 1000
+        print(f"\n{module}: {median_ms:.0f} ms (median of {args.repeats})")
+        for cumulative, name in sorted(runs[-1][1], reverse=True)[:args.top]:
+            print(f"  {cumulative / 1000:>8.1f} ms  {name.strip()}")
+
+        heavy = heavy_imports(module)
+        if heavy:
+            print(f"  heavy dependencies imported: {', '.join(heavy)}")
+        if module == "app.main":
+            over_budget = median_ms > args.budget_ms or bool(heavy)
+            print(f"  budget {args.budget_ms:.0f} ms: {'EXCEEDED' if over_budget else 'ok'}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.index_factory import build_partitioned_index, partition_assignment
+from app.services.snapshots import active_dir
+from app.utils.config import load_config
+
+FANOUTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def synthetic_corpus(num_docs: int, num_labels: int, dimension: int = 384):
+    """Clustered unit vectors with Zipf-sized labels, one cluster per label"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((num_labels, dimension)).astype('float32')
+    weights = 1.0 / np.arange(1, num_labels + 1)
+    labels = rng.choice(num_labels, size=num_docs, p=weights / weights.sum())
+    vectors = centers[labels] + 0.8 * rng.standard_normal((num_docs, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, [f"label-{label}" for label in labels]
+
+
+def real_corpus(project_root: Path, column: str):
+    import pandas as pd
+
+    embeddings = np.load(active_dir(project_root / "models") / "embeddings.npy")
+    labels = pd.read_csv(project_root / "data" / "processed" / "docs.csv")[column].astype(str).tolist()
+    return embeddings, labels
+
+
+def make_queries(embeddings: np.ndarray, num_queries: int, noise: float) -> np.ndarray:
+    """Document vectors moved away from their document: stand-ins for user queries"""
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+    dimension = embeddings.shape[1]
+    noise_vectors = rng.standard_normal((len(sample), dimension)) / np.sqrt(dimension)
+    queries = (embeddings[sample] + noise * noise_vectors).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """One query per call, as served by the API; returns ids and ms/query"""
+    indices = []
+    start = time.perf_counter()
+    for query in queries:
+        indices.append(index.search(query[None], k)[1][0])
+    return np.array(indices), (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of partition-routed vs full-scan search")
+    parser.add_argument("--synthetic", action="store_true", help="Clustered random vectors instead of models/embeddings.npy")
+    parser.add_argument("--docs", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--labels", type=int, default=500, help="Synthetic label count")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.5, help="Query perturbation (0 = document vectors)")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    faiss_config = load_config().get('faiss', {})
+    column = faiss_config.get('partition_column', 'focus_area')
+    if args.synthetic:
+        embeddings, labels = synthetic_corpus(args.docs, args.labels)
+    else:
+        embeddings, labels = real_corpus(Path(__file__).parent.parent, column)
+    queries = make_queries(embeddings, args.queries, args.noise)
+
+    flat = faiss.IndexFlatIP(embeddings.shape[1])
+    flat.add(embeddings)
+    expected, flat_ms = timed_search(flat, queries, args.k)
+
+    build_start = time.perf_counter()
+    assignment = partition_assignment(embeddings, labels, faiss_config.get('partition_min_size', 20))
+    index = build_partitioned_index(embeddings, assignment)
+    sizes = np.bincount(assignment)
+    print(
+        f"{len(embeddings)} vectors, {len(set(labels))} {column} values -> {len(sizes)} partitions "
+        f"(median size {int(np.median(sizes))}), built in {time.perf_counter() - build_start:.1f}s\n"
+    )
+
+    print(f"{'fan-out':>8}{'scanned':>10}{f'recall@{args.k}':>11}{'ms/query':>10}{'speedup':>9}")
+    print(f"{'full':>8}{'100.0%':>10}{1.0:>11.4f}{flat_ms:>10.3f}{1.0:>9.1f}")
+    for fanout in FANOUTS:
+        if fanout > len(sizes):
+            break
+        index.nprobe = fanout
+        found, routed_ms = timed_search(index, queries, args.k)
+        _, probed = index.quantizer.search(queries, fanout)
+        scanned = sizes[probed].sum(axis=1).mean() / len(embeddings)
+        recall = sum(len(set(e) & set(f)) for e, f in zip(expected.tolist(), found.tolist())) / expected.size
+        print(f"{fanout:>8}{scanned:>10.1%}{recall:>11.4f}{routed_ms:>10.3f}{flat_ms / routed_ms:>9.1f}")
+
+    print("\nSet faiss.index_type: IndexIVFPartitioned and faiss.nprobe to the chosen fan-out in config.yaml")
+
+
+if __name__ == "__main__":
+    main()
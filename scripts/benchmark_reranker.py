@@ -0,0 +1,75 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.onnx_backend import OnnxCrossEncoder, parity
+from app.utils.config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is glaucoma treated?",
+    "What causes high blood pressure?",
+    "Is asthma hereditary?",
+]
+
+
+def load_pairs(num_pairs: int):
+    """(query, document) pairs from the processed corpus"""
+    docs = pd.read_csv("data/processed/docs.csv", nrows=num_pairs)
+    texts = docs['text'].astype(str).tolist()
+    return [(QUERIES[i % len(QUERIES)], text) for i, text in enumerate(texts)]
+
+
+def pairs_per_second(model, pairs, batch_size: int, repeats: int):
+    model.predict(pairs[:batch_size], batch_size=batch_size)  # warmup
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scores = model.predict(pairs, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return len(pairs) * repeats / elapsed, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyTorch vs ONNX reranker throughput and parity")
+    parser.add_argument("--pairs", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--onnx-dir", default="models/onnx/cross_encoder")
+    args = parser.parse_args()
+
+    from sentence_transformers import CrossEncoder
+
+    model_config = load_config().get('model', {})
+    pairs = load_pairs(args.pairs)
+
+    backends = {'torch': CrossEncoder(model_config.get('cross_encoder', 'cross-encoder/ms-marco-MiniLM-L-6-v2'))}
+    for quantized in (False, True):
+        name = 'onnx-int8' if quantized else 'onnx-fp32'
+        try:
+            backends[name] = OnnxCrossEncoder(args.onnx_dir, quantized=quantized)
+        except (ImportError, OSError) as e:
+            logger.warning(f"Skipping {name}: {e}")
+
+    results = {name: pairs_per_second(model, pairs, args.batch_size, args.repeats)
+               for name, model in backends.items()}
+    reference_speed, reference_scores = results['torch']
+
+    print(f"\n{'backend':<12}{'pairs/s':>10}{'speedup':>10}{'max diff':>12}{'pearson':>10}{'top10':>8}")
+    for name, (speed, scores) in results.items():
+        agreement = parity(reference_scores, scores)
+        print(f"{name:<12}{speed:>10.1f}{speed / reference_speed:>9.2f}x"
+              f"{agreement['max_abs_diff']:>12.5f}{agreement['pearson']:>10.4f}"
+              f"{agreement['top10_overlap']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+# No numpy / torch / FAISS import at module level: spawned workers import this
+# module, and their BLAS / OpenMP runtimes must start after the thread budget is set
+from app.utils.threads import THREAD_ENV_VARS, configure_threads, physical_cores
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is glaucoma treated?",
+    "What causes high blood pressure?",
+    "Is asthma hereditary?",
+    "What are the side effects of metformin?",
+    "What is the outlook for people with kidney disease?",
+]
+
+
+class SyntheticWorkload:
+    """Encoder-sized matmuls (torch) + a flat FAISS search, no model files needed"""
+
+    def __init__(self, num_docs: int = 50000, dimension: int = 384):
+        import faiss
+        import numpy as np
+        import torch
+
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((num_docs, dimension)).astype('float32')
+        self.index = faiss.IndexFlatIP(dimension)
+        self.index.add(vectors)
+        self.layers = torch.nn.Sequential(*[torch.nn.Linear(dimension, dimension) for _ in range(6)]).eval()
+        self.tokens = torch.randn(1, 32, dimension)
+
+    def search(self, query: str):
+        import torch
+
+        with torch.no_grad():
+            embedding = self.layers(self.tokens).mean(dim=1).numpy()
+        return self.index.search(embedding, 10)
+
+
+def engine_workload(threads: int):
+    from app.services.search_engine import SemanticSearchEngine
+
+    engine = SemanticSearchEngine()
+    # The split being measured, not the runtime section of config.yaml (applied by load)
+    engine.runtime_config = {'threads': threads}
+    engine.load()
+    return engine
+
+
+def run_worker(threads: int, clients: int, duration: float, synthetic: bool, results):
+    """One serving process: ``clients`` concurrent callers for ``duration`` seconds"""
+    # Before the first numpy import; overrides the environment, unlike apply_thread_env
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    configure_threads({'threads': threads})
+    workload = SyntheticWorkload() if synthetic else engine_workload(threads)
+    for query in QUERIES:  # warmup
+        workload.search(query)
+
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            workload.search(QUERIES[i % len(QUERIES)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            i += 1
+
+    callers = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    results.put(latencies)
+
+
+def run_split(workers: int, threads: int, args) -> dict:
+    import numpy as np
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(threads, args.clients, args.duration, args.synthetic, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    latencies = np.concatenate([results.get() for _ in processes]) * 1000
+    for process in processes:
+        process.join()
+    return {
+        'workers': workers,
+        'threads': threads,
+        'qps': len(latencies) / args.duration,
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99))
+    }
+
+
+def candidate_splits(cores: int, oversubscribe: bool):
+    """(processes, threads) pairs using all the cores (or twice as many)"""
+    totals = {cores, 2 * cores} if oversubscribe else {cores}
+    limit = max(totals)
+    return [(w, t) for w in range(1, limit + 1) for t in range(1, limit + 1) if w * t in totals]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the throughput-optimal processes x threads split")
+    parser.add_argument("--cores", type=int, default=physical_cores())
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per split")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent callers per process")
+    parser.add_argument("--oversubscribe", action="store_true", help="Also try 2x cores splits")
+    parser.add_argument("--synthetic", action="store_true", help="Synthetic workload instead of the real engine")
+    args = parser.parse_args()
+
+    rows = []
+    for workers, threads in candidate_splits(args.cores, args.oversubscribe):
+        row = run_split(workers, threads, args)
+        rows.append(row)
+        print(f"{workers} x {threads}: {row['qps']:.1f} q/s, p50 {row['p50']:.1f} ms, p99 {row['p99']:.1f} ms")
+
+    print(f"\n{'workers':>8}{'threads':>9}{'q/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in sorted(rows, key=lambda r: -r['qps']):
+        print(f"{row['workers']:>8}{row['threads']:>9}{row['qps']:>10.1f}{row['p50']:>10.1f}{row['p99']:>10.1f}")
+
+    best = max(rows, key=lambda r: r['qps'])
+    print(f"\nBest: {best['workers']} processes x {best['threads']} threads -> config.yaml:")
+    print(f"  runtime:\n    processes_per_host: {best['workers']}\n    threads: {best['threads']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,40 @@
 import pandas as pd
 import numpy as np
 import faiss
+import json
+import sys
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import logging
 
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.snapshots import SnapshotConflict, WriterLock, current_version, publish_snapshot, snapshot_dir
+from app.services.passages import PassageStore
+from app.services.sharding import SHARDS_DIR, ShardedIndex
+from app.services.sparse_index import BM25Index
+from app.services.index_factory import (
+    build_index,
+    evaluate_recall,
+    is_binary_index,
+    is_compressed_index,
+    partition_summary,
+    write_index
+)
+from app.utils.config import load_config
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def build_faiss_index():
     """Build FAISS index from documents"""
     
+    config = load_config()
+    model_config = config.get('model', {})
+    faiss_config = config.get('faiss', {})
+    
     # Paths
     data_dir = Path("data/processed")
     models_dir = Path("models")
@@ -23,45 +46,172 @@ def build_faiss_index():
     if not docs_path.exists():
         raise FileNotFoundError(f"Documents file not found: {docs_path}")
     
-    docs = pd.read_csv(docs_path)
-    logger.info(f"Loaded {len(docs)} documents")
+    # Under the writer lock: docs.csv and CURRENT are read as the same version (an
+    # IndexUpdater writes docs.csv after publishing, and holds the lock until then)
+    with WriterLock(models_dir):
+        base_version = current_version(models_dir)
+        docs = pd.read_csv(docs_path)
+    logger.info(f"Loaded {len(docs)} documents (index snapshot {base_version})")
     
     # Load encoder
     logger.info("Loading sentence transformer...")
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    model = SentenceTransformer(model_config.get('encoder', 'sentence-transformers/all-MiniLM-L6-v2'))
+    
+    texts = docs['text'].tolist()
+    
+    # Passage index: vectors are overlapping passages, mapped back to their document
+    chunking_config = config.get('chunking', {})
+    passages = None
+    index_texts = texts
+    if chunking_config.get('enabled', False):
+        passages = PassageStore.build(
+            texts,
+            passage_words=chunking_config.get('passage_words', 128),
+            overlap_words=chunking_config.get('overlap_words', 32)
+        )
+        index_texts = [passages.texts[i] for i in range(len(passages))]
+        logger.info(f"Split {len(texts)} documents into {len(passages)} passages")
     
     # Generate embeddings
     logger.info("Generating embeddings...")
-    texts = docs['text'].tolist()
     embeddings = model.encode(
-        texts,
-        batch_size=32,
+        index_texts,
+        batch_size=model_config.get('batch_size', 32),
         show_progress_bar=True,
         normalize_embeddings=True
     )
     embeddings = embeddings.astype('float32')
     
-    # Save embeddings
-    embeddings_path = models_dir / "embeddings.npy"
-    np.save(str(embeddings_path), embeddings)
-    logger.info(f"Embeddings saved to {embeddings_path}")
-    
-    # Build FAISS index
-    logger.info("Building FAISS index...")
-    dimension = embeddings.shape[1]
+    # Build FAISS index (type and parameters from the `faiss` config section)
+    logger.info(f"Building FAISS index ({faiss_config.get('index_type', 'IndexFlatIP')})...")
+    partition_labels = None
+    if faiss_config.get('index_type') == 'IndexIVFPartitioned':
+        partition_labels = docs[faiss_config.get('partition_column', 'focus_area')].astype(str).to_numpy()
+        if passages is not None:
+            partition_labels = partition_labels[passages.doc_rows]
+    num_shards = config.get('sharding', {}).get('num_shards', 1)
+    partitions = None
+    if num_shards > 1:
+        # Contiguous row ranges, one index each: searched scatter-gather by the engine
+        index = ShardedIndex.build(embeddings, faiss_config, num_shards, partition_labels=partition_labels)
+        logger.info(f"Index built with {index.ntotal} vectors in {len(index.shards)} shards")
+        check_sharded_index(index, embeddings)
+    else:
+        index = build_index(embeddings, faiss_config, partition_labels=partition_labels)
+        logger.info(f"Index built with {index.ntotal} vectors")
+        
+        if is_compressed_index(index):
+            check_compressed_index(index, embeddings, faiss_config)
+        if partition_labels is not None:
+            partitions = check_partitioned_index(index, embeddings, partition_labels, faiss_config)
     
-    # Use IndexFlatIP for inner product (cosine similarity with normalized vectors)
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
+    # Build the BM25 index used by hybrid search
+    logger.info("Building BM25 index...")
+    bm25 = BM25Index.build(texts)
     
-    logger.info(f"Index built with {index.ntotal} vectors")
+    def write_snapshot(directory):
+        if isinstance(index, ShardedIndex):
+            index.save(directory / SHARDS_DIR)
+        else:
+            write_index(index, str(directory / "index.faiss"))
+        np.save(str(directory / "embeddings.npy"), embeddings)
+        # Columnar document store (row-aligned with the index, mmap-friendly)
+        DocumentStore.from_dataframe(docs).save(directory / "docstore")
+        bm25.save(directory / "bm25")
+        if passages is not None:
+            passages.save(directory / "passages")
+        if partitions is not None:
+            with open(directory / "partitions.json", 'w', encoding='utf-8') as f:
+                json.dump(partitions, f, indent=2, ensure_ascii=False)
+        return {
+            'num_documents': len(docs),
+            'num_vectors': int(index.ntotal),
+            'num_shards': len(index.shards) if isinstance(index, ShardedIndex) else 1,
+            'index_type': faiss_config.get('index_type', 'IndexFlatIP'),
+            'encoder': model_config.get('encoder', 'sentence-transformers/all-MiniLM-L6-v2')
+        }
     
-    # Save index
-    index_path = models_dir / "index.faiss"
-    faiss.write_index(index, str(index_path))
-    logger.info(f"Index saved to {index_path}")
+    # Written to a new snapshot directory, then published by swapping models/CURRENT:
+    # running API workers never see a partial index and hot-reload the new version
+    # Published only if no update was published during the build (it would be lost)
+    try:
+        version = publish_snapshot(
+            models_dir,
+            write_snapshot,
+            keep=config.get('snapshots', {}).get('keep', 3),
+            expected_current=base_version
+        )
+    except SnapshotConflict as e:
+        raise RuntimeError(f"{e}. Documents were updated during the build: run build_index.py again") from e
+    logger.info(f"Index snapshot saved to {snapshot_dir(models_dir, version)}")
     
     logger.info("✓ Indexing completed successfully!")
 
+def check_compressed_index(index, embeddings, faiss_config):
+    """Report the compression ratio and enforce the recall@10 tolerance"""
+    if is_binary_index(index):
+        index_bytes = faiss.serialize_index_binary(index).nbytes
+    else:
+        index_bytes = faiss.serialize_index(index).nbytes
+    logger.info(
+        f"Compressed index: {index_bytes / 1024 / 1024:.1f} MB "
+        f"({embeddings.nbytes / index_bytes:.1f}x smaller than float32 vectors)"
+    )
+    
+    recall = evaluate_recall(
+        index,
+        embeddings,
+        faiss_config,
+        k=10,
+        sample_size=faiss_config.get('recall_sample_size', 200)
+    )
+    tolerance = faiss_config.get('recall_tolerance', 0.02)
+    logger.info(f"Recall@10 vs flat search (with exact re-scoring): {recall:.4f}")
+    if recall < 1.0 - tolerance:
+        raise RuntimeError(
+            f"Recall@10 {recall:.4f} is below the tolerance ({1.0 - tolerance:.4f}). "
+            "Increase faiss.rescore_candidates or use a finer quantizer."
+        )
+
+def check_partitioned_index(index, embeddings, partition_labels, faiss_config):
+    """Report the recall@10 of the routed search; returns the partition table"""
+    summary = partition_summary(index, partition_labels)
+    sizes = [p['size'] for p in summary]
+    logger.info(
+        f"{len(summary)} partitions (sizes {min(sizes)}-{max(sizes)}, median {int(np.median(sizes))}), "
+        f"routing fan-out nprobe={index.nprobe}"
+    )
+    
+    recall = evaluate_recall(
+        index,
+        embeddings,
+        faiss_config,
+        k=10,
+        sample_size=faiss_config.get('recall_sample_size', 200)
+    )
+    logger.info(
+        f"Recall@10 vs flat search with fan-out {index.nprobe}: {recall:.4f} "
+        "(document vectors as queries; see scripts/benchmark_partitions.py)"
+    )
+    return summary
+
+def check_sharded_index(index, embeddings, k=10, sample_size=200):
+    """Report the recall@10 of the merged shard results and the per-shard latency"""
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(embeddings), size=min(sample_size, len(embeddings)), replace=False)
+    queries = np.ascontiguousarray(embeddings[sample])
+    
+    flat = faiss.IndexFlatIP(embeddings.shape[1])
+    flat.add(embeddings)
+    _, expected = flat.search(queries, k)
+    found = np.array([index.search(query[None], k)[1][0] for query in queries])
+    recall = sum(len(set(e) & set(f)) for e, f in zip(expected.tolist(), found.tolist())) / expected.size
+    logger.info(f"Recall@{k} of the merged shard results vs flat search: {recall:.4f}")
+    for shard in index.stats():
+        logger.info(
+            f"Shard {shard['shard']}: {shard['rows']} rows, {shard['mean_ms']:.2f} ms mean, "
+            f"{shard['p95_ms']:.2f} ms p95, slowest in {shard['slowest']}/{len(queries)} fan-outs"
+        )
+
 if __name__ == "__main__":
     build_faiss_index()
@@ -31,9 +31,12 @@ def check_files():
         errors.append(f"Fichier manquant: {docs_file}")
         print(f"  ❌ docs.csv manquant")
     
-    # 2. Vérifier l'index FAISS
+    # 2. Vérifier l'index FAISS (snapshot pointé par models/CURRENT, sinon models/)
     print("\n🤖 Index FAISS:")
-    index_file = project_root / "models" / "index.faiss"
+    index_dir = project_root / "models"
+    if (index_dir / "CURRENT").exists():
+        index_dir = index_dir / "snapshots" / (index_dir / "CURRENT").read_text().strip()
+    index_file = index_dir / "index.faiss"
     if index_file.exists():
         print(f"  ✅ index.faiss trouvé ({index_file.stat().st_size / 1024 / 1024:.1f} MB)")
     else:
@@ -42,7 +45,7 @@ def check_files():
     
     # 3. Vérifier les embeddings
     print("\n📐 Embeddings:")
-    embeddings_file = project_root / "models" / "embeddings.npy"
+    embeddings_file = index_dir / "embeddings.npy"
     if embeddings_file.exists():
         import numpy as np
         emb = np.load(embeddings_file)
@@ -0,0 +1,73 @@
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.onnx_backend import (
+    OnnxQueryEncoder,
+    export_cross_encoder,
+    export_query_encoder,
+    min_cosine
+)
+from app.utils.config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MIN_COSINE = 0.999
+
+CHECK_QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is glaucoma treated?",
+    "What causes high blood pressure?",
+    "Is asthma hereditary?",
+    "What are the side effects of metformin?",
+    "migraine",
+    "How many people are affected by Parkinson's disease and what are the early signs to look for?",
+]
+
+
+def check_query_encoder(model_name: str, encoder_dir: Path, quantized: bool):
+    """Cosine between the ONNX and SentenceTransformer query embeddings"""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name).encode(CHECK_QUERIES, normalize_embeddings=True)
+    for variant in ([False, True] if quantized else [False]):
+        embeddings = OnnxQueryEncoder(encoder_dir, quantized=variant).encode(CHECK_QUERIES)
+        cosine = min_cosine(reference, embeddings)
+        name = 'int8' if variant else 'fp32'
+        if cosine >= MIN_COSINE:
+            logger.info(f"✅ {name} query encoder: min cosine {cosine:.5f}")
+        else:
+            logger.warning(f"❌ {name} query encoder: min cosine {cosine:.5f} < {MIN_COSINE}, do not enable it")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the query encoder and reranker to ONNX for the CPU backends")
+    parser.add_argument("--output-dir", default="models/onnx", help="Root directory of the exported models")
+    parser.add_argument("--only", choices=["encoder", "cross_encoder"], help="Export a single model")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copies")
+    args = parser.parse_args()
+
+    model_config = load_config().get('model', {})
+    output_dir = Path(args.output_dir)
+    quantized = not args.no_quantize
+
+    if args.only in (None, "encoder"):
+        model_name = model_config.get('encoder', "sentence-transformers/all-MiniLM-L6-v2")
+        logger.info(f"Exporting query encoder {model_name}...")
+        export_query_encoder(model_name, output_dir / "encoder", quantized=quantized)
+        check_query_encoder(model_name, output_dir / "encoder", quantized)
+
+    if args.only in (None, "cross_encoder"):
+        cross_encoder_name = model_config.get('cross_encoder', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        logger.info(f"Exporting cross-encoder {cross_encoder_name}...")
+        export_cross_encoder(cross_encoder_name, output_dir / "cross_encoder", quantized=quantized)
+
+    logger.info("✅ Export done. Select the backends with model.encoder_backend / model.reranker_backend")
+
+
+if __name__ == "__main__":
+    main()
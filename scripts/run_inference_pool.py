@@ -0,0 +1,48 @@
+import argparse
+import logging
+import signal
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.inference_pool import InferencePool, authkey_from_env
+from app.utils.config import load_config
+from app.utils.threads import physical_cores
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the model / index inference workers")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: config, then physical cores)")
+    parser.add_argument("--config", help="Path to config.yaml")
+    args = parser.parse_args()
+
+    inference_config = load_config(args.config).get('inference', {})
+    num_workers = args.workers or inference_config.get('workers') or physical_cores()
+
+    pool = InferencePool(
+        num_workers,
+        inference_config.get('socket_dir', "/tmp/semantic-search-inference"),
+        config_path=args.config,
+        authkey=authkey_from_env(),
+        health_interval=inference_config.get('health_interval_s', 5),
+        startup_timeout=inference_config.get('startup_timeout_s', 600)
+    )
+    pool.start()
+    logger.info(f"Inference pool running with {num_workers} workers (Ctrl+C to stop)")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
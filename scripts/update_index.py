@@ -0,0 +1,48 @@
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.index_updates import IndexUpdater
+from app.services.search_engine import SemanticSearchEngine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add, replace or delete indexed documents without a full rebuild")
+    parser.add_argument("--config", help="Path to config.yaml")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add documents (replacing those whose doc_id exists)")
+    add.add_argument("csv", help="CSV with doc_id, text and optionally source, focus_area")
+    delete = commands.add_parser("delete", help="Delete documents by doc_id")
+    delete.add_argument("doc_ids", nargs="+")
+    commands.add_parser("compact", help="Drop deleted documents from every component (no re-encoding)")
+    args = parser.parse_args()
+
+    engine = SemanticSearchEngine(args.config)
+    # Only delete / compact run without the encoder
+    engine.load(stages=('encoder', 'index', 'documents') if args.command == "add" else ('index', 'documents'))
+    if engine.index is None or engine.doc_store is None:
+        sys.exit("No index found: run scripts/build_index.py first")
+    updater = IndexUpdater(engine, publish_delay=0)  # published before exiting
+
+    if args.command == "add":
+        import pandas as pd
+
+        df = pd.read_csv(args.csv, dtype={'doc_id': str}).fillna('')
+        summary = updater.upsert(df.to_dict('records'))
+    elif args.command == "delete":
+        summary = updater.delete(args.doc_ids)
+    else:
+        summary = updater.compact()
+    # Published as a new snapshot: running APIs hot-reload it (snapshots.watch)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.search_engine import SemanticSearchEngine
+from app.services.vector_store import VectorStore
+
+DIMENSION = 384
+
+CORPUS = pd.DataFrame({
+    'doc_id': ['0', '1', '2', '3', '4', '5', '6', '7'],
+    'text': [
+        "Diabetes symptoms include thirst, frequent urination and fatigue.",
+        "Glaucoma treatment uses eye drops to lower eye pressure.",
+        "Metformin is a drug used to treat type 2 diabetes.",
+        "Asthma causes wheezing and shortness of breath.",
+        "Hypertension is high blood pressure in the arteries.",
+        "Glaucoma is a group of eye diseases damaging the optic nerve.",
+        "Insulin therapy is needed for type 1 diabetes.",
+        "Migraine headaches can cause nausea and light sensitivity.",
+    ],
+    'source': ['NIDDK', 'NEI', 'NIDDK', 'NHLBI', 'NHLBI', 'NEI', 'NIDDK', 'NINDS'],
+    'focus_area': ['Diabetes', 'Glaucoma', 'Diabetes', 'Asthma',
+                   'High Blood Pressure', 'Glaucoma', 'Diabetes', 'Migraine'],
+})
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class FakeEncoder:
+    """Deterministic bag-of-words hashing encoder with the MiniLM interface"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, **kwargs):
+        self.calls += 1
+        vectors = np.zeros((len(texts), DIMENSION), dtype='float32')
+        for i, text in enumerate(texts):
+            for token in tokenize(text):
+                vectors[i, zlib.crc32(token.encode()) % DIMENSION] += 1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+
+class FakeCrossEncoder:
+    """Scores a (query, text) pair by token overlap"""
+
+    def __init__(self):
+        self.calls = 0
+        self.pairs_scored = 0
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        self.calls += 1
+        self.pairs_scored += len(pairs)
+        scores = []
+        for query, text in pairs:
+            query_tokens = set(tokenize(query))
+            scores.append(len(query_tokens & set(tokenize(text))) / (len(query_tokens) or 1))
+        return np.array(scores, dtype='float32')
+
+
+@pytest.fixture
+def corpus():
+    return CORPUS.copy()
+
+
+@pytest.fixture
+def loaded_engine(corpus):
+    """Search engine wired to the fake models and an in-memory flat index"""
+    import faiss
+
+    engine = SemanticSearchEngine()
+    engine.encoder = FakeEncoder()
+    engine.cross_encoder = FakeCrossEncoder()
+    engine.doc_store = DocumentStore.from_dataframe(corpus)
+    embeddings = engine.encoder.encode(corpus['text'].tolist())
+    engine.index = faiss.IndexFlatIP(DIMENSION)
+    engine.index.add(embeddings)
+    engine.vectors = VectorStore.from_index(engine.index)
+    return engine
+
+
+@pytest.fixture
+def passage_engine(loaded_engine):
+    """Engine whose index holds 4-word passages of the corpus documents"""
+    import faiss
+
+    from app.services.passages import PassageStore
+
+    doc_store = loaded_engine.doc_store
+    passages = PassageStore.build(
+        [doc_store.texts[row] for row in range(len(doc_store))], passage_words=4, overlap_words=1
+    )
+    embeddings = loaded_engine.encoder.encode([passages.texts[i] for i in range(len(passages))])
+    loaded_engine.index = faiss.IndexFlatIP(embeddings.shape[1])
+    loaded_engine.index.add(embeddings)
+    loaded_engine.vectors = VectorStore.from_index(loaded_engine.index)
+    loaded_engine.passages = passages
+    return loaded_engine
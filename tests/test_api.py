@@ -1,11 +1,19 @@
+import asyncio
+import threading
+
+import httpx
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent / "backend"))
 
+import app.main as main
 from app.main import app
+from app.services.cache import LRUCache
+from app.services.inference_pool import InferenceUnavailable
 
 client = TestClient(app)
 
@@ -39,3 +47,201 @@ def test_metrics_endpoint():
     response = client.get("/metrics")
     assert response.status_code == 200
     assert isinstance(response.json(), dict)
+
+def test_query_batch_endpoint():
+    """Test batch query endpoint"""
+    response = client.post(
+        "/query/batch",
+        json={
+            "queries": ["test query", "another query"],
+            "top_k": 5
+        }
+    )
+    # May return 503 if engine not loaded
+    assert response.status_code in [200, 503]
+
+def test_query_batch_rejects_empty():
+    """Test batch query validation"""
+    response = client.post("/query/batch", json={"queries": []})
+    assert response.status_code == 422
+
+@pytest.fixture
+def api_with_engine(loaded_engine, monkeypatch):
+    """API wired to the in-memory engine, with an empty result cache"""
+    loaded_engine.index_version = "v1"
+    monkeypatch.setattr(main, "search_engine", loaded_engine)
+    monkeypatch.setattr(main, "result_cache", LRUCache(16, ttl=60))
+    return loaded_engine
+
+def test_query_result_cache(api_with_engine):
+    """Test that identical queries are served from the result cache"""
+    payload = {"query": "Glaucoma eye drops", "top_k": 3}
+    first = client.post("/query", json=payload)
+    second = client.post("/query", json={**payload, "query": "glaucoma  eye drops"})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["results"] == first.json()["results"]
+    assert second.json()["query"] == "glaucoma  eye drops"
+    assert api_with_engine.cross_encoder.calls == 1
+
+def test_query_result_cache_invalidated_by_new_index(api_with_engine):
+    """Test that a new index version misses the cache"""
+    payload = {"query": "asthma", "top_k": 3}
+    client.post("/query", json=payload)
+    api_with_engine.index_version = "v2"
+
+    assert client.post("/query", json=payload).json()["cached"] is False
+
+def test_query_result_cached_under_the_version_that_served_it(api_with_engine, monkeypatch):
+    """Test that results of a worker still on the previous index are not
+    cached under the version the cache was looked up with"""
+    search = api_with_engine.search
+
+    def stale_search(*args, stats=None, **kwargs):
+        results = search(*args, stats=stats, **kwargs)
+        stats["index_version"] = "v0"
+        return results
+
+    monkeypatch.setattr(api_with_engine, "search", stale_search)
+    payload = {"query": "asthma", "top_k": 3}
+    client.post("/query", json=payload)
+    monkeypatch.setattr(api_with_engine, "search", search)
+
+    assert client.post("/query", json=payload).json()["cached"] is False
+    assert client.post("/query", json=payload).json()["cached"] is True
+
+def test_health_responsive_during_search(api_with_engine, monkeypatch):
+    """Test that a running search does not block the event loop"""
+    release = threading.Event()
+    search = api_with_engine.search
+
+    def slow_search(*args, **kwargs):
+        release.wait(5)
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(api_with_engine, "search", slow_search)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            pending = asyncio.create_task(ac.post("/query", json={"query": "glaucoma", "top_k": 2}))
+            await asyncio.sleep(0.05)
+            health = await asyncio.wait_for(ac.get("/health"), timeout=2)
+            search_running = not pending.done()
+            release.set()
+            return health, search_running, await pending
+
+    health, search_running, query = asyncio.run(scenario())
+
+    assert health.status_code == 200
+    assert search_running
+    assert query.status_code == 200
+
+def test_inference_pool_down_is_503(api_with_engine, monkeypatch):
+    """Test that searches with every inference worker down are 503, not 500"""
+    def unavailable(*args, **kwargs):
+        raise InferenceUnavailable("No inference worker available")
+
+    for method in ("search", "search_batch", "similar_documents", "get_document"):
+        monkeypatch.setattr(api_with_engine, method, unavailable)
+
+    assert client.post("/query", json={"query": "glaucoma"}).status_code == 503
+    assert client.post("/query/batch", json={"queries": ["glaucoma"]}).status_code == 503
+    assert client.get("/docs/1/similar").status_code == 503
+    assert client.get("/docs/1").status_code == 503
+
+def test_health_reports_threads(api_with_engine):
+    """Test that /health exposes the thread budgets in effect"""
+    threads = client.get("/health").json()["threads"]
+
+    assert threads["faiss"] >= 1
+
+def test_health_reports_component_readiness(api_with_engine):
+    health = client.get("/health").json()
+
+    assert health["search_engine_loaded"] is True
+    assert health["components"]["dense_search"] and health["components"]["reranking"]
+    assert "first_query_after_seconds" in health["startup"]
+
+def test_client_disconnect_cancels_search():
+    """Test that a disconnected client stops the engine work (499)"""
+    class DisconnectedRequest:
+        async def is_disconnected(self):
+            return True
+
+    started, cancel_event = threading.Event(), threading.Event()
+
+    def search():
+        started.set()
+        return cancel_event.wait(5)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await main.until_disconnected(DisconnectedRequest(), main.run_in_engine(search), cancel_event)
+        return error.value.status_code
+
+    assert asyncio.run(scenario()) == 499
+    assert cancel_event.is_set()
+
+def test_query_with_filters(api_with_engine):
+    """Test metadata filters on /query, part of the result cache key"""
+    payload = {"query": "glaucoma eye drops", "top_k": 3, "use_reranking": False}
+    filters = {"sources": ["NIDDK"], "doc_id_ranges": [{"start": 1}]}
+
+    unfiltered = client.post("/query", json=payload).json()
+    filtered = client.post("/query", json={**payload, "filters": filters}).json()
+
+    assert unfiltered["results"][0]["doc_id"] in ("1", "5")
+    assert [r["doc_id"] for r in filtered["results"]] in (["2", "6"], ["6", "2"])
+    assert not filtered["cached"]
+
+def test_query_with_invalid_filters(api_with_engine, corpus):
+    from app.services.document_store import DocumentStore
+
+    corpus["doc_id"] = [f"doc-{i}" for i in range(len(corpus))]
+    api_with_engine.doc_store = DocumentStore.from_dataframe(corpus)
+    response = client.post("/query", json={"query": "asthma", "filters": {"doc_id_ranges": [{"end": 3}]}})
+    assert response.status_code == 400
+
+def test_admin_endpoints_require_token(api_with_engine, monkeypatch):
+    payload = {"doc_ids": ["1"]}
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.post("/admin/documents/delete", json=payload).status_code == 403
+
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.post("/admin/documents/delete", json=payload).status_code == 401
+    response = client.post("/admin/documents/delete", json=payload, headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 401
+    assert api_with_engine.doc_store.deleted is None
+
+def test_admin_upsert_and_delete(api_with_engine, monkeypatch, tmp_path):
+    """Test that documents added through the API are searchable right away"""
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(main, "index_updater", None)
+    api_with_engine.models_dir = tmp_path / "models"
+    api_with_engine.data_dir = tmp_path / "data"
+    headers = {"X-Admin-Token": "secret"}
+    payload = {"query": "celiac intestine", "top_k": 1, "use_reranking": False}
+    client.post("/query", json=payload)
+
+    response = client.post("/admin/documents", headers=headers, json={
+        "documents": [{"doc_id": "8", "text": "Celiac disease damages the small intestine.", "source": "NIDDK"}]
+    })
+    assert response.status_code == 200
+    assert response.json()["added"] == 1
+    result = client.post("/query", json=payload).json()
+    assert result["results"][0]["doc_id"] == "8" and not result["cached"]
+
+    response = client.post("/admin/documents/delete", headers=headers, json={"doc_ids": ["8", "42"]})
+    assert response.json()["deleted"] == 1 and response.json()["not_found"] == ["42"]
+    assert client.get("/docs/8").status_code == 404
+    assert client.post("/admin/compact", headers=headers).json()["removed"] == 1
+    main.index_updater.flush()
+    assert (tmp_path / "models" / "CURRENT").exists()
+
+def test_index_version_endpoint(api_with_engine):
+    response = client.get("/index/version")
+    assert response.status_code == 200
+    assert response.json()["version"] == "v1"
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services.batching import MicroBatcher
+
+
+def run_concurrently(fn, inputs):
+    results = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn(inputs[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_share_batches():
+    """Test that concurrent callers are served by fewer model calls, each getting its own rows"""
+    calls = []
+
+    def double(items):
+        calls.append(len(items))
+        return np.array(items) * 2
+
+    batcher = MicroBatcher(double, max_batch_size=64, max_wait_ms=50)
+    inputs = [[i, i + 100] for i in range(16)]
+
+    results = run_concurrently(batcher.submit, inputs)
+
+    for items, result in zip(inputs, results):
+        assert result.tolist() == [2 * x for x in items]
+    assert sum(calls) == 32
+    assert len(calls) < 16
+    assert batcher.stats()['requests'] == 16
+    batcher.close()
+
+
+def test_max_batch_size():
+    calls = []
+
+    def identity(items):
+        calls.append(len(items))
+        return list(items)
+
+    batcher = MicroBatcher(identity, max_batch_size=4, max_wait_ms=50)
+    results = run_concurrently(batcher.submit, [[i, i] for i in range(6)])
+
+    assert results == [[i, i] for i in range(6)]
+    assert max(calls) <= 4
+    batcher.close()
+
+
+def test_errors_reach_every_caller():
+    def failing(items):
+        time.sleep(0.01)
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(failing, max_wait_ms=20)
+
+    def submit(items):
+        with pytest.raises(ValueError):
+            batcher.submit(items)
+        return True
+
+    assert all(run_concurrently(submit, [[1], [2], [3]]))
+    batcher.close()
+
+
+def test_empty_submit_skips_worker():
+    batcher = MicroBatcher(lambda items: np.zeros((len(items), 3)))
+
+    assert batcher.submit([]).shape == (0, 3)
+    assert batcher._thread is None
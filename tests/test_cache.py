@@ -0,0 +1,65 @@
+from app.services.cache import LRUCache, normalize_query
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    """Test that entries expire after the TTL"""
+    now = [100.0]
+    monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(max_size=2, ttl=10)
+    cache.put('a', 1)
+
+    now[0] = 109.0
+    assert cache.get('a') == 1
+    now[0] = 111.0
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_disabled_cache():
+    cache = LRUCache(max_size=0)
+    cache.put('a', 1)
+
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_normalize_query():
+    assert normalize_query("  Symptoms of   DIABETES ") == "symptoms of diabetes"
+
+
+def test_query_embedding_cache(loaded_engine):
+    """Test that repeated queries skip the encoder"""
+    calls = loaded_engine.encoder.calls
+    first = loaded_engine.encode_query("Glaucoma treatment")
+    second = loaded_engine.encode_query("glaucoma   treatment")
+    loaded_engine.encode_queries(["glaucoma treatment", "asthma", "asthma"])
+
+    assert (first == second).all()
+    assert loaded_engine.encoder.calls == calls + 2
+    assert loaded_engine.cache_stats()['query_embedding']['hits'] == 2
+
+
+def test_rerank_score_cache(loaded_engine):
+    """Test that only uncached (query, doc) pairs reach the cross-encoder"""
+    loaded_engine.search_config = {'reranking_top_k': 4, 'reranking_max_depth': 8, 'rerank_batch_size': 4}
+    loaded_engine.search("glaucoma eye drops", top_k=2)
+    scored = loaded_engine.cross_encoder.pairs_scored
+    loaded_engine.search("Glaucoma eye drops", top_k=6)
+
+    stats = loaded_engine.cache_stats()['rerank_score']
+    assert loaded_engine.cross_encoder.pairs_scored == scored + 4  # 8 candidates, 4 already scored
+    assert stats['pairs_saved'] == 4
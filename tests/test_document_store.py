@@ -0,0 +1,66 @@
+import numpy as np
+
+from app.services.document_store import DocumentStore
+
+
+def test_lookup_by_id(corpus):
+    """Test doc_id -> row hash index"""
+    store = DocumentStore.from_dataframe(corpus)
+
+    assert len(store) == len(corpus)
+    assert store.row_of('5') == 5
+    assert store.row_of('missing') is None
+    assert store.get('1')['focus_area'] == 'Glaucoma'
+    assert store.get('missing') is None
+
+
+def test_duplicate_ids_resolve_to_first_row(corpus):
+    """Test that a doc_id appearing twice is looked up at its first row"""
+    corpus.loc[6, 'doc_id'] = '2'
+    store = DocumentStore.from_dataframe(corpus)
+
+    assert store.row_of('2') == 2
+    assert store.get('2')['text'] == corpus.loc[2, 'text']
+
+
+def test_results_skip_faiss_padding(corpus):
+    """Test that -1 ids returned when k > ntotal are dropped"""
+    store = DocumentStore.from_dataframe(corpus)
+
+    results = store.results(np.array([3, -1, 0, -1]), np.array([0.9, 0.0, 0.5, 0.0]))
+
+    assert [r['doc_id'] for r in results] == ['3', '0']
+    assert [r['rank'] for r in results] == [1, 2]
+    assert results[0]['source'] == 'NHLBI'
+
+
+def test_numeric_doc_ids_are_strings(corpus):
+    """Test that numeric doc_id columns are exposed as strings"""
+    corpus['doc_id'] = range(len(corpus))
+    store = DocumentStore.from_dataframe(corpus)
+
+    assert store.get('2')['doc_id'] == '2'
+
+
+def test_engine_search_uses_store(loaded_engine):
+    """Test search through the document store with k larger than the corpus"""
+    results, latency = loaded_engine.search("glaucoma eye drops", top_k=5)
+
+    assert len(results) == 5
+    assert results[0]['doc_id'] == '1'
+    assert latency >= 0
+    assert loaded_engine.get_document('7')['source'] == 'NINDS'
+
+
+def test_save_and_mmap_load(corpus, tmp_path):
+    """Test the mmap-friendly on-disk layout"""
+    corpus.loc[3, 'text'] = "Asthme : sifflements et essoufflement"
+    DocumentStore.from_dataframe(corpus).save(tmp_path / "docstore")
+
+    store = DocumentStore.load(tmp_path / "docstore", mmap_mode='r')
+
+    assert isinstance(store.texts.data, np.memmap)
+    assert len(store) == len(corpus)
+    assert store.texts[3] == "Asthme : sifflements et essoufflement"
+    assert store.result(5, 0.5, 1)['focus_area'] == 'Glaucoma'
+    assert store.get('7')['source'] == 'NINDS'
@@ -0,0 +1,100 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.filters import filter_key
+from app.services.index_factory import exact_search
+
+
+def test_filter_key_is_canonical():
+    """Test that value order, duplicates and empty parts do not change the key"""
+    assert filter_key(None) is None
+    assert filter_key({'include': {'source': []}, 'doc_id_ranges': []}) is None
+    assert filter_key({'include': {'source': ['NEI', 'NIDDK', 'NEI']}}) == \
+        filter_key({'include': {'source': ['NIDDK', 'NEI']}, 'exclude': {'focus_area': None}})
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_metadata_index_select(corpus, tmp_path, columnar):
+    """Test include / exclude / doc_id range filters, from docs.csv or the columnar store"""
+    doc_store = DocumentStore.from_dataframe(corpus)
+    if columnar:
+        doc_store.save(tmp_path)
+        doc_store = DocumentStore.load(tmp_path)
+    index = doc_store.metadata_index
+
+    def rows(filters):
+        return index.select(filters).rows.tolist()
+
+    assert index.select({}) is None
+    assert rows({'include': {'source': ['NIDDK', 'NEI']}}) == [0, 1, 2, 5, 6]
+    assert rows({'include': {'source': ['NIDDK']}, 'exclude': {'focus_area': ['Diabetes']}}) == []
+    assert rows({'exclude': {'source': ['NIDDK']}}) == [1, 3, 4, 5, 7]
+    assert rows({'include': {'source': ['unknown']}}) == []
+    assert rows({'doc_id_ranges': [(None, 1), (6, None)]}) == [0, 1, 6, 7]
+    assert rows({'include': {'focus_area': ['Glaucoma']}, 'doc_id_ranges': [(2, 5)]}) == [5]
+
+    selection = index.select({'include': {'source': ['NEI']}})
+    assert index.select({'include': {'source': ['NEI']}}) is selection  # cached
+    assert np.unpackbits(selection.bitmap, bitorder='little')[:len(doc_store)].tolist() == \
+        selection.mask.astype(int).tolist()
+
+    with pytest.raises(ValueError):
+        index.select({'include': {'text': ['x']}})
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_metadata_index_carried_forward(corpus, tmp_path, columnar):
+    """Test that the index extended through appends and tombstones selects
+    the rows of one built from scratch, and that appends reuse the buffers"""
+    doc_store = DocumentStore.from_dataframe(corpus)
+    if columnar:
+        doc_store.save(tmp_path)
+        doc_store = DocumentStore.load(tmp_path)
+    doc_store.metadata_index.select({'doc_id_ranges': [(0, 3)]})  # numeric ids sorted
+    doc_store.row_by_id
+    doc_store = doc_store.append([{'doc_id': '8', 'text': "Cataract", 'source': 'NEI', 'focus_area': 'Cataract'}])
+    doc_store = doc_store.delete_rows([1])
+    text_buffer = doc_store.texts._buffers[0]
+    doc_store = doc_store.append([
+        {'doc_id': '9', 'text': "Glaucoma", 'source': 'NEI', 'focus_area': 'Glaucoma'},
+        {'doc_id': '1', 'text': "Glaucoma again", 'source': 'NIH', 'focus_area': 'Glaucoma'}
+    ])
+    assert doc_store.texts._buffers[0] is text_buffer
+
+    rebuilt = DocumentStore(doc_store.doc_ids, doc_store.columns, doc_store.deleted.copy())
+    for filters in (
+        None,
+        {'include': {'source': ['NEI']}},
+        {'include': {'focus_area': ['Glaucoma', 'Cataract']}, 'exclude': {'source': ['NIH']}},
+        {'doc_id_ranges': [(1, 2), (8, None)]}
+    ):
+        assert doc_store.metadata_index.select(filters).rows.tolist() == \
+            rebuilt.metadata_index.select(filters).rows.tolist()
+    assert doc_store.row_of('1') == 10 and doc_store.get('8')['focus_area'] == 'Cataract'
+
+
+def test_doc_id_ranges_require_numeric_ids(corpus):
+    corpus['doc_id'] = [f"doc-{i}" for i in range(len(corpus))]
+    with pytest.raises(ValueError):
+        DocumentStore.from_dataframe(corpus).metadata_index.select({'doc_id_ranges': [(0, 3)]})
+
+
+def test_exact_search_over_rows():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype('float32')
+    queries = rng.standard_normal((3, 8)).astype('float32')
+    rows = np.array([4, 8, 15, 16, 23, 42])
+
+    scores, indices = exact_search(vectors, queries, rows, 10)
+
+    expected = queries @ vectors[rows].T
+    for q in range(3):
+        assert indices[q, :6].tolist() == rows[np.argsort(-expected[q])].tolist()
+        assert np.allclose(scores[q, :6], np.sort(expected[q])[::-1])
+    assert (indices[:, 6:] == -1).all()
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "faiss", "pandas",
+                 "google.generativeai", "onnxruntime"]
+
+
+def imported_heavy_modules(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def test_app_main_import_is_lightweight():
+    """Test that importing the API does not load models, FAISS or the LLM client"""
+    assert imported_heavy_modules("app.main") == []
+
+
+def test_search_engine_loads_models_lazily():
+    assert imported_heavy_modules("app.services.search_engine") == ["faiss"]
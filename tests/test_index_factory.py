@@ -0,0 +1,123 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.services.index_factory import (
+    build_index,
+    evaluate_recall,
+    exact_rescore,
+    is_compressed_index,
+    partition_assignment,
+    partition_summary,
+    read_index,
+    search_index,
+    search_parameters,
+    write_index
+)
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+@pytest.mark.parametrize("index_type", ['IndexFlatIP', 'IndexIVFFlat', 'IndexIVFPQ', 'IndexHNSWFlat',
+                                        'IndexPQ', 'IndexScalarQuantizer', 'IndexBinaryFlat'])
+def test_build_index_types(embeddings, index_type):
+    """Test that every configured index type trains and finds a vector itself"""
+    index = build_index(embeddings, {'index_type': index_type, 'nprobe': 8, 'pq_m': 8})
+
+    assert index.ntotal == len(embeddings)
+    _, indices = search_index(index, embeddings[:5], 1, vectors=embeddings, rescore_candidates=50)
+    assert indices[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_config_defaults_applied(embeddings):
+    """Test that nprobe / efSearch defaults come from the config"""
+    ivf = build_index(embeddings, {'index_type': 'IndexIVFFlat', 'nprobe': 7})
+    hnsw = build_index(embeddings, {'index_type': 'IndexHNSWFlat', 'ef_search': 40})
+
+    assert faiss.extract_index_ivf(ivf).nprobe == 7
+    assert hnsw.hnsw.efSearch == 40
+
+
+def test_search_parameters_override(embeddings):
+    """Test per-request override objects"""
+    ivf = build_index(embeddings, {'index_type': 'IndexIVFFlat'})
+    flat = build_index(embeddings, {'index_type': 'IndexFlatIP'})
+
+    assert search_parameters(ivf, nprobe=3).nprobe == 3
+    assert search_parameters(flat, nprobe=3) is None
+    assert search_parameters(ivf) is None
+
+
+def test_unknown_index_type(embeddings):
+    with pytest.raises(ValueError):
+        build_index(embeddings, {'index_type': 'IndexLSH'})
+
+
+@pytest.mark.parametrize("index_type", ['IndexPQ', 'IndexScalarQuantizer', 'IndexBinaryFlat'])
+def test_compressed_recall_with_rescoring(embeddings, index_type):
+    """Test that exact re-scoring keeps recall@10 close to flat search"""
+    config = {'index_type': index_type, 'pq_m': 8, 'rescore_candidates': 400}
+    index = build_index(embeddings, config)
+
+    assert is_compressed_index(index)
+    assert evaluate_recall(index, embeddings, config, k=10, sample_size=50) >= 0.9
+
+
+def test_binary_index_roundtrip(embeddings, tmp_path):
+    """Test that binary indexes are written and read with the binary IO"""
+    path = str(tmp_path / "index.faiss")
+    write_index(build_index(embeddings, {'index_type': 'IndexBinaryFlat'}), path)
+
+    index = read_index(path)
+    assert isinstance(index, faiss.IndexBinaryFlat)
+    assert index.ntotal == len(embeddings)
+
+
+def test_exact_rescore_padding(embeddings):
+    """Test that -1 candidates stay at the end as padding"""
+    candidates = np.array([[3, -1, 0]])
+    scores, indices = exact_rescore(embeddings, embeddings[:1], candidates, 3)
+
+    assert indices.tolist() == [[0, 3, -1]]
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_read_index_mmap(embeddings, tmp_path):
+    """Test that a memory-mapped index answers like the in-RAM one"""
+    path = str(tmp_path / "index.faiss")
+    index = build_index(embeddings, {'index_type': 'IndexFlatIP'})
+    write_index(index, path)
+
+    mapped = read_index(path, mmap=True)
+
+    assert mapped.ntotal == index.ntotal
+    assert mapped.search(embeddings[:3], 5)[1].tolist() == index.search(embeddings[:3], 5)[1].tolist()
+
+
+def test_partitioned_index_routes_queries(embeddings):
+    """Test one IVF list per label, small labels folded into the closest large one"""
+    labels = ['a'] * 800 + ['b'] * 800 + ['c'] * 395 + ['rare'] * 5
+    # Shift each label's vectors in its own direction, so partitions are separable
+    embeddings = embeddings.copy()
+    for i, (start, end) in enumerate([(0, 800), (800, 1600), (1600, 2000)]):
+        embeddings[start:end, i] += 3.0
+    faiss.normalize_L2(embeddings)
+
+    assignment = partition_assignment(embeddings, labels, min_size=20)
+    assert sorted(set(assignment.tolist())) == [0, 1, 2]
+    assert set(assignment[1995:].tolist()) == {2}
+
+    index = build_index(embeddings, {'index_type': 'IndexIVFPartitioned', 'nprobe': 1}, partition_labels=labels)
+    summary = partition_summary(index, labels)
+    assert [(p['name'], p['size']) for p in summary] == [('a', 800), ('b', 800), ('c', 400)]
+
+    _, indices = search_index(index, embeddings[[0, 900, 1999]], 1)
+    assert indices[:, 0].tolist() == [0, 900, 1999]
+    with pytest.raises(ValueError):
+        build_index(embeddings, {'index_type': 'IndexIVFPartitioned'})
@@ -0,0 +1,196 @@
+import fcntl
+import sys
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.index_factory import build_index, read_index, read_index_version
+from app.services.index_updates import IndexUpdater
+from app.services.onnx_backend import OnnxQueryEncoder
+from app.services.search_engine import SemanticSearchEngine
+from app.services.snapshots import LOCK_FILE, active_dir, current_version, verify_snapshot
+from app.services.sparse_index import BM25Index
+
+
+@pytest.fixture
+def updater(loaded_engine, tmp_path):
+    loaded_engine.models_dir = tmp_path / "models"
+    loaded_engine.data_dir = tmp_path / "data"
+    loaded_engine.sparse_index = BM25Index.build(loaded_engine.doc_store.texts)
+    return IndexUpdater(loaded_engine, publish_delay=0)
+
+
+def search_ids(engine, query, top_k=3, **kwargs):
+    results, _ = engine.search(query, top_k=top_k, use_reranking=False, **kwargs)
+    return [r['doc_id'] for r in results]
+
+
+def test_upsert_adds_and_replaces_documents(updater):
+    """Test that new documents are searchable and replaced ones score their new text"""
+    engine = updater.engine
+    engine.search("insulin therapy", top_k=2)
+    summary = updater.upsert([
+        {'doc_id': '8', 'text': "Celiac disease damages the small intestine.", 'source': 'NIDDK', 'focus_area': 'Celiac'},
+        {'doc_id': '6', 'text': "Cataract surgery replaces the clouded lens.", 'source': 'NEI', 'focus_area': 'Cataract'},
+    ])
+
+    assert (summary['added'], summary['updated'], summary['num_documents']) == (1, 1, 9)
+    assert engine.index.ntotal == len(engine.doc_store) == 10
+    assert search_ids(engine, "celiac small intestine")[0] == '8'
+    assert search_ids(engine, "cataract surgery lens")[0] == '6'
+    assert search_ids(engine, "cataract", hybrid=True)[0] == '6'
+    assert search_ids(engine, "insulin therapy")[0] != '6'
+    assert engine.get_document('6')['focus_area'] == 'Cataract'
+    assert search_ids(engine, "lens", filters={'include': {'focus_area': ['Cataract']}}) == ['6']
+    assert not any(key[1] == '6' for key in engine.rerank_cache._data)
+
+def test_delete_and_compact(updater):
+    engine = updater.engine
+    summary = updater.delete(['1', '5', 'missing'])
+    assert (summary['deleted'], summary['not_found'], summary['num_documents']) == (2, ['missing'], 6)
+    assert not {'1', '5'} & set(search_ids(engine, "glaucoma eye", top_k=6, hybrid=True))
+    assert engine.get_document('1') is None
+
+    summary = updater.compact()
+    assert summary['removed'] == 2
+    assert engine.index.ntotal == len(engine.doc_store) == 6 and engine.doc_store.deleted is None
+    assert search_ids(engine, "metformin drug")[0] == '2'
+
+def test_updates_are_published_as_snapshots(updater):
+    engine = updater.engine
+    updater.upsert([{'doc_id': '8', 'text': "Celiac disease", 'source': 'NIDDK', 'focus_area': 'Celiac'}])
+    updater.delete(['0'])
+    snapshot = active_dir(engine.models_dir)
+
+    assert snapshot.name == engine.index_version == read_index_version(snapshot)
+    assert verify_snapshot(snapshot)['num_documents'] == 8
+    assert read_index(str(snapshot / "index.faiss")).ntotal == 9
+    assert DocumentStore.load(snapshot / "docstore").num_live == 8
+    assert BM25Index.exists(snapshot / "bm25")
+    docs = pd.read_csv(engine.data_dir / "docs.csv", dtype={'doc_id': str})
+    assert docs['doc_id'].tolist() == ['1', '2', '3', '4', '5', '6', '7', '8']
+    assert len(list((engine.models_dir / "snapshots").iterdir())) == 2
+
+def test_writers_of_two_processes_keep_each_other_changes(updater, monkeypatch):
+    """Test that a writer whose engine is behind reloads the newer snapshot
+    before changing it, instead of publishing over it"""
+    updater.engine.index_version = "20240101T000000000000Z-a"
+    updater.save()
+
+    def load_engine():
+        engine = SemanticSearchEngine()
+        engine.models_dir, engine.data_dir = updater.engine.models_dir, updater.engine.data_dir
+        monkeypatch.setattr(engine, "_load_encoder", type(updater.engine.encoder))
+        engine.load(stages=('encoder', 'index', 'documents'))
+        return engine
+
+    first, second = load_engine(), load_engine()
+    IndexUpdater(first, publish_delay=0).upsert([{'doc_id': '8', 'text': "Celiac disease damages the small intestine."}])
+    IndexUpdater(second, publish_delay=0).upsert([{'doc_id': '9', 'text': "Cataract surgery replaces the clouded lens."}])
+    IndexUpdater(first, publish_delay=0).delete(['0'])
+
+    assert second.index_version != first.index_version == current_version(first.models_dir)
+    assert {'8', '9'} <= set(first.doc_store.row_by_id) and '0' not in first.doc_store
+    assert search_ids(first, "cataract lens")[0] == '9'
+    docs = pd.read_csv(first.data_dir / "docs.csv", dtype={'doc_id': str})
+    assert docs['doc_id'].tolist() == ['1', '2', '3', '4', '5', '6', '7', '8', '9']
+
+def test_updates_grow_the_index_in_place_and_publish_once(updater):
+    """Test that a burst of updates adds to the same index and BM25 delta,
+    and is published as one snapshot"""
+    engine = updater.engine
+    updater.publish_delay = 60
+    updater.upsert([{'doc_id': '8', 'text': "Celiac disease damages the small intestine."}])
+    index = engine.index
+    updater.upsert([{'doc_id': '9', 'text': "Cataract surgery replaces the clouded lens."}])
+    summary = updater.delete(['0'])
+
+    assert engine.index is index and index.ntotal == 10
+    assert engine.sparse_index.delta.num_docs == 10
+    assert search_ids(engine, "cataract", hybrid=True)[0] == '9'
+    assert not summary['published'] and current_version(engine.models_dir) is None
+    assert engine.publish_pending and not engine.reload_snapshot()
+
+    updater.flush()
+    assert current_version(engine.models_dir) == engine.index_version and not engine.publish_pending
+    assert len(list((engine.models_dir / "snapshots").iterdir())) == 1
+    assert BM25Index.load(active_dir(engine.models_dir) / "bm25").search(["cataract"], k=1)[1][0, 0] == 9
+
+def test_failed_publication_releases_the_writer_lock(updater, monkeypatch):
+    """Test that writers of other processes do not wait for the retry of a
+    failed publication, which is kept pending until flush"""
+    engine = updater.engine
+    updater.publish_delay = 60
+    updater.upsert([{'doc_id': '8', 'text': "Celiac disease damages the small intestine."}])
+    monkeypatch.setattr(updater, "save", lambda: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        updater.flush()
+    with open(engine.models_dir / LOCK_FILE, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)  # BlockingIOError if still held
+        fcntl.flock(f, fcntl.LOCK_UN)
+    assert engine.publish_pending and current_version(engine.models_dir) is None
+
+    monkeypatch.undo()
+    updater.flush()
+    assert current_version(engine.models_dir) == engine.index_version and not engine.publish_pending
+
+def test_documents_are_not_encoded_with_the_onnx_query_encoder(updater):
+    """Test that with the ONNX query encoder, new documents get vectors of the
+    model the corpus was indexed with"""
+    engine = updater.engine
+    torch_encoder = engine.encoder
+    engine._document_encoder = torch_encoder
+    engine.encoder = OnnxQueryEncoder.__new__(OnnxQueryEncoder)  # fails if used
+    text = "Celiac disease damages the small intestine."
+    updater.upsert([{'doc_id': '8', 'text': text}])
+
+    assert engine.document_encoder() is torch_encoder
+    assert np.allclose(engine.vectors.get([8]), torch_encoder.encode([text], normalize_embeddings=True))
+
+def test_upsert_in_passage_mode(passage_engine, tmp_path):
+    passage_engine.models_dir = tmp_path
+    passage_engine.data_dir = tmp_path
+    num_passages = len(passage_engine.passages)
+    IndexUpdater(passage_engine).upsert([{'doc_id': '3', 'text': "Celiac disease damages the small intestine"}])
+
+    assert len(passage_engine.passages) == passage_engine.index.ntotal > num_passages
+    results, _ = passage_engine.search("small intestine", top_k=1, use_reranking=False)
+    assert results[0]['doc_id'] == '3' and results[0]['passage'] in results[0]['text']
+
+def test_upsert_into_label_partition(updater):
+    """Test that an upserted document joins its focus_area's partition, where
+    the queries routed to that partition find it"""
+    engine = updater.engine
+    engine.faiss_config = {**engine.faiss_config, 'index_type': 'IndexIVFPartitioned', 'partition_min_size': 2}
+    labels = engine.doc_store.columns['focus_area']
+    engine.index = build_index(engine.vectors.get(slice(None)), engine.faiss_config, [labels[i] for i in range(8)])
+    engine.vectors = None
+    # Mostly diabetes words: the closest centroid is the Diabetes partition's
+    text = "Glaucoma risk is higher with type 2 diabetes, insulin and metformin therapy for diabetes."
+    updater.upsert([{'doc_id': '8', 'text': text, 'focus_area': 'Glaucoma'}])
+
+    ivf = faiss.extract_index_ivf(engine.index)
+    partition_of = {
+        int(row): partition
+        for partition in range(ivf.nlist)
+        for row in faiss.rev_swig_ptr(ivf.invlists.get_ids(partition), ivf.invlists.list_size(partition))
+    }
+    assert partition_of[8] == partition_of[1] == partition_of[5] != partition_of[0]
+    results, _ = engine.search("glaucoma optic nerve eye", top_k=3, use_reranking=False, nprobe=1)
+    assert '8' in [r['doc_id'] for r in results]
+
+def test_compact_partitioned_index(updater):
+    engine = updater.engine
+    engine.faiss_config = {**engine.faiss_config, 'index_type': 'IndexIVFPartitioned', 'partition_min_size': 1}
+    updater.delete(['7'])
+    updater.compact()
+
+    assert isinstance(faiss.downcast_index(engine.index), faiss.IndexIVFFlat)
+    assert engine.index.ntotal == 7
+    assert np.allclose(engine.vectors.get([0]), engine.encoder.encode([engine.doc_store.texts[0]]))
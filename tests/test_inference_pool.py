@@ -0,0 +1,127 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from app.services.inference_pool import (
+    InferenceClient,
+    InferenceError,
+    InferencePool,
+    InferenceUnavailable,
+    InferenceWorker,
+    call_worker
+)
+
+AUTHKEY = b"test"
+
+
+class EchoEngine:
+    """Minimal engine for worker processes spawned by the pool tests"""
+    index_version = "echo"
+
+    def search(self, query, top_k=10, **kwargs):
+        return [{'doc_id': query}], 0.0
+
+
+def echo_worker(socket_path, config_path=None, authkey=AUTHKEY):
+    InferenceWorker(EchoEngine()).serve(socket_path, authkey)
+
+
+def start_worker(engine, socket_path):
+    thread = threading.Thread(target=InferenceWorker(engine).serve, args=(socket_path, AUTHKEY), daemon=True)
+    thread.start()
+    wait_until(lambda: os.path.exists(socket_path))
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return
+        time.sleep(0.05)
+    raise AssertionError("condition not met in time")
+
+
+@pytest.fixture
+def client(loaded_engine, tmp_path):
+    """Client in front of one in-process worker; worker-1 is never started"""
+    loaded_engine.index_version = "v1"
+    start_worker(loaded_engine, tmp_path / "worker-0.sock")
+    return InferenceClient(tmp_path, num_workers=2, config={}, authkey=AUTHKEY, timeout=10)
+
+
+def test_remote_search_matches_local(client, loaded_engine):
+    """Test that searches through the worker return the engine's results and stats"""
+    stats = {}
+    results, _ = client.search("glaucoma eye drops", top_k=2, stats=stats)
+    local, _ = loaded_engine.search("glaucoma eye drops", top_k=2)
+
+    assert [r['doc_id'] for r in results] == [r['doc_id'] for r in local]
+    assert stats['pairs_scored'] > 0
+    assert client.get_document('3')['doc_id'] == '3'
+    assert client.index_version == "v1"
+
+
+def test_unreachable_worker_is_skipped(client):
+    """Test that a missing worker is retried on the other one and reported as down"""
+    for _ in range(3):
+        client.search("asthma", top_k=1, cancel_event=threading.Event())
+
+    workers = {w['worker']: w for w in client.pool_stats()}
+    assert workers['worker-0.sock']['alive'] and workers['worker-0.sock']['served'] >= 3
+    assert not workers['worker-1.sock']['alive']
+
+
+def test_slow_search_is_not_retried(tmp_path):
+    """Test that a timeout is raised as is, without marking the worker down
+    or sending the search to the other workers"""
+    calls = []
+
+    class SlowEngine(EchoEngine):
+        def search(self, query, top_k=10, **kwargs):
+            calls.append(query)
+            time.sleep(0.5)
+            return super().search(query, top_k)
+
+    for i in range(2):
+        start_worker(SlowEngine(), tmp_path / f"worker-{i}.sock")
+    client = InferenceClient(tmp_path, num_workers=2, config={}, authkey=AUTHKEY, timeout=0.1)
+
+    with pytest.raises(TimeoutError):
+        client.search("asthma")
+    assert calls == ["asthma"]
+    assert all(channel.available and channel.failures == 0 for channel in client.channels)
+
+
+def test_worker_errors_are_raised(client):
+    with pytest.raises(InferenceError):
+        client.search("asthma", top_k=1, unknown_argument=True)
+
+
+def test_no_worker_available(tmp_path):
+    client = InferenceClient(tmp_path, num_workers=1, config={}, authkey=AUTHKEY)
+
+    with pytest.raises(InferenceUnavailable):
+        client.search("asthma")
+
+
+def test_pool_restarts_crashed_worker(tmp_path):
+    """Test that the supervisor restarts a worker whose process died"""
+    pool = InferencePool(1, tmp_path, authkey=AUTHKEY, health_interval=3600, target=echo_worker)
+    pool.start()
+    try:
+        wait_until(lambda: pool.ping(0) is not None)
+        first_pid = pool.processes[0].pid
+        os.kill(first_pid, signal.SIGKILL)
+        pool.processes[0].join(timeout=10)
+
+        pool.check()
+
+        wait_until(lambda: pool.ping(0) is not None)
+        assert pool.restarts[0] == 1
+        assert call_worker(pool.paths[0], AUTHKEY, 'search', 'ping?')[0] == [{'doc_id': 'ping?'}]
+        assert call_worker(pool.paths[0], AUTHKEY, 'ping')['pid'] != first_pid
+    finally:
+        pool.stop()
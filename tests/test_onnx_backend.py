@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+torch = pytest.importorskip("torch")
+
+from app.services.onnx_backend import (
+    OnnxCrossEncoder,
+    OnnxQueryEncoder,
+    export_cross_encoder,
+    export_query_encoder,
+    min_cosine,
+    parity
+)
+
+TEXTS = [
+    "Diabetes symptoms include thirst, frequent urination and fatigue.",
+    "Glaucoma treatment uses eye drops to lower eye pressure.",
+    "Metformin is a drug used to treat type 2 diabetes.",
+    "Glaucoma is a group of eye diseases damaging the optic nerve.",
+    "Migraine headaches can cause nausea and light sensitivity.",
+]
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted({
+    token for text in TEXTS + ["what is glaucoma", "how to treat diabetes", "damages the optic nerve"]
+    for token in text.lower().replace('.', ' ').replace(',', ' ').split()
+})
+
+PAIRS = [(query, text) for query in ("how to treat diabetes", "what is glaucoma")
+         for text in TEXTS]
+
+
+def make_tokenizer(tmp_path):
+    from transformers import BertTokenizer
+
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB))
+    try:  # transformers >= 5 builds the vocabulary from a dict
+        return BertTokenizer(vocab={token: i for i, token in enumerate(VOCAB)})
+    except TypeError:
+        return BertTokenizer(vocab_file=str(vocab_file))
+
+
+@pytest.fixture(scope="module")
+def tiny_cross_encoder(tmp_path_factory):
+    """Randomly initialised 2-layer BERT cross-encoder saved to disk"""
+    from transformers import BertForSequenceClassification
+
+    directory = tmp_path_factory.mktemp("cross_encoder")
+    torch.manual_seed(0)
+    config = tiny_bert_config()
+    config.num_labels = 1
+    BertForSequenceClassification(config).save_pretrained(str(directory))
+    make_tokenizer(directory).save_pretrained(str(directory))
+    return directory
+
+
+def tiny_bert_config():
+    from transformers import BertConfig
+
+    return BertConfig(
+        vocab_size=len(VOCAB), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=128
+    )
+
+
+@pytest.fixture(scope="module")
+def exported(tiny_cross_encoder, tmp_path_factory):
+    output_dir = tmp_path_factory.mktemp("onnx") / "cross_encoder"
+    return export_cross_encoder(str(tiny_cross_encoder), output_dir, quantized=True)
+
+
+@pytest.fixture(scope="module")
+def reference_scores(tiny_cross_encoder):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(str(tiny_cross_encoder)).predict(PAIRS)
+
+
+def test_onnx_matches_torch(exported, reference_scores):
+    scores = OnnxCrossEncoder(exported, quantized=False).predict(PAIRS, batch_size=5)
+
+    assert scores.shape == (len(PAIRS),)
+    assert parity(reference_scores, scores)['max_abs_diff'] < 1e-4
+
+
+def test_quantized_onnx_close_to_torch(exported, reference_scores):
+    scores = OnnxCrossEncoder(exported, quantized=True).predict(PAIRS)
+
+    agreement = parity(reference_scores, scores, top_k=5)
+    assert agreement['max_abs_diff'] < 0.05
+    assert agreement['pearson'] > 0.9
+
+
+def test_predict_empty(exported):
+    assert OnnxCrossEncoder(exported).predict([]).shape == (0,)
+
+
+def test_parity_metrics():
+    reference = np.array([0.9, 0.1, 0.5, 0.3])
+
+    agreement = parity(reference, reference + 0.01, top_k=2)
+
+    assert agreement['max_abs_diff'] == pytest.approx(0.01)
+    assert agreement['pearson'] == pytest.approx(1.0)
+    assert agreement['top2_overlap'] == 1.0
+
+
+@pytest.fixture(scope="module")
+def tiny_sentence_transformer(tmp_path_factory):
+    """Randomly initialised 2-layer BERT with mean pooling + normalization"""
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertModel
+
+    bert_dir = tmp_path_factory.mktemp("bert")
+    torch.manual_seed(0)
+    BertModel(tiny_bert_config()).save_pretrained(str(bert_dir))
+    make_tokenizer(bert_dir).save_pretrained(str(bert_dir))
+
+    directory = tmp_path_factory.mktemp("encoder")
+    SentenceTransformer(modules=[
+        models.Transformer(str(bert_dir)), models.Pooling(32, 'mean'), models.Normalize()
+    ]).save(str(directory))
+    return directory
+
+
+def test_onnx_query_encoder_matches_sentence_transformer(tiny_sentence_transformer, tmp_path):
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = export_query_encoder(str(tiny_sentence_transformer), tmp_path / "encoder")
+    queries = ["how to treat diabetes", "what is glaucoma", TEXTS[0]]
+    reference = SentenceTransformer(str(tiny_sentence_transformer)).encode(queries, normalize_embeddings=True)
+
+    embeddings = OnnxQueryEncoder(output_dir, quantized=False).encode(queries, batch_size=2)
+
+    assert embeddings.shape == reference.shape
+    assert embeddings.dtype == np.float32
+    assert min_cosine(reference, embeddings) >= 0.999
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+    # Padding in a batch does not change a query's embedding
+    single = OnnxQueryEncoder(output_dir, quantized=False).encode(queries[:1])
+    assert min_cosine(single, embeddings[:1]) >= 0.9999
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.passages import PassageStore, split_passages
+
+
+def test_split_passages_overlap():
+    """Test that windows overlap and cover long texts, short texts stay whole"""
+    long_text = ' '.join(f"w{i}" for i in range(25))
+    passages, doc_rows = split_passages(["short text", long_text], passage_words=10, overlap_words=4)
+
+    assert passages[0] == "short text"
+    assert passages[1].split()[0] == "w0" and passages[-1].split()[-1] == "w24"
+    assert [p.split()[0] for p in passages[1:]] == ["w0", "w6", "w12", "w18"]
+    assert doc_rows.tolist() == [0, 1, 1, 1, 1]
+
+
+def test_passage_store_roundtrip(tmp_path):
+    store = PassageStore.build(["a b c d e f", "g h", "i j k l"], passage_words=3, overlap_words=1)
+    store.save(tmp_path)
+    loaded = PassageStore.load(tmp_path, mmap_mode='r')
+
+    assert len(loaded) == len(store)
+    assert [loaded.texts[i] for i in range(len(loaded))] == [store.texts[i] for i in range(len(store))]
+    assert loaded.passages_of(1).tolist() == [3]
+    assert loaded.doc_offsets.tolist() == [0, 3, 4, 6]
+
+
+def test_aggregate_max_and_sum():
+    """Test document scores from passage hits, with the best passage of each"""
+    store = PassageStore(np.array([0, 0, 0, 1, 2]), texts=None)
+    scores = np.array([[0.9, 0.8, 0.7, 0.6, 0.1]], dtype=np.float32)
+    rows = np.array([[3, 0, 1, 2, -1]])
+
+    doc_scores, doc_rows, best = store.aggregate(scores, rows, k=3, method='max')
+    assert doc_rows[0].tolist() == [1, 0, -1]
+    assert np.allclose(doc_scores[0, :2], [0.9, 0.8])
+    assert best[0].tolist() == [3, 0, -1]
+
+    doc_scores, doc_rows, best = store.aggregate(scores, rows, k=3, method='sum')
+    assert doc_rows[0].tolist() == [0, 1, -1]
+    assert np.isclose(doc_scores[0, 0], 0.8 + 0.7 + 0.6)
+    assert best[0].tolist() == [0, 3, -1]
+
+
+def test_best_passages_exact():
+    store = PassageStore(np.array([0, 0, 1, 1, 1]), texts=None)
+    vectors = np.eye(5, dtype=np.float32)
+    query = np.array([0.1, 0.5, 0.2, 0.0, 0.9], dtype=np.float32)
+
+    scores, passage_rows = store.best_passages(vectors, np.array([1, 0]), query)
+    assert passage_rows.tolist() == [4, 1]
+    assert np.allclose(scores, [0.9, 0.5])
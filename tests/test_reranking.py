@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.services.reranking import RerankCalibrator
+
+
+class FixedBound:
+    """Calibrator stub returning a constant bound"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def observe(self, scores, rerank_scores):
+        pass
+
+    def bound(self, first_score, last_score):
+        return self.value
+
+
+@pytest.fixture
+def engine(loaded_engine):
+    loaded_engine.search_config = {'reranking_top_k': 4, 'reranking_max_depth': 8, 'rerank_batch_size': 2}
+    return loaded_engine
+
+
+def test_calibrator_bound():
+    """Test that the fitted bound covers the observed pairs"""
+    rng = np.random.default_rng(0)
+    scores = rng.uniform(0, 1, 1000)
+    rerank_scores = 10 * scores - 3 + rng.normal(0, 0.5, 1000)
+    calibrator = RerankCalibrator(min_samples=500, quantile=0.99)
+
+    assert calibrator.bound(1.0, 0.0) is None
+    calibrator.observe(scores, rerank_scores)
+
+    assert calibrator.ready
+    assert calibrator.bound(0.5, 0.5) == pytest.approx(2.0 + 2.33 * 0.5, abs=0.4)
+    assert calibrator.bound(0.9, 0.1) > calibrator.bound(0.1, 0.1)
+
+
+def test_fixed_depth_until_calibrated(engine):
+    """Test that reranking_top_k candidates are scored while uncalibrated"""
+    stats = {}
+    engine.search("glaucoma eye drops", top_k=2, stats=stats)
+
+    assert stats['pairs_scored'] == 4
+    assert stats['early_exit'] is False
+
+
+def test_early_exit(engine):
+    """Test that a bound below the k-th score stops after top_k candidates"""
+    engine.rerank_calibrators[False] = FixedBound(-np.inf)
+    stats = {}
+    results, _ = engine.search("glaucoma eye drops", top_k=2, stats=stats)
+
+    assert stats['pairs_scored'] == 2
+    assert stats['early_exit'] is True
+    assert len(results) == 2
+
+
+def test_ambiguous_query_goes_deeper(engine):
+    """Test that a loose bound reranks up to reranking_max_depth"""
+    engine.rerank_calibrators[False] = FixedBound(np.inf)
+    stats = {}
+    engine.search("glaucoma eye drops", top_k=2, stats=stats)
+
+    assert stats['pairs_scored'] == 8
+
+
+def test_latency_budget(engine):
+    """Test that an exhausted budget stops after the first round"""
+    engine.rerank_calibrators[False] = FixedBound(np.inf)
+    stats = {}
+    results, _ = engine.search("glaucoma eye drops", top_k=3, rerank_budget_ms=1e-6, stats=stats)
+
+    assert stats['pairs_scored'] == 2
+    assert len(results) == 3
+    assert 'rerank_score' not in results[2]
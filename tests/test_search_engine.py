@@ -37,3 +37,158 @@ def test_compute_metrics(search_engine):
     """Test metrics computation"""
     # Implement based on your setup
     pass
+
+def test_search_batch(loaded_engine):
+    """Test batched search: one encode and one rerank call for all queries"""
+    queries = ["glaucoma eye drops", "diabetes drug metformin", "asthma wheezing"]
+    batch_results, timings = loaded_engine.search_batch(queries, top_k=2)
+
+    assert [results[0]['doc_id'] for results in batch_results] == ['1', '2', '3']
+    assert all(len(results) == 2 for results in batch_results)
+    assert loaded_engine.encoder.calls == 2  # corpus + queries
+    assert loaded_engine.cross_encoder.calls == 1
+    assert set(timings) >= {'encode', 'search', 'fetch', 'rerank', 'total'}
+
+def test_search_with_micro_batching(loaded_engine):
+    """Test that concurrent searches share encoder / cross-encoder calls"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services.batching import MicroBatcher
+
+    loaded_engine.encode_batcher = MicroBatcher(
+        lambda texts: loaded_engine.encoder.encode(texts), max_wait_ms=50)
+    loaded_engine.rerank_batcher = MicroBatcher(
+        lambda pairs: loaded_engine.cross_encoder.predict(pairs), max_wait_ms=50)
+    loaded_engine.search_config = {'reranking_top_k': 3, 'reranking_max_depth': 3}
+    queries = ["glaucoma eye drops", "diabetes drug metformin", "asthma wheezing", "migraine nausea"]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        results = list(pool.map(lambda q: loaded_engine.search(q, top_k=1)[0], queries))
+
+    assert [r[0]['doc_id'] for r in results] == ['1', '2', '3', '7']
+    assert loaded_engine.encoder.calls < 1 + len(queries)
+    assert loaded_engine.cross_encoder.calls < len(queries)
+    assert loaded_engine.batching_stats()['rerank']['requests'] == len(queries)
+
+def test_search_cancelled(loaded_engine):
+    """Test that a set cancel_event stops the search"""
+    import threading
+
+    from app.services.search_engine import SearchCancelled
+
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    with pytest.raises(SearchCancelled):
+        loaded_engine.search("glaucoma", top_k=2, cancel_event=cancel_event)
+    assert loaded_engine.cross_encoder.calls == 0
+
+def test_staged_loading_serves_dense_search_first(loaded_engine, tmp_path, monkeypatch):
+    """Test that dense search works while the cross-encoder is still loading"""
+    import threading
+
+    from app.services.index_factory import write_index, write_index_version
+
+    write_index(loaded_engine.index, str(tmp_path / "index.faiss"))
+    write_index_version(tmp_path)
+    loaded_engine.doc_store.save(tmp_path / "docstore")
+    FakeEncoder, FakeCrossEncoder = type(loaded_engine.encoder), type(loaded_engine.cross_encoder)
+
+    release = threading.Event()
+    cross_encoder = FakeCrossEncoder()
+
+    def slow_cross_encoder():
+        release.wait(10)
+        return cross_encoder
+
+    engine = SemanticSearchEngine()
+    engine.models_dir = tmp_path
+    monkeypatch.setattr(engine, "_load_encoder", FakeEncoder)
+    monkeypatch.setattr(engine, "_load_cross_encoder", slow_cross_encoder)
+
+    futures = engine.start_loading()
+    for future in futures[:3]:
+        future.result(timeout=10)
+
+    assert engine.readiness()['dense_search'] and not engine.readiness()['reranking']
+    stats = {}
+    results, _ = engine.search("glaucoma eye drops", top_k=2, stats=stats)
+    assert results[0]['doc_id'] == '1' and stats['reranked'] is False
+    assert engine.encoder.calls == 2  # warmup + query
+
+    release.set()
+    futures[3].result(timeout=10)
+    engine.search("glaucoma eye drops", top_k=2, stats=stats)
+    assert stats['reranked'] is True
+    assert cross_encoder.calls == 2  # warmup + query
+    startup = engine.startup_stats()
+    assert set(startup['ready_after_seconds']) == {'encoder', 'index', 'documents', 'cross_encoder'}
+    assert startup['first_query_after_seconds'] is not None
+
+@pytest.mark.parametrize("exact_max_rows", [4096, 0])
+def test_filtered_search_returns_full_top_k(loaded_engine, exact_max_rows):
+    """Test that filters apply inside the first stage (exact scan or FAISS selector)"""
+    loaded_engine.search_config['filter_exact_max_rows'] = exact_max_rows
+    filters = {'include': {'source': ['NIDDK', 'NHLBI']}, 'exclude': {'focus_area': ['Asthma']}}
+
+    results, _ = loaded_engine.search("glaucoma eye drops", top_k=4, use_reranking=False, filters=filters)
+
+    assert sorted(r['doc_id'] for r in results) == ['0', '2', '4', '6']
+    assert all(r['source'] in ('NIDDK', 'NHLBI') and r['focus_area'] != 'Asthma' for r in results)
+
+def test_filtered_search_on_hnsw_index(loaded_engine):
+    """Test that a narrow filter on an HNSW index still fills the top-k"""
+    import faiss
+
+    from app.services.vector_store import VectorStore
+
+    embeddings = loaded_engine.vectors.get(np.arange(len(loaded_engine.doc_store)))
+    loaded_engine.index = faiss.IndexHNSWFlat(embeddings.shape[1], 4, faiss.METRIC_INNER_PRODUCT)
+    loaded_engine.index.add(embeddings)
+    loaded_engine.vectors = VectorStore.from_index(loaded_engine.index)
+    loaded_engine.search_config['filter_exact_max_rows'] = 0
+
+    batch_results, timings = loaded_engine.search_batch(
+        ["diabetes", "migraine"], top_k=3, filters={'doc_id_ranges': [(4, 7)]}
+    )
+
+    assert all({r['doc_id'] for r in results} <= {'4', '5', '6', '7'} for results in batch_results)
+    assert all(len(results) == 3 for results in batch_results)
+    assert 'filter' in timings
+
+def test_filtered_hybrid_search(loaded_engine):
+    from app.services.sparse_index import BM25Index
+
+    loaded_engine.sparse_index = BM25Index.build(loaded_engine.doc_store.texts)
+    results, _ = loaded_engine.search(
+        "glaucoma", top_k=3, use_reranking=False, hybrid=True,
+        filters={'exclude': {'focus_area': ['Glaucoma']}}
+    )
+
+    assert len(results) == 3
+    assert all(r['focus_area'] != 'Glaucoma' for r in results)
+
+def test_passage_search_reranks_best_passage(passage_engine):
+    """Test that passage hits come back as distinct documents with their best passage"""
+    results, _ = passage_engine.search("eye drops pressure", top_k=3)
+
+    assert results[0]['doc_id'] == '1'
+    assert len({r['doc_id'] for r in results}) == 3
+    assert all(r['passage'] in r['text'] and len(r['passage'].split()) <= 4 for r in results)
+    assert results[0]['passage'] == "lower eye pressure."
+    assert all(key[3] is not None for key in passage_engine.rerank_cache._data)
+
+def test_passage_search_hybrid_filters_and_similar(passage_engine):
+    from app.services.sparse_index import BM25Index
+
+    passage_engine.sparse_index = BM25Index.build(passage_engine.doc_store.texts)
+    results, _ = passage_engine.search(
+        "diabetes", top_k=2, use_reranking=False, hybrid=True,
+        filters={'exclude': {'source': ['NIDDK']}}
+    )
+    assert len(results) == 2
+    assert all(r['source'] != 'NIDDK' and r['passage'] in r['text'] for r in results)
+
+    similar = passage_engine.similar_documents('1', top_k=2)
+    assert similar[0]['doc_id'] == '5'
+    assert all(r['doc_id'] != '1' for r in similar)
@@ -0,0 +1,152 @@
+import sys
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.filters import FilterSelection
+from app.services.index_updates import IndexUpdater
+from app.services.search_engine import SemanticSearchEngine
+from app.services.sharding import SHARDS_DIR, ShardedIndex, merge_top_k, shard_offsets
+from app.services.snapshots import publish_snapshot
+
+FLAT = {'index_type': 'IndexFlatIP'}
+
+
+def random_embeddings(n=200, d=32, seed=0):
+    embeddings = np.random.default_rng(seed).standard_normal((n, d)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def flat_search(embeddings, queries, k):
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+    return index.search(queries, k)
+
+
+def test_shard_offsets_cover_all_rows():
+    assert shard_offsets(10, 3).tolist() == [0, 3, 6, 10]
+    assert shard_offsets(2, 4).tolist() == [0, 1, 2]
+
+def test_merge_top_k_keeps_global_order():
+    first = (np.array([[0.9, 0.5, 0.1]], dtype='float32'), np.array([[0, 1, 2]]))
+    second = (np.array([[0.8, 0.7, -np.inf]], dtype='float32'), np.array([[10, 11, -1]]))
+    distances, indices = merge_top_k([first, second], 4)
+    assert indices.tolist() == [[0, 10, 11, 1]]
+    assert np.allclose(distances, [[0.9, 0.8, 0.7, 0.5]])
+
+    distances, indices = merge_top_k([second], 4)
+    assert indices.tolist() == [[10, 11, -1, -1]]
+
+def test_sharded_search_matches_flat_search():
+    embeddings = random_embeddings()
+    queries = random_embeddings(5, seed=1)
+    index = ShardedIndex.build(embeddings, FLAT, num_shards=3)
+    try:
+        timings = {}
+        distances, indices = index.search(queries, 10, timings=timings)
+        expected_distances, expected_indices = flat_search(embeddings, queries, 10)
+        assert indices.tolist() == expected_indices.tolist()
+        assert np.allclose(distances, expected_distances, atol=1e-5)
+        assert set(timings) == {'search_shard0', 'search_shard1', 'search_shard2'}
+
+        stats = index.stats()
+        assert [s['rows'] for s in stats] == [66, 67, 67]
+        assert all(s['searches'] == 1 for s in stats) and sum(s['slowest'] for s in stats) == 1
+    finally:
+        index.close()
+
+def test_filtered_search_skips_shards_without_allowed_rows():
+    embeddings = random_embeddings()
+    index = ShardedIndex.build(embeddings, FLAT, num_shards=4)
+    mask = np.zeros(len(embeddings), dtype=bool)
+    mask[120:140] = True
+    try:
+        timings = {}
+        _, indices = index.search(embeddings[:2], 5, selection=FilterSelection(mask), timings=timings)
+        assert set(timings) == {'search_shard2'}
+        assert all(120 <= row < 140 for row in indices.ravel())
+        assert [s['searches'] for s in index.stats()] == [0, 0, 1, 0]
+    finally:
+        index.close()
+
+def test_save_load_round_trip(tmp_path):
+    embeddings = random_embeddings()
+    queries = random_embeddings(3, seed=2)
+    built = ShardedIndex.build(embeddings, FLAT, num_shards=2)
+    built.save(tmp_path / SHARDS_DIR)
+    loaded = ShardedIndex.load(tmp_path / SHARDS_DIR, FLAT, mmap=True)
+    try:
+        assert ShardedIndex.exists(tmp_path / SHARDS_DIR)
+        assert loaded.ntotal == len(embeddings) and loaded.d == embeddings.shape[1]
+        assert loaded.search(queries, 5)[1].tolist() == built.search(queries, 5)[1].tolist()
+    finally:
+        built.close()
+        loaded.close()
+
+def test_process_shards(tmp_path):
+    """Test that shards served by worker processes return the same hits"""
+    embeddings = random_embeddings()
+    queries = random_embeddings(3, seed=3)
+    built = ShardedIndex.build(embeddings, FLAT, num_shards=2)
+    built.save(tmp_path / SHARDS_DIR)
+    loaded = ShardedIndex.load(tmp_path / SHARDS_DIR, FLAT, executor='processes')
+    try:
+        assert loaded.search(queries, 5)[1].tolist() == flat_search(embeddings, queries, 5)[1].tolist()
+    finally:
+        built.close()
+        loaded.close()
+    assert not any(shard.process.is_alive() for shard in loaded.shards)
+
+
+@pytest.fixture
+def sharded_engine(loaded_engine, corpus, tmp_path, monkeypatch):
+    """Engine loaded from a snapshot holding the corpus in 3 shards"""
+    encoder = loaded_engine.encoder
+    embeddings = encoder.encode(corpus['text'].tolist())
+
+    def write(directory):
+        index = ShardedIndex.build(embeddings, FLAT, num_shards=3)
+        index.save(directory / SHARDS_DIR)
+        index.close()
+        np.save(directory / "embeddings.npy", embeddings)
+        DocumentStore.from_dataframe(corpus).save(directory / "docstore")
+
+    publish_snapshot(tmp_path, write)
+    engine = SemanticSearchEngine()
+    engine.models_dir = tmp_path
+    engine.data_dir = tmp_path / "data"
+    monkeypatch.setattr(engine, "_load_encoder", type(encoder))
+    engine.load(stages=('encoder', 'index', 'documents'))
+    yield engine
+    engine.index.close()
+
+
+def test_engine_searches_shards(sharded_engine, loaded_engine):
+    engine = sharded_engine
+    assert isinstance(engine.index, ShardedIndex) and len(engine.index.shards) == 3
+
+    for query in ("glaucoma eye drops", "insulin diabetes", "blood pressure"):
+        results, _ = engine.search(query, top_k=5, use_reranking=False)
+        expected, _ = loaded_engine.search(query, top_k=5, use_reranking=False)
+        # Zero-score documents tie: only the matching ones have a defined order
+        assert [r['doc_id'] for r in results if r['score'] > 0] == [r['doc_id'] for r in expected if r['score'] > 0]
+
+    _, timings = engine.search_batch(["migraine nausea"], top_k=3, use_reranking=False)
+    assert {'search_shard0', 'search_shard1', 'search_shard2'} <= set(timings)
+    assert [s['rows'] for s in engine.shard_stats()] == [2, 3, 3]
+    assert loaded_engine.shard_stats() is None
+
+def test_updater_deletes_but_refuses_upserts_on_shards(sharded_engine):
+    updater = IndexUpdater(sharded_engine, publish_delay=0)
+    with pytest.raises(RuntimeError, match="rebuild"):
+        updater.upsert([{'doc_id': '8', 'text': "Cataract surgery replaces the lens."}])
+
+    assert updater.delete(['5'])['deleted'] == 1
+    results, _ = sharded_engine.search("glaucoma optic nerve", top_k=3, use_reranking=False)
+    assert '5' not in [r['doc_id'] for r in results]
+    assert ShardedIndex.exists(sharded_engine.index_dir / SHARDS_DIR)
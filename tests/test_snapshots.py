@@ -0,0 +1,145 @@
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import faiss
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from app.services.document_store import DocumentStore
+from app.services.index_factory import write_index
+from app.services.search_engine import SemanticSearchEngine
+from app.services.snapshots import (
+    LOCK_FILE,
+    SNAPSHOTS_DIR,
+    SnapshotConflict,
+    WriterLock,
+    active_dir,
+    current_version,
+    publish_snapshot,
+    snapshot_dir,
+    verify_snapshot
+)
+
+
+def write_corpus(corpus, encoder):
+    """Snapshot writer for a corpus indexed with ``encoder``"""
+    def write(directory):
+        index = faiss.IndexFlatIP(384)
+        index.add(encoder.encode(corpus['text'].tolist()))
+        write_index(index, str(directory / "index.faiss"))
+        DocumentStore.from_dataframe(corpus).save(directory / "docstore")
+        return {'num_documents': len(corpus)}
+    return write
+
+
+@pytest.fixture
+def snapshot_engine(loaded_engine, corpus, tmp_path, monkeypatch):
+    """Engine loaded from the first snapshot of tmp_path"""
+    encoder = loaded_engine.encoder
+    publish_snapshot(tmp_path, write_corpus(corpus, encoder), version="20240101T000000Z-a")
+
+    engine = SemanticSearchEngine()
+    engine.models_dir = tmp_path
+    monkeypatch.setattr(engine, "_load_encoder", type(encoder))
+    engine.load(stages=('encoder', 'index', 'documents'))
+    return engine
+
+
+def test_publish_verify_and_prune(corpus, loaded_engine, tmp_path):
+    write = write_corpus(corpus, loaded_engine.encoder)
+    versions = [publish_snapshot(tmp_path, write, keep=2) for _ in range(3)]
+
+    assert current_version(tmp_path) == versions[-1]
+    assert active_dir(tmp_path) == snapshot_dir(tmp_path, versions[-1])
+    assert sorted(p.name for p in (tmp_path / SNAPSHOTS_DIR).iterdir()) == versions[1:]
+    manifest = verify_snapshot(active_dir(tmp_path))
+    assert manifest['version'] == versions[-1] and manifest['num_documents'] == 8
+    assert {'index.faiss', 'index_version', 'docstore/manifest.json'} <= set(manifest['files'])
+
+    with open(active_dir(tmp_path) / "index.faiss", 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ValueError, match="index.faiss"):
+        verify_snapshot(active_dir(tmp_path))
+
+def test_failed_write_keeps_current_snapshot(corpus, loaded_engine, tmp_path):
+    version = publish_snapshot(tmp_path, write_corpus(corpus, loaded_engine.encoder))
+
+    def broken(directory):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        publish_snapshot(tmp_path, broken)
+    assert current_version(tmp_path) == version
+    assert [p.name for p in (tmp_path / SNAPSHOTS_DIR).iterdir()] == [version]
+
+def test_publish_checks_the_base_version(corpus, loaded_engine, tmp_path):
+    """Test that a snapshot built from a replaced version is not published"""
+    write = write_corpus(corpus, loaded_engine.encoder)
+    first = publish_snapshot(tmp_path, write, expected_current=None)
+    second = publish_snapshot(tmp_path, write, expected_current=first)
+
+    with pytest.raises(SnapshotConflict):
+        publish_snapshot(tmp_path, write, expected_current=first)
+    assert current_version(tmp_path) == second
+    assert sorted(p.name for p in (tmp_path / SNAPSHOTS_DIR).iterdir()) == [first, second]
+
+def test_writer_lock_excludes_other_processes(tmp_path):
+    try_lock = (
+        "import fcntl, sys; f = open(sys.argv[1], 'a')\n"
+        "try:\n    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)\nexcept BlockingIOError:\n    sys.exit(1)"
+    )
+    with WriterLock(tmp_path):
+        with WriterLock(tmp_path):  # re-entrant in this process
+            pass
+        assert subprocess.run([sys.executable, "-c", try_lock, str(tmp_path / LOCK_FILE)]).returncode == 1
+    assert subprocess.run([sys.executable, "-c", try_lock, str(tmp_path / LOCK_FILE)]).returncode == 0
+
+def test_hot_reload_waits_for_in_flight_searches(snapshot_engine, corpus):
+    """Test that a new snapshot is swapped in only once running searches are done"""
+    engine = snapshot_engine
+    assert engine.snapshot_info()['version'] == "20240101T000000Z-a"
+    assert not engine.reload_snapshot()
+
+    corpus.loc[1, 'text'] = "Cataract surgery replaces the clouded lens."
+    version = publish_snapshot(engine.models_dir, write_corpus(corpus, engine.encoder))
+    assert engine.snapshot_info()['current'] == version
+
+    reloaded = threading.Event()
+    with engine.components_lock.read():  # a search in flight
+        thread = threading.Thread(target=lambda: engine.reload_snapshot() and reloaded.set())
+        thread.start()
+        assert not reloaded.wait(0.2)
+        assert engine.index_version == "20240101T000000Z-a"
+    thread.join(10)
+
+    assert reloaded.is_set() and engine.index_version == version
+    results, _ = engine.search("cataract lens", top_k=1, use_reranking=False)
+    assert results[0]['doc_id'] == '1' and 'Cataract' in results[0]['text']
+    assert engine.snapshot_info()['directory'] == str(snapshot_dir(engine.models_dir, version))
+
+def test_corrupt_snapshot_is_not_swapped_in(snapshot_engine, corpus):
+    engine = snapshot_engine
+    version = publish_snapshot(engine.models_dir, write_corpus(corpus, engine.encoder))
+    (snapshot_dir(engine.models_dir, version) / "index.faiss").write_bytes(b'corrupt')
+
+    assert not engine.reload_snapshot()
+    assert engine.index_version == "20240101T000000Z-a"
+    assert version in engine.snapshot_info()['error']
+    results, _ = engine.search("glaucoma", top_k=1, use_reranking=False)
+    assert results[0]['doc_id'] in ('1', '5')
+
+def test_watcher_reloads_in_background(snapshot_engine, corpus):
+    engine = snapshot_engine
+    engine.watch_snapshots(interval=0.05)
+    version = publish_snapshot(engine.models_dir, write_corpus(corpus.iloc[:4], engine.encoder))
+    try:
+        for _ in range(100):
+            if engine.index_version == version:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        engine.stop_watching()
+    assert engine.index_version == version and len(engine.doc_store) == 4
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from app.services.sparse_index import BM25Index, reciprocal_rank_fusion, tokenize, weighted_fusion
+
+
+@pytest.fixture
+def bm25(corpus):
+    return BM25Index.build(corpus['text'].tolist())
+
+
+def test_rare_term_ranks_first(bm25):
+    """Test that a drug name found in one document ranks it first"""
+    scores, rows = bm25.search(["metformin dosage"], k=3)
+
+    assert rows[0, 0] == 2
+    assert scores[0, 0] > 0
+    assert rows[0, 1] == -1  # no other document contains the terms
+
+
+def test_idf_weighting(bm25):
+    """Test that frequent terms weigh less than rare ones"""
+    scores = bm25.scores("diabetes asthma")
+
+    assert scores[3] > scores[0]  # 'asthma' appears once, 'diabetes' three times
+
+
+def test_save_and_load(bm25, tmp_path):
+    bm25.save(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25", mmap_mode='r')
+
+    np.testing.assert_allclose(loaded.scores("glaucoma eye"), bm25.scores("glaucoma eye"))
+    assert loaded.scores("unknownterm").sum() == 0
+
+
+def test_extend_adds_a_delta_segment(corpus, tmp_path):
+    """Test that appended documents are searchable without rebuilding the main segment"""
+    texts = corpus['text'].tolist()
+    bm25 = BM25Index.build(texts[:6])
+    extended = bm25.extend(texts[6:7]).extend(texts[7:])
+
+    assert extended.num_docs == 8 and extended.indptr is bm25.indptr
+    assert extended.search(["migraine nausea"], k=1)[1][0, 0] == 7
+    assert extended.search(["insulin"], k=1)[1][0, 0] == 6
+    np.testing.assert_allclose(extended.scores("glaucoma eye")[:6], bm25.scores("glaucoma eye"))
+    full = BM25Index.build(texts)
+    # Same idf as a full build; only the average length is the build's
+    np.testing.assert_allclose(extended.scores("migraine")[7], full.scores("migraine")[7], rtol=0.05)
+
+    extended.save(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25", mmap_mode='r')
+    np.testing.assert_allclose(loaded.scores("insulin diabetes"), extended.scores("insulin diabetes"))
+
+
+def test_tokenize():
+    assert tokenize("Type-2 Diabetes, HbA1c!") == ['type', '2', 'diabetes', 'hba1c']
+
+
+def test_fusion_functions():
+    dense = np.array([0.9, 0.5, 0.1])
+    sparse = np.array([0.0, 2.0, 4.0])
+
+    assert weighted_fusion(dense, sparse, alpha=1.0).argmax() == 0
+    assert weighted_fusion(dense, sparse, alpha=0.0).argmax() == 2
+    rrf = reciprocal_rank_fusion(dense, sparse, rrf_k=60)
+    assert rrf[1] > rrf[0]  # ranked 2nd in both beats 1st dense only
+
+
+def test_engine_hybrid_search(loaded_engine, corpus):
+    """Test that the hybrid flag fuses BM25 candidates into the results"""
+    loaded_engine.sparse_index = BM25Index.build(corpus['text'].tolist())
+
+    results, _ = loaded_engine.search("metformin", top_k=3, use_reranking=False, hybrid=True)
+    _, timings = loaded_engine.search_batch(["metformin"], top_k=3, hybrid=True)
+
+    assert results[0]['doc_id'] == '2'
+    assert 'sparse' in timings
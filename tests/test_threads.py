@@ -0,0 +1,33 @@
+import faiss
+
+from app.utils import threads
+from app.utils.threads import configure_threads, thread_budget, thread_report
+
+
+def test_thread_budget_fallbacks(monkeypatch):
+    monkeypatch.setattr(threads, "physical_cores", lambda: 8)
+    runtime = {'threads': 2, 'torch_threads': 4, 'processes_per_host': 3}
+
+    assert thread_budget(runtime, 'torch') == 4
+    assert thread_budget(runtime, 'faiss') == 2
+    assert thread_budget({}, 'faiss') is None
+    assert thread_budget({'threads': 'auto', 'processes_per_host': 3}, 'blas') == 2
+    assert thread_budget({'threads': 'auto', 'processes_per_host': 16}, 'blas') == 1
+
+
+def test_configure_threads_sets_faiss_pool():
+    previous = faiss.omp_get_max_threads()
+    try:
+        report = configure_threads({'faiss_threads': 2})
+
+        assert faiss.omp_get_max_threads() == 2
+        assert report['faiss'] == 2
+    finally:
+        faiss.omp_set_num_threads(previous)
+
+
+def test_thread_report_lists_loaded_libraries():
+    report = thread_report()
+
+    assert report['faiss'] >= 1
+    assert 'blas' in report
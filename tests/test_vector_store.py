@@ -0,0 +1,45 @@
+import numpy as np
+
+from app.services.index_factory import build_index
+from app.services.vector_store import VectorStore
+
+
+def test_flat_index_view_is_zero_copy():
+    """Test that flat index vectors are read in place, not copied"""
+    vectors = np.random.default_rng(0).standard_normal((100, 16)).astype('float32')
+    index = build_index(vectors, {'index_type': 'IndexFlatIP'})
+
+    store = VectorStore.from_index(index)
+
+    assert store.source == "index"
+    assert not store.matrix.flags.owndata
+    np.testing.assert_array_equal(store.get([3, 7]), vectors[[3, 7]])
+
+
+def test_hnsw_index_view():
+    """Test that HNSW-flat indexes expose their flat storage"""
+    vectors = np.random.default_rng(0).standard_normal((100, 16)).astype('float32')
+    index = build_index(vectors, {'index_type': 'IndexHNSWFlat'})
+
+    np.testing.assert_array_equal(VectorStore.from_index(index).matrix, vectors)
+
+
+def test_ivf_index_needs_embeddings_file(tmp_path):
+    """Test the embeddings.npy fallback for indexes without row-ordered vectors"""
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype('float32')
+    index = build_index(vectors, {'index_type': 'IndexIVFFlat'})
+    np.save(tmp_path / "embeddings.npy", vectors)
+
+    assert VectorStore.from_index(index) is None
+    store = VectorStore.from_file(tmp_path / "embeddings.npy", mmap=True)
+    assert store.source == "mmap"
+    assert len(store) == 2000
+
+
+def test_similar_documents(loaded_engine):
+    """Test similarity lookup from the shared vector store"""
+    results = loaded_engine.similar_documents('1', top_k=2)
+
+    assert [r['doc_id'] for r in results][0] == '5'
+    assert all(r['doc_id'] != '1' for r in results)
+    assert loaded_engine.similar_documents('missing') is None